@@ -1,9 +1,8 @@
-import time
 import threading
 
 from DrissionPage._base.driver import Driver
 
-from LessPageEngineer.Utils.Utils import encode_base64_in_chunks, decode_base64_in_chunks
+from LessPageEngineer.Utils.Utils import encode_base64_str, decode_base64
 
 class RouteDriver(Driver):
     def __init__(self, *args, **kwargs):
@@ -55,11 +54,27 @@ class FuncClass:
         self._driver = driver
         self._timeout = timeout
         self._request_id = requestId
+        # 发送最终命令(continue/abort/fulfill)前调用，返回False时不再发送(该请求已由其他方应答)
+        self.answer_guard = None
+        # 延长处理该请求的截止时间 deadline_extender(seconds)
+        self.deadline_extender = None
+
+    def _may_answer(self):
+        return self.answer_guard is None or self.answer_guard()
+
+    def extend_deadline(self, seconds):
+        """处理该请求需要较长时间时调用，截止时间延长至当前时间后seconds秒"""
+        if self.deadline_extender is not None:
+            self.deadline_extender(seconds)
 
     def continue_(self):
+        if not self._may_answer():
+            return
         self._driver.run('Fetch.continueRequest', requestId=self._request_id, _timeout=self._timeout)
 
     def abort(self):
+        if not self._may_answer():
+            return
         self._driver.run('Fetch.failRequest', requestId=self._request_id, errorReason='ConnectionAborted',
                          _timeout=self._timeout)
 
@@ -83,15 +98,17 @@ class FuncClass:
     # 解析响应体
     def __parse_response_body(self, body, is_base64):
         if not is_base64:
-            if isinstance(body, bytes):
-                body = encode_base64_in_chunks(body).decode()
-            elif isinstance(body, str):
-                body = encode_base64_in_chunks(body.encode()).decode()
+            # memoryview为内存映射的缓存响应体
+            if isinstance(body, (bytes, memoryview, str)):
+                body = encode_base64_str(body)
         return body
 
     def fullfillRequest(self, responseCode: int = None, responseHeaders: dict = {},
                         body: str = None, is_base64=False, **kwargs):
         assert isinstance(responseCode, int), "状态码有误"
+        # 已由其他方应答时返回失败(填充成功时返回{})
+        if not self._may_answer():
+            return {'error': 'expired'}
         body = self.__parse_response_body(body, is_base64)
         response_headers_list = self.__parse_response_headers(responseHeaders)
         result = self._driver.run('Fetch.fulfillRequest', requestId=self._request_id,
@@ -111,6 +128,8 @@ class Request(FuncClass):
         self.__resourceType = resourceType
         self.__networkId = networkId
         self.__post_data = self.__request.get('postData')
+        # RouteHandler中匹配命中的规则下标
+        self.match_indexes = None
 
     @property
     def url(self) -> str:
@@ -155,11 +174,10 @@ class Response(Request):
         self.__origin_response_headers = origin_response_headers
         self.__responseHeaders = responseHeaders
         self.__responseErrorReason = responseErrorReason
+        # 响应体在第一次读取body时获取
+        self.__body = None
         self.__response_done = False
-        t1 = threading.Thread(target=self.__getResponse)
-        t1.setDaemon(True)
-        t1.start()
-        # self.__getResponse()
+        self.__body_lock = threading.Lock()
 
     @property
     def type(self) -> str:
@@ -193,8 +211,10 @@ class Response(Request):
 
     @property
     def body(self):
-        while not self.__response_done:
-            time.sleep(0.1)
+        if not self.__response_done:
+            with self.__body_lock:
+                if not self.__response_done:
+                    self.__getResponse()
         return self.__body
 
     @property
@@ -205,6 +225,7 @@ class Response(Request):
         if self.response_error_reason:
             print("该链接无法进行请求体捕获，将继续请求")
             self.continue_()
+            self.__response_done = True
             return None
         result = self._driver.run('Fetch.getResponseBody', requestId=self._request_id, _timeout=self._timeout)
         if not result.get('body'):
@@ -214,7 +235,7 @@ class Response(Request):
             else:
                 self.__body = None
         elif result.get('base64Encoded') and result.get('base64Encoded') == True:
-            self.__body = decode_base64_in_chunks(result['body'])
+            self.__body = decode_base64(result['body'])
         else:
             self.__body = result['body']
         self.__response_done = True
@@ -44,7 +44,8 @@ class Control:
         # 浏览器创建器
         self.chrome_manger = ChromeCreator(proxy_need=self.PROXY_NEED, local=self.LOCAL, tab_mode=self.TAB_MODE,
                                            cache_proxy=self.cache_proxy, reload_page_flag=self.RELOAD_PAGE,
-                                           settings=self.settings, target_create_callback=self.target_create)
+                                           settings=self.settings, target_create_callback=self.target_create,
+                                           logger=self.logger)
         self.chrome_manger.create_chrome()
         
         # redis缓存上传 - 检查上游控制开关
@@ -54,9 +55,15 @@ class Control:
             self.redis_cache = None
             
         # 数据持久化管理
-        self.data_manger = MongoCache() if not self.settings['READ_LOCAL_FILE'] else PickleHandler(self.settings['LOCAL_FILE_PATH'])
+        gc_grace_time = self.settings.get('BLOB_GC_GRACE_TIME', 3600)
+        store_b64 = self.settings.get('CACHE_STORE_BODY_B64', False)
+        self.data_manger = MongoCache(gc_grace_time=gc_grace_time, store_b64=store_b64) \
+            if not self.settings['READ_LOCAL_FILE'] else \
+            PickleHandler(self.settings['LOCAL_FILE_PATH'], gc_grace_time=gc_grace_time,
+                          mmap_min_size=self.settings.get('LOCAL_MMAP_MIN_SIZE', 256 * 1024), store_b64=store_b64)
         # 运行缓存
-        self.run_time_cache = RunTimeCache(logger=self.logger)
+        self.run_time_cache = RunTimeCache(logger=self.logger,
+                                           max_bytes=self.settings.get('RUNTIME_CACHE_MAX_BYTES'))
         # 开启清理source_dict
         t1 = threading.Thread(target=self.main_threaing_task)
         t1.daemon = True
@@ -70,6 +77,15 @@ class Control:
                                                 logger=self.logger)
             self.runtime_logger.run()
 
+    # 运行状态统计
+    def get_stats(self):
+        return {
+            'tabs': self.chrome_manger.get_tab_metrics(),
+            'standby_tabs': self.chrome_manger.get_standby_metrics(),
+            'browsers': self.chrome_manger.get_browser_metrics(),
+            'run_time_cache': self.run_time_cache.stats(),
+        }
+
     def main_threaing_task(self):
         while True:
             # 清理空闲source_dict
@@ -85,13 +101,15 @@ class Control:
                           logger=self.logger, det=None,
                           run_time_cache=self.run_time_cache, cache_proxy=self.cache_proxy,
                           fetch_show_log=self.fetch_log if self.fetch_log else self.all_show_log,
+                          readiness_interval=self.settings.get('READINESS_FALLBACK_INTERVAL', 0.5),
                           )
         return task
 
     # 处理post_data(如果有init_session情况)
     def handle_init_session_data(self, post_data):
         handle_data_ = post_data
-        if post_data.get('session_id') and self.chrome_manger.check_exist_session_id(post_data['session_id']):
+        # session_id未被标签页保持(新session或已过期)时使用init_session初始化
+        if post_data.get('session_id') and not self.chrome_manger.is_session_bound(post_data['session_id']):
             if not post_data.get('init_session'):
                 return {'status': 'fail', 'message': 'session_id必须配合init_session使用'}
             handle_data_ = post_data['init_session']
@@ -104,7 +122,8 @@ class Control:
         start_time = time.time()
         # 获取空闲浏览器
         chrome_dict = self.chrome_manger.get_free_chrome(task.handle_data.get('timeout'),
-                                                         task.handle_data.get('session_id'))
+                                                         task.handle_data.get('session_id'),
+                                                         task.handle_data.get('url'))
         task.step_spend_time['get_chrome_time'] = round(time.time() - start_time, 3)
         # 超时
         if chrome_dict == None:
@@ -114,6 +133,8 @@ class Control:
     def reload_chrome(self, task, chrome_dict):
         r_l_immediately = chrome_dict['session_id'] and chrome_dict['session_id'] != task.handle_data.get('session_id')
         r_l_immediately = r_l_immediately or task.handle_data['new_context'] != chrome_dict['is_new_context']
+        # 保持的session已过期/释放，清除该session残留的页面状态
+        r_l_immediately = r_l_immediately or chrome_dict.pop('session_released', False)
         # 是否创建新上下文标签页
         self.chrome_manger.reload_chrome(chrome_dict, new_context=task.handle_data['new_context'],
                                          immediately=r_l_immediately)
@@ -162,6 +183,54 @@ class Control:
                 pass
             return {'status': 'fail', 'message': str(e), 'step_spend_time': {}}
 
+    def handle_pipeline(self, post_data, pages):
+        """
+        会话流水线：一个标签页只初始化一次(init_run)，之后按顺序加载pages，每个页面返回一个结果
+
+        :param post_data: 与handle_url一致，url为第一个页面
+        :param pages: 之后的页面列表 [{'url': str, 'script': list}]
+        """
+        task = None
+        chrome_dict = None
+        is_error = False
+        result = {}
+        try:
+            # 初始化任务
+            task = self.init_task(post_data)
+            self.task_list.append(task)
+            # 获取空闲chrome_dict
+            chrome_dict = self.get_free_chrome(task)
+            if not chrome_dict.get('chrome'):
+                yield chrome_dict
+                return
+            # 重启/不重启 chrome
+            self.reload_chrome(task, chrome_dict)
+            chrome = chrome_dict['chrome']
+            task.init_run(chrome=chrome, chrome_session_id=chrome_dict['session_id'])
+            for result in task.run_pages(chrome, pages):
+                yield result
+        except Exception as e:
+            is_error = True
+            self.logger.error(f"流水线加载页面时有误： {e}")
+            yield {'status': 'fail', 'message': str(e), 'step_spend_time': task.step_spend_time if task else {}}
+        finally:
+            # 客户端断开(GeneratorExit)时同样归还标签页
+            if chrome_dict and chrome_dict.get('chrome'):
+                chrome = chrome_dict['chrome']
+                if is_error:
+                    task.fail_reload()
+                    self.chrome_manger.reload_chrome(chrome_dict, immediately=True)
+                elif result.get('status') == 'success' and task.handle_data.get('session_id'):
+                    self.chrome_manger.handle_session_id(chrome_dict, task.handle_data['session_id'])
+                else:
+                    task.get_blank_page()
+                    if chrome.route:
+                        chrome.route.clear_cdp_run_history()
+                # 放入队列
+                self.chrome_manger.put_free_chrome_queue(chrome_dict)
+            if task in self.task_list:
+                self.task_list.remove(task)
+
     # 广播
     def target_create(self, **kwargs):
         if kwargs['targetInfo']['type'] == 'iframe':
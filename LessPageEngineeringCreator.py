@@ -2,14 +2,16 @@ import time
 import threading
 import argparse
 import requests
-import base64
 
 import os
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from waitress import serve
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 
 from LessPageEngineer.CentralControl import Control
 import LessPageEngineer.Settings as base_settings
+from LessPageEngineer.Utils.Utils import encode_base64_str, decode_base64
 
 
 class LessPageEngineeringCreator:
@@ -22,6 +24,7 @@ class LessPageEngineeringCreator:
         self.last_request_time = time.time()
         self.error_continuous = 0
         self.control = None
+        self.asgi_app = None
         self.init_lock = threading.Lock()
         self.chrome_init = False
 
@@ -43,6 +46,18 @@ class LessPageEngineeringCreator:
         def handle_upload():
             return self._handle_upload_request()
 
+        @self.app.route('/uploadUrls', methods=['POST'])
+        def handle_upload_batch():
+            return self._handle_upload_batch_request()
+
+        @self.app.route('/uploadPipeline', methods=['POST'])
+        def handle_upload_pipeline():
+            return self._handle_upload_pipeline_request()
+
+        @self.app.route('/stats', methods=['GET'])
+        def handle_stats():
+            return self._handle_stats()
+
         # ========== 缓存管理路由（统一管理，以 MongoDB/Pickle 为主） ==========
         @self.app.route('/cache', methods=['GET'])
         def cache_manager_ui():
@@ -65,23 +80,163 @@ class LessPageEngineeringCreator:
         def delete_cache(key):
             return self._handle_cache_delete(key)
 
+        @self.app.route('/runtimeCache/<path:key>', methods=['DELETE'])
+        def drop_run_time_cache(key):
+            return self._handle_run_time_cache_drop(key)
+
     def _handle_upload_request(self):
         """处理上传请求的核心逻辑"""
+        result, status_code = self._handle_upload_data(request.get_json(), request.headers.get('X-Real-IP'))
+        return jsonify(result), status_code
+
+    def _handle_upload_data(self, data, real_ip=None):
+        """处理上传请求的数据（与具体的服务模式无关）"""
         self.last_request_time = time.time()
         self._init_chrome()
 
-        data = request.get_json()
         start_time = time.time()
         if self.settings.get('HANDLE_REQUEST_DATA'):
             data = self.settings['HANDLE_REQUEST_DATA'](data)
         try:
-            result = self._process_request_data(data, start_time)
+            result = self._process_request_data(data, start_time, real_ip)
             if self.settings.get('HANDLE_RESPONSE_DATA'):
                 result = self.settings['HANDLE_RESPONSE_DATA'](result)
-            return jsonify(result), 200
+            return result, 200
         except Exception as e:
-            self._handle_request_error(e)
+            self._handle_request_error(e, real_ip)
+            return {'status': 'error', 'message': str(e)}, 400
+
+    def _handle_upload_batch_request(self):
+        """处理批量请求，按完成顺序以NDJSON流式返回每个任务的结果"""
+        try:
+            tasks, concurrency = self._parse_batch_data(request.get_json(silent=True))
+        except ValueError as e:
             return jsonify({'status': 'error', 'message': str(e)}), 400
+        real_ip = request.headers.get('X-Real-IP')
+        lines = (self._dumps_batch_line(line) for line in self._iter_batch_results(tasks, concurrency, real_ip))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    def _parse_batch_data(self, data):
+        """
+        解析批量请求 {'tasks': [...], 'concurrency': int}(也可直接为任务列表)
+
+        :return: (任务列表, 同时处理的任务数量)
+        """
+        if isinstance(data, list):
+            data = {'tasks': data}
+        if not isinstance(data, dict) or not isinstance(data.get('tasks'), list) or not data['tasks']:
+            raise ValueError('tasks必须为非空list')
+        tasks = data['tasks']
+        max_tasks = self.settings.get('BATCH_MAX_TASKS') or 1000
+        if len(tasks) > max_tasks:
+            raise ValueError(f'tasks数量不能超过{max_tasks}')
+        max_concurrent = self.settings.get('BATCH_MAX_CONCURRENT') or self.settings.get('TABS_NUM', 6)
+        concurrency = data.get('concurrency') or max_concurrent
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError('concurrency必须为正整数')
+        return tasks, min(concurrency, max_concurrent, len(tasks))
+
+    def _handle_batch_task(self, task, real_ip=None):
+        """处理批量请求中的单个任务(与 /uploadUrl 一致)"""
+        if not isinstance(task, dict):
+            return {'status': 'error', 'message': '任务必须为dict类型'}, 400
+        try:
+            return self._handle_upload_data(task, real_ip)
+        except Exception as e:
+            # 单个任务出错不影响同批次的其他任务
+            return {'status': 'error', 'message': str(e)}, 500
+
+    @staticmethod
+    def _batch_line(index, result, status_code):
+        """批量请求的单行结果，index为任务在tasks中的下标"""
+        return {'index': index, 'status_code': status_code, 'result': result}
+
+    def _dumps_batch_line(self, line):
+        return self.app.json.dumps(line) + '\n'
+
+    def _iter_batch_results(self, tasks, concurrency, real_ip=None):
+        """同时执行concurrency个任务(标签页由ChromeCreator分配)，按完成顺序返回结果"""
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='upload_batch')
+        futures = {executor.submit(self._handle_batch_task, task, real_ip): index for index, task in enumerate(tasks)}
+        try:
+            for future in as_completed(futures):
+                result, status_code = future.result()
+                yield self._batch_line(futures[future], result, status_code)
+        finally:
+            # 客户端断开时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _handle_upload_pipeline_request(self):
+        """处理流水线请求，按页面顺序以NDJSON流式返回每个页面的结果"""
+        try:
+            post_data, pages = self._parse_pipeline_data(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        real_ip = request.headers.get('X-Real-IP')
+        lines = (self._dumps_batch_line(line) for line in self._iter_pipeline_results(post_data, pages, real_ip))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    def _parse_pipeline_data(self, data):
+        """
+        解析流水线请求：与 /uploadUrl 一致的任务参数 + pages(之后的页面列表)
+
+        :return: (任务参数, 页面列表 [{'url': str, 'script': list}])
+        """
+        if not isinstance(data, dict) or not isinstance(data.get('pages'), list):
+            raise ValueError('pages必须为list')
+        max_pages = self.settings.get('PIPELINE_MAX_PAGES') or 100
+        if len(data['pages']) > max_pages:
+            raise ValueError(f'pages数量不能超过{max_pages}')
+        pages = []
+        for page in data['pages']:
+            # 字符串为页面链接
+            if isinstance(page, str):
+                page = {'url': page}
+            if not isinstance(page, dict) or not (isinstance(page.get('url'), str) or isinstance(page.get('script'), list)):
+                raise ValueError('pages中的页面必须为链接或含有url(str)/script(list)的dict')
+            pages.append(page)
+        post_data = {k: v for k, v in data.items() if k != 'pages'}
+        return post_data, pages
+
+    def _iter_pipeline_results(self, post_data, pages, real_ip=None):
+        """按顺序返回流水线中每个页面的结果，index 0 为url，之后为pages中的下标+1"""
+        self.last_request_time = time.time()
+        self._init_chrome()
+        index = 0
+        try:
+            if self.settings.get('HANDLE_REQUEST_DATA'):
+                post_data = self.settings['HANDLE_REQUEST_DATA'](post_data)
+            start_time = time.time()
+            # 客户端断开时关闭流水线，归还标签页
+            with closing(self.control.handle_pipeline(post_data, pages)) as results:
+                for result in results:
+                    self.last_request_time = time.time()
+                    self.control.runtime_logger.add_recent_request_spend(
+                        post_data=post_data,
+                        spend_time=time.time() - start_time,
+                        status=result.get('status'),
+                        step_spend_time=result.get('step_spend_time')
+                    )
+                    self.error_continuous = 0 if result.get('status') == 'success' else self.error_continuous + 1
+                    if self.settings.get('HANDLE_RESPONSE_DATA'):
+                        result = self.settings['HANDLE_RESPONSE_DATA'](result)
+                    yield self._batch_line(index, result, 200)
+                    index += 1
+                    start_time = time.time()
+        except Exception as e:
+            self._handle_request_error(e, real_ip)
+            yield self._batch_line(index, {'status': 'error', 'message': str(e)}, 400)
+
+    def _handle_stats(self):
+        """返回运行状态统计（标签页排队深度、等待耗时等）"""
+        if self.control is None:
+            return jsonify({'status': 'fail', 'message': '浏览器尚未初始化'}), 400
+        stats = self.control.get_stats()
+        if self.asgi_app:
+            stats['asgi'] = self.asgi_app.stats
+        return jsonify({'status': 'success', 'data': stats}), 200
 
     def _init_chrome(self):
         """初始化浏览器控制实例"""
@@ -96,7 +251,7 @@ class LessPageEngineeringCreator:
                     )
                     self.chrome_init = True
 
-    def _process_request_data(self, data, start_time):
+    def _process_request_data(self, data, start_time, real_ip=None):
         """处理请求数据并记录日志"""
         html_json = self.control.handle_url(data)
 
@@ -110,23 +265,23 @@ class LessPageEngineeringCreator:
 
         # 根据状态记录不同日志
         log_method = self.control.logger.success if html_json['status'] == 'success' else self.control.logger.error
-        log_message = self._build_log_message(data, start_time, html_json)
+        log_message = self._build_log_message(data, start_time, html_json, real_ip)
         # log_method(log_message)
 
         self.error_continuous = 0 if html_json['status'] == 'success' else self.error_continuous + 1
         return html_json
 
-    def _build_log_message(self, data, start_time, html_json):
+    def _build_log_message(self, data, start_time, html_json, real_ip=None):
         """构建标准化日志消息"""
-        base_info = f"{request.headers.get('X-Real-IP')}耗时：{round(time.time() - start_time, 3)}"
+        base_info = f"{real_ip}耗时：{round(time.time() - start_time, 3)}"
         session_info = f"session:{'Yes' if data.get('session_id') else 'No'}"
         url = data.get('url') or data.get('init_session', {}).get('url', '')
         step_info = f"步骤耗时:{html_json.get('step_spend_time')}" if self.settings['SHOW_STEP_SPEND'] else ''
         return f"{base_info}, {session_info} 链接：{url} {step_info}".strip()
 
-    def _handle_request_error(self, error):
+    def _handle_request_error(self, error, real_ip=None):
         """处理请求错误"""
-        self.control.logger.error(f"{request.headers.get('X-Real-IP')}: {error}")
+        self.control.logger.error(f"{real_ip}: {error}")
         self.error_continuous += 1
 
     def _monitor_exit_conditions(self):
@@ -168,7 +323,7 @@ class LessPageEngineeringCreator:
                     try:
                         v['body'] = v['body'].decode('utf-8')
                     except UnicodeDecodeError:
-                        v['body'] = base64.b64encode(v['body']).decode('utf-8')
+                        v['body'] = encode_base64_str(v['body'])
                         v['_body_is_base64'] = True
 
     def _restore_bytes_body(self, data):
@@ -179,7 +334,7 @@ class LessPageEngineeringCreator:
             if k.startswith('http') and isinstance(v, dict) and 'body' in v:
                 if v.get('_body_is_bytes'):
                     if v.get('_body_is_base64'):
-                        v['body'] = base64.b64decode(v['body'])
+                        v['body'] = decode_base64(v['body'])
                     else:
                         v['body'] = v['body'].encode('utf-8')
                 v.pop('_body_is_bytes', None)
@@ -261,7 +416,7 @@ class LessPageEngineeringCreator:
                         headers = url_data.get('headers', {})
                         body = url_data.get('body', '')
                         if isinstance(body, bytes):
-                            body = base64.b64encode(body).decode('utf-8')
+                            body = encode_base64_str(body)
                         self.control.redis_cache.set_cache(url_key, headers, body)
             
             return jsonify({'status': 'success', 'message': f'缓存已更新: {key}（已同步到所有缓存）'}), 200
@@ -282,7 +437,7 @@ class LessPageEngineeringCreator:
             result = cache.delete_data(key)
             
             # 2. 从 Runtime 缓存删除
-            if self.control.run_time_cache.search_source_dict(key):
+            if key in self.control.run_time_cache:
                 self.control.run_time_cache.drop_source_dict(key)
             
             # 3. 从 Redis 缓存删除相关 URL
@@ -297,6 +452,12 @@ class LessPageEngineeringCreator:
         except Exception as e:
             return jsonify({'status': 'fail', 'message': str(e)}), 500
 
+    def _handle_run_time_cache_drop(self, key):
+        """仅清除运行时缓存(多进程模式下由前端在缓存变更后通知)"""
+        if self.control is not None:
+            self.control.run_time_cache.drop_source_dict(key)
+        return jsonify({'status': 'success', 'message': f'运行时缓存已清除: {key}'}), 200
+
     def run(self):
         """启动服务器的主运行方法"""
         # 解析命令行参数
@@ -307,19 +468,67 @@ class LessPageEngineeringCreator:
 
         args = parser.parse_args()
 
+        cache_proxy = f"http://127.0.0.1:{args.cache_proxy}" if args.cache_proxy else ''
+        worker_num = self.settings.get('WORKER_PROCESS_NUM') or 0
+        if worker_num > 1:
+            self._serve_workers(args.port, args.host, cache_proxy, worker_num)
+        else:
+            self.serve(args.port, args.host, cache_proxy)
+
+    def serve(self, port, host_port, cache_proxy='', monitor=True):
+        """
+        启动服务器
+
+        :param port: 服务端口
+        :param host_port: 上游控制端口
+        :param cache_proxy: 缓存代理地址
+        :param monitor: 是否启动退出条件监控线程(多进程模式下由前端监控)
+        """
         # 设置实例参数
-        self.port = args.port
-        self.host_port = args.host
-        self.cache_proxy = f"http://127.0.0.1:{args.cache_proxy}" if args.cache_proxy else ''
+        self.port = port
+        self.host_port = host_port
+        self.cache_proxy = cache_proxy
 
         # 打印启动信息
         upstream_status = "启用" if self.settings.get('UPSTREAM_CONTROL_ENABLE', True) else "禁用"
         print(f"{'-' * 10} 服务端口: {self.port} 缓存代理: {self.cache_proxy or '无'} 上游控制: {upstream_status} {'-' * 10}")
 
         # 启动监控线程
+        if monitor:
+            monitor_thread = threading.Thread(target=self._monitor_exit_conditions)
+            monitor_thread.daemon = True
+            monitor_thread.start()
+
+        # 启动服务器
+        if self.settings.get('SERVER_MODE') == 'asgi':
+            self._serve_asgi()
+        else:
+            serve(self.app, host='0.0.0.0', port=self.port, threads=self.settings.get('SERVER_MAX_REQUEST_NUM', 30))
+
+    def _serve_workers(self, port, host_port, cache_proxy, worker_num):
+        """以多进程模式启动：前端调度器 + worker_num个工作进程"""
+        from LessPageEngineer.UtilClass.WorkerSupervisor import WorkerSupervisor
+
+        self.port = port
+        self.host_port = host_port
+        self.cache_proxy = cache_proxy
+        print(f"{'-' * 10} 服务端口: {self.port} 工作进程数量: {worker_num} {'-' * 10}")
+
         monitor_thread = threading.Thread(target=self._monitor_exit_conditions)
         monitor_thread.daemon = True
+        supervisor = WorkerSupervisor(self, worker_num, self.settings.get('WORKER_BASE_PORT') or port + 1)
         monitor_thread.start()
-
-        # 启动服务器
-        serve(self.app, host='0.0.0.0', port=self.port, threads=self.settings.get('SERVER_MAX_REQUEST_NUM', 30))
+        supervisor.run()
+
+    def _serve_asgi(self):
+        """以ASGI模式启动服务器（/uploadUrl以协程排队，handle_url在独立线程池中执行）"""
+        import uvicorn
+        from LessPageEngineer.UtilClass.AsgiApp import AsgiApp
+
+        self.asgi_app = AsgiApp(
+            self,
+            max_concurrent=self.settings.get('ASGI_MAX_CONCURRENT_REQUEST') or self.settings.get('TABS_NUM', 6),
+            max_queue_size=self.settings.get('ASGI_MAX_QUEUE_SIZE', 1000),
+            max_body_size=self.settings.get('ASGI_MAX_BODY_SIZE'),
+        )
+        uvicorn.run(self.asgi_app, host='0.0.0.0', port=self.port, log_level='warning')
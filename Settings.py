@@ -14,21 +14,59 @@ SERVER_DEFAULT_PORT = 27888
 SERVER_DEFAULT_CACHE_PROXY = ''
 # 服务节点可承受的最大请求数量
 SERVER_MAX_REQUEST_NUM = 30
+# 服务运行模式 waitress:线程模式(每个请求占用一个线程) asgi:协程模式(需安装uvicorn)
+SERVER_MODE = 'waitress'
+# asgi模式下同时处理的最大请求数量(为None时与TABS_NUM一致)
+ASGI_MAX_CONCURRENT_REQUEST = None
+# asgi模式下最大排队请求数量，超出后直接返回503
+ASGI_MAX_QUEUE_SIZE = 1000
+# asgi模式下 /uploadUrl 等请求体的最大字节数，超出后返回413，为None时不限制
+ASGI_MAX_BODY_SIZE = 32 * 1024 * 1024
+# /uploadUrls 每个批量请求同时处理的最大任务数量(为None时与TABS_NUM一致)，请求中的concurrency不能超过该值
+BATCH_MAX_CONCURRENT = None
+# /uploadUrls 每个批量请求的最大任务数量
+BATCH_MAX_TASKS = 1000
+# 多进程模式下 /uploadUrls 等待下一行结果的最长时间(秒)，超时后其余任务返回失败(504)
+BATCH_LINE_TIMEOUT = 600
+# /uploadPipeline 每个流水线请求的最大页面数量(pages)
+PIPELINE_MAX_PAGES = 100
+# 工作进程数量，大于1时启用多进程模式(前端调度器按session_id/在忙请求数量分配请求给各工作进程，每个进程拥有独立的浏览器)
+WORKER_PROCESS_NUM = 0
+# 第一个工作进程的端口，其余依次递增(为None时为服务端口+1)
+WORKER_BASE_PORT = None
 # Mongo
 MONGO_HOST = '127.0.0.1'
 MONGO_DB = 'LPE_Chrome_Cache'
 MONGO_CONNECT = 'ALL'
+# 不小于该大小(字节)的响应体保存在GridFS中
+MONGO_GRIDFS_THRESHOLD = 8 * 1024 * 1024
 # 一个浏览器最多开启?个标签页
 MAX_CHROME_TABS_NUM = 20
 # 标签页最大存活时间
 MAX_TAB_LIVE_TIME = 300000
+# 每个浏览器预先创建的备用标签页数量，重启标签页时直接替换(0为不启用，开启后每个浏览器额外打开对应数量的标签页)
+STANDBY_TABS_NUM = 0
+# 每个浏览器预先创建的新上下文(new_context)备用标签页数量(0为不启用)
+STANDBY_CONTEXT_TABS_NUM = 0
+# 标签页分配到?个浏览器进程(标签页模式)，每个浏览器最多MAX_CHROME_TABS_NUM个标签页
+BROWSER_NUM = 1
+# 标签页分配策略 fill:按空闲顺序 least_loaded:在忙标签页最少的浏览器 round_robin:浏览器轮流 domain:同一域名固定到同一浏览器
+TAB_PLACEMENT = 'fill'
+# 浏览器进程绑定的CPU(仅Linux) None:不绑定 'auto':按BROWSER_NUM平均划分 [[0, 1], [2, 3]]:按浏览器顺序指定
+BROWSER_CPU_SETS = None
 # 浏览器最大存活时间
 MAX_CHROME_LIVE_TIME = 30000
+# 轮换浏览器时等待在忙标签页释放的最长时间?s，超时后强制迁移到新浏览器
+ROTATE_MIGRATE_TIMEOUT = 300
 # 标签页状态打印时间间隔?s
 TABS_STATUS_INTERVAL = 60
 # 标签页 Session 保持的最大空闲时间（秒）
 # 当标签页绑定某个 session_id 后，若超过此时间没有收到该 session 的请求，则释放绑定
 MAX_AFTER_REQUEST_SESSION_TIME = 9000
+# 运行时缓存(已加载的key)响应体总大小上限(字节)，超出后淘汰最久未使用的key，为None时不限制
+RUNTIME_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# 等待条件(ensure_eles/wait_urls等)由页面事件唤醒重新检查，无事件时每隔?s兜底检查一次
+READINESS_FALLBACK_INTERVAL = 0.5
 # 是否展示耗时步骤(运行中)
 SHOW_STEP_SPEND = False
 # 本地模式 (本地模式下不会上代理以及只会强制一个标签页)
@@ -80,6 +118,12 @@ CHROME_CACHE_SAVE_PATH = r'F:\chromeCache'
 ''' 本地数据文件 '''
 READ_LOCAL_FILE = True  # 是否读取本地数据文件(False的话则从MongoDB读取)
 LOCAL_FILE_PATH = os.path.dirname(os.path.abspath(__file__)) + '\\'
+# 响应体按内容去重保存，删除/覆盖key后回收不再被引用的响应体，写入该时间(秒)内的响应体不回收
+BLOB_GC_GRACE_TIME = 3600
+# 本地模式下不小于该大小(字节)的响应体以内存映射方式读取，为0时不使用内存映射
+LOCAL_MMAP_MIN_SIZE = 256 * 1024
+# 保存缓存时是否额外保存base64编码后的响应体(额外占用约1.33倍空间)，开启后使用缓存填充请求时无需再次编码
+CACHE_STORE_BODY_B64 = False
 
 ''' 共用 '''
 # 最大CPU熔断 %
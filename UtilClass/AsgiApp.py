@@ -0,0 +1,311 @@
+import sys
+import json
+import asyncio
+
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class AsgiApp:
+    """
+    ASGI服务入口
+
+    - /uploadUrl 请求以协程的形式排队等待，Control.handle_url 在独立线程池中执行
+    - /uploadUrls 批量请求的每个任务同样排队执行，按完成顺序以NDJSON流式返回
+    - /uploadPipeline 流水线整体占用一个执行位，按页面顺序以NDJSON流式返回
+    - 排队数量超过 max_queue_size 时立即返回503，避免请求在排队中超时
+    - 其余路由转交给Flask(WSGI)处理
+    """
+
+    def __init__(self, creator, max_concurrent=6, max_queue_size=1000, wsgi_workers=4, max_body_size=None):
+        """
+        :param creator: LessPageEngineeringCreator对象
+        :param max_concurrent: 同时执行handle_url的最大数量(线程池大小)
+        :param max_queue_size: 等待执行的最大排队数量(包括正在读取请求体的请求)
+        :param max_body_size: 请求体最大字节数，为None时不限制
+        :param wsgi_workers: 处理其余路由的线程数量
+        """
+        self.creator = creator
+        self.max_concurrent = max_concurrent
+        self.max_queue_size = max_queue_size
+        self.max_body_size = max_body_size
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='asgi_handle_url')
+        self._wsgi_executor = ThreadPoolExecutor(max_workers=wsgi_workers, thread_name_prefix='asgi_wsgi')
+        # 信号量需在事件循环中创建
+        self._semaphore = None
+        # 当前排队数量
+        self._waiting = 0
+        # 累计拒绝数量
+        self._rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._handle_lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'] == '/uploadUrl' and scope['method'] == 'POST':
+                await self._handle_upload(scope, receive, send)
+            elif scope['path'] == '/uploadUrls' and scope['method'] == 'POST':
+                await self._handle_upload_batch(scope, receive, send)
+            elif scope['path'] == '/uploadPipeline' and scope['method'] == 'POST':
+                await self._handle_upload_pipeline(scope, receive, send)
+            else:
+                await self._handle_wsgi(scope, receive, send)
+
+    async def _handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._semaphore = asyncio.Semaphore(self.max_concurrent)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=False)
+                self._wsgi_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @property
+    def stats(self):
+        """准入控制统计"""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue_size': self.max_queue_size,
+            'waiting': self._waiting,
+            'rejected': self._rejected,
+        }
+
+    @staticmethod
+    async def _read_body(receive, max_size=None):
+        """读取请求体，超过max_size时返回None"""
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            if max_size is not None and len(body) > max_size:
+                return None
+            more_body = message.get('more_body', False)
+        return body
+
+    @staticmethod
+    async def _send_response(send, status_code, body, content_type=b'application/json'):
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _dumps(self, data):
+        return self.creator.app.json.dumps(data).encode('utf-8')
+
+    # 准入控制：排队名额不足时快速失败，否则预留count个名额(获取执行位时或在退出时释放)，返回是否已预留
+    async def _reserve(self, send, count=1):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._waiting + count > self.max_queue_size:
+            self._rejected += 1
+            await self._send_response(send, 503, self._dumps(
+                {'status': 'fail', 'message': f'排队请求数量已达上限{self.max_queue_size}'}))
+            return False
+        self._waiting += count
+        return True
+
+    # 读取并解析请求体，失败时返回响应并返回None
+    async def _read_json(self, receive, send, parse=json.loads):
+        body = await self._read_body(receive, self.max_body_size)
+        if body is None:
+            await self._send_response(send, 413, self._dumps(
+                {'status': 'error', 'message': f'请求体超过{self.max_body_size}字节'}))
+            return None
+        try:
+            return (parse(body),)
+        except ValueError as e:
+            await self._send_response(send, 400, self._dumps({'status': 'error', 'message': f'请求体解析失败: {e}'}))
+            return None
+
+    @staticmethod
+    def _real_ip(scope):
+        headers = dict(scope.get('headers') or [])
+        return headers.get(b'x-real-ip', b'').decode() or None
+
+    # 等待执行位，获取后(或等待被取消时)释放一个预留的排队名额
+    async def _acquire(self):
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+    # 使用预留的名额排队获取执行位后在线程池中执行
+    async def _run_queued(self, func, *args):
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._semaphore.release()
+
+    async def _handle_upload(self, scope, receive, send):
+        if not await self._reserve(send):
+            return
+        queued = False
+        try:
+            parsed = await self._read_json(receive, send)
+            if parsed is None:
+                return
+            queued = True
+            result, status_code = await self._run_queued(self.creator._handle_upload_data, parsed[0],
+                                                         self._real_ip(scope))
+        finally:
+            # 未进入排队(请求体有误/客户端断开)时释放预留的名额
+            if not queued:
+                self._waiting -= 1
+        await self._send_response(send, status_code, self._dumps(result))
+
+    async def _handle_upload_batch(self, scope, receive, send):
+        if not await self._reserve(send):
+            return
+        try:
+            parsed = await self._read_json(receive, send, parse=lambda body: self.creator._parse_batch_data(
+                json.loads(body)))
+        finally:
+            self._waiting -= 1
+        if parsed is None:
+            return
+        tasks, concurrency = parsed[0]
+        # 批量中的每个任务各占一个排队名额，名额不足时整体拒绝
+        if not await self._reserve(send, len(tasks)):
+            return
+        # 尚未进入排队的任务数量(仍持有预留的名额)
+        unqueued = [len(tasks)]
+        real_ip = self._real_ip(scope)
+        # 每个批量请求最多同时占用concurrency个执行位
+        batch_semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_task(index, task):
+            async with batch_semaphore:
+                unqueued[0] -= 1
+                result, status_code = await self._run_queued(self.creator._handle_batch_task, task, real_ip)
+            return self.creator._batch_line(index, result, status_code)
+
+        pending = [asyncio.ensure_future(run_task(index, task)) for index, task in enumerate(tasks)]
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')],
+            })
+            for future in asyncio.as_completed(pending):
+                line = await future
+                await send({'type': 'http.response.body', 'body': self._dumps(line) + b'\n', 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # 客户端断开时取消尚未开始的任务，并释放其预留的名额
+            for future in pending:
+                future.cancel()
+            self._waiting -= unqueued[0]
+
+    # 将ASGI请求转换为WSGI请求交给Flask处理
+    def _build_environ(self, scope, body):
+        server = scope.get('server') or ('0.0.0.0', 0)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers') or []:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _call_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        result = self.creator.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    async def _handle_wsgi(self, scope, receive, send):
+        body = await self._read_body(receive)
+        loop = asyncio.get_running_loop()
+        status_code, headers, body = await loop.run_in_executor(
+            self._wsgi_executor, self._call_wsgi, self._build_environ(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle_upload_pipeline(self, scope, receive, send):
+        if not await self._reserve(send):
+            return
+        queued = False
+        try:
+            parsed = await self._read_json(receive, send, parse=lambda body: self.creator._parse_pipeline_data(
+                json.loads(body)))
+            if parsed is None:
+                return
+            queued = True
+            await self._acquire()
+        finally:
+            if not queued:
+                self._waiting -= 1
+        post_data, pages = parsed[0]
+        lines = self.creator._iter_pipeline_results(post_data, pages, self._real_ip(scope))
+        loop = asyncio.get_running_loop()
+        step = None
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')],
+            })
+            while True:
+                # 每个页面在线程池中执行
+                step = self._executor.submit(next, lines, None)
+                line = await asyncio.wrap_future(step, loop=loop)
+                if line is None:
+                    break
+                await send({'type': 'http.response.body', 'body': self._dumps(line) + b'\n', 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            try:
+                # 客户端断开时关闭流水线，归还标签页
+                await loop.run_in_executor(self._executor, self._close_pipeline, lines, step)
+            finally:
+                self._semaphore.release()
+
+    # 等待正在执行的页面结束后关闭流水线(执行中的生成器无法关闭)
+    @staticmethod
+    def _close_pipeline(lines, step):
+        if step is not None:
+            wait([step])
+        lines.close()
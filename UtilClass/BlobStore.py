@@ -0,0 +1,428 @@
+import os
+import mmap
+import time
+import hashlib
+import weakref
+import threading
+
+from collections.abc import Mapping
+from datetime import datetime
+
+from loguru import logger
+from bson.binary import Binary
+from gridfs import GridFSBucket
+
+from LessPageEngineer.Utils.Utils import encode_base64
+
+
+class BlobStore:
+    """
+    按内容寻址的响应体存储
+
+    - 响应体按sha256保存一份，多个key引用同一资源(如jQuery/CDN资源)时不重复存储
+    - key只保存 url -> body_hash 的清单(manifest)
+    - 通过标记-清除回收不再被任何清单引用的响应体
+    - store_b64为True时额外保存base64编码后的响应体({body_hash}.b64)，填充请求时无需再次编码
+    """
+
+    def __init__(self, gc_grace_time=3600, store_b64=False):
+        """
+        :param gc_grace_time: 新写入的响应体在该时间(秒)内不会被回收，防止清单写入前被误删
+        :param store_b64: 是否额外保存base64编码后的响应体
+        """
+        self.gc_grace_time = gc_grace_time
+        self.store_b64 = store_b64
+        self._gc_lock = threading.Lock()
+
+    # 以下方法由具体存储实现
+    def put(self, body_hash, data):
+        raise NotImplementedError
+
+    def get(self, body_hash):
+        raise NotImplementedError
+
+    def delete(self, body_hash):
+        raise NotImplementedError
+
+    def touch(self, body_hash):
+        """更新写入时间，返回是否存在"""
+        raise NotImplementedError
+
+    def list_hashes(self):
+        """返回 [(body_hash, 最后写入时间戳)]"""
+        raise NotImplementedError
+
+    def get_many(self, body_hashes):
+        return {body_hash: self.get(body_hash) for body_hash in body_hashes}
+
+    def get_view(self, body_hash):
+        """读取响应体供请求填充使用(可返回memoryview)"""
+        return self.get(body_hash)
+
+    @staticmethod
+    def get_body_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def to_blob(body):
+        """响应体转bytes，返回 (data, body_type)"""
+        if isinstance(body, str):
+            return body.encode('utf-8'), 'str'
+        if isinstance(body, bytes):
+            return body, 'bytes'
+        return bytes(body), 'bytes'
+
+    @staticmethod
+    def from_blob(data, body_type):
+        if body_type == 'str':
+            return str(data, 'utf-8')
+        return data
+
+    @staticmethod
+    def is_blob_item(item):
+        return isinstance(item, dict) and 'body_hash' in item
+
+    @staticmethod
+    def is_resource(url, item):
+        return isinstance(url, str) and url.startswith('http') and isinstance(item, dict)
+
+    def dump_item(self, item):
+        """保存单个资源的响应体，返回将body替换为body_hash的资源信息"""
+        if item.get('body') is None:
+            return item
+        data, body_type = self.to_blob(item['body'])
+        # memoryview形式的响应体保留原类型
+        if isinstance(item['body'], memoryview) and item.get('body_type'):
+            body_type = item['body_type']
+        body_hash = self.get_body_hash(data)
+        self.put(body_hash, data)
+        # body_b64由body生成，不使用传入的值
+        manifest_item = {k: v for k, v in item.items() if k not in ('body', 'body_b64')}
+        manifest_item.update({'body_hash': body_hash, 'body_type': body_type, 'body_size': len(data)})
+        if self.store_b64:
+            body_b64_hash = f'{body_hash}.b64'
+            # 已保存过时只更新写入时间，不重复编码
+            if not self.touch(body_b64_hash):
+                self.put(body_b64_hash, encode_base64(data))
+            manifest_item['body_b64_hash'] = body_b64_hash
+        return manifest_item
+
+    def load_item(self, item, data):
+        """根据资源信息及响应体还原资源"""
+        item = dict(item)
+        item.pop('body_hash')
+        item.pop('body_b64_hash', None)
+        body_type = item.pop('body_type', 'bytes')
+        item.pop('body_size', None)
+        item['body'] = self.from_blob(data, body_type) if data is not None else None
+        return item
+
+    def load_body_b64(self, item):
+        """读取保存的base64响应体(str)，没有时返回None"""
+        if not item.get('body_b64_hash'):
+            return None
+        data = self.get_view(item['body_b64_hash'])
+        return str(data, 'ascii') if data is not None else None
+
+    def dump_manifest(self, source_dict):
+        """保存响应体，返回将body替换为body_hash的清单"""
+        manifest = {}
+        for url, item in source_dict.items():
+            manifest[url] = self.dump_item(item) if self.is_resource(url, item) else item
+        return manifest
+
+    def load_manifest(self, manifest):
+        """根据清单还原资源字典(兼容旧版直接保存body的数据)"""
+        if not manifest:
+            return manifest
+        body_hashes = {item['body_hash'] for item in manifest.values() if self.is_blob_item(item)}
+        if not body_hashes:
+            return manifest
+        blobs = self.get_many(body_hashes)
+        source_dict = {}
+        for url, item in manifest.items():
+            source_dict[url] = self.load_item(item, blobs.get(item['body_hash'])) if self.is_blob_item(item) else item
+        return source_dict
+
+    @classmethod
+    def referenced_hashes(cls, manifests):
+        body_hashes = set()
+        for manifest in manifests:
+            for item in manifest.values():
+                if cls.is_blob_item(item):
+                    body_hashes.add(item['body_hash'])
+                    if item.get('body_b64_hash'):
+                        body_hashes.add(item['body_b64_hash'])
+        return body_hashes
+
+    def collect_garbage(self, manifests):
+        """
+        标记-清除：删除未被任何清单引用且超过gc_grace_time的响应体
+
+        :param manifests: 所有key的清单(可迭代)
+        :return: 删除的响应体数量
+        """
+        with self._gc_lock:
+            marked = self.referenced_hashes(manifests)
+            expire_time = time.time() - self.gc_grace_time
+            removed = 0
+            for body_hash, write_time in self.list_hashes():
+                if body_hash not in marked and write_time <= expire_time:
+                    self.delete(body_hash)
+                    removed += 1
+            return removed
+
+    def collect_garbage_async(self, manifests_func):
+        """后台执行回收，已有回收在执行时跳过"""
+        if self._gc_lock.locked():
+            return
+
+        def _collect():
+            try:
+                removed = self.collect_garbage(manifests_func())
+                if removed:
+                    logger.info(f"响应体回收完成，删除{removed}个")
+            except Exception as e:
+                logger.warning(f"响应体回收失败: {e}")
+
+        t = threading.Thread(target=_collect)
+        t.daemon = True
+        t.start()
+
+
+class LazySourceDict(Mapping):
+    """按需加载响应体的资源字典，url对应的响应体在第一次读取时才从存储中获取"""
+
+    def __init__(self, manifest, resources, blob_store):
+        """
+        :param manifest: 非资源字段(key、update_time等)
+        :param resources: {url: 资源信息(不含响应体)}
+        :param blob_store: 响应体存储
+        """
+        self._manifest = manifest
+        self._resources = resources
+        self._blob_store = blob_store
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        if key in self._resources:
+            item = self._loaded.get(key)
+            if item is None:
+                item = self._load(key)
+            return item
+        return self._manifest[key]
+
+    def _load(self, url):
+        resource = self._resources[url]
+        if not self._blob_store.is_blob_item(resource):
+            item = dict(resource)
+        else:
+            data = self._blob_store.get_view(resource['body_hash'])
+            if isinstance(data, memoryview):
+                # 直接使用映射的内存，body_type记录原类型
+                item = {k: v for k, v in resource.items() if k not in ('body_hash', 'body_size', 'body_b64_hash')}
+                item['body'] = data
+            else:
+                item = self._blob_store.load_item(resource, data)
+            # 保存时已编码的base64响应体，填充请求时直接使用
+            body_b64 = self._blob_store.load_body_b64(resource)
+            if body_b64 is not None:
+                item['body_b64'] = body_b64
+        with self._lock:
+            return self._loaded.setdefault(url, item)
+
+    def close(self):
+        """释放已加载的响应体(内存映射在不再被任何资源字典引用时关闭)，之后读取时重新加载"""
+        with self._lock:
+            self._loaded = {}
+
+    def __contains__(self, key):
+        return key in self._resources or key in self._manifest
+
+    def __iter__(self):
+        yield from self._manifest
+        yield from self._resources
+
+    def __len__(self):
+        return len(self._manifest) + len(self._resources)
+
+    @property
+    def nbytes(self):
+        """响应体总大小(按保存时的大小计算，包含base64响应体)"""
+        size = 0
+        for resource in self._resources.values():
+            body_size = resource.get('body_size', 0)
+            size += body_size
+            if resource.get('body_b64_hash'):
+                size += (body_size + 2) // 3 * 4
+        return size
+
+    @classmethod
+    def from_manifest(cls, manifest, blob_store):
+        """由清单创建，清单中没有body_hash(旧版数据)时直接返回清单"""
+        if not manifest or not any(blob_store.is_blob_item(item) for item in manifest.values()):
+            return manifest
+        resources = {}
+        others = {}
+        for url, item in manifest.items():
+            if blob_store.is_resource(url, item):
+                resources[url] = item
+            else:
+                others[url] = item
+        return cls(others, resources, blob_store)
+
+
+class LocalBlobStore(BlobStore):
+    """
+    本地文件夹存储，一个响应体一个文件
+
+    - 不小于mmap_min_size的响应体以内存映射方式读取，填充请求时直接使用映射的内存，不读入进程
+    - 映射只在被资源字典引用期间保留，运行时缓存淘汰key后自动关闭(释放文件描述符)
+    """
+
+    def __init__(self, folder_path, gc_grace_time=3600, mmap_min_size=256 * 1024, store_b64=False):
+        super().__init__(gc_grace_time, store_b64)
+        self.blob_path = os.path.join(folder_path, 'blobs')
+        self.mmap_min_size = mmap_min_size
+        # 已映射的响应体 {body_hash: mmap}，多个key共用，不再被引用时自动移除
+        self._maps = weakref.WeakValueDictionary()
+        self._maps_lock = threading.Lock()
+        if not os.path.exists(self.blob_path):
+            os.makedirs(self.blob_path, exist_ok=True)
+
+    def blob_file(self, body_hash):
+        return os.path.join(self.blob_path, body_hash[:2], body_hash)
+
+    def exists(self, body_hash):
+        return os.path.exists(self.blob_file(body_hash))
+
+    def touch(self, body_hash):
+        try:
+            os.utime(self.blob_file(body_hash))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, body_hash, data):
+        file_path = self.blob_file(body_hash)
+        # 已存在时更新写入时间，防止被正在执行的回收删除
+        if self.touch(body_hash):
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_path, file_path)
+
+    def get(self, body_hash):
+        file_path = self.blob_file(body_hash)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'rb') as fp:
+            return fp.read()
+
+    def get_view(self, body_hash):
+        file_path = self.blob_file(body_hash)
+        with self._maps_lock:
+            mapped = self._maps.get(body_hash)
+            if mapped is not None:
+                return memoryview(mapped)
+            try:
+                size = os.path.getsize(file_path)
+            except FileNotFoundError:
+                return None
+            if not self.mmap_min_size or size < self.mmap_min_size:
+                return self.get(body_hash)
+            with open(file_path, 'rb') as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[body_hash] = mapped
+            return memoryview(mapped)
+
+    def delete(self, body_hash):
+        with self._maps_lock:
+            # 仍在使用的映射随引用释放自动关闭
+            self._maps.pop(body_hash, None)
+        try:
+            os.remove(self.blob_file(body_hash))
+        except OSError:
+            # 文件不存在，或Windows下文件仍被映射，下次回收时再删除
+            pass
+
+    def list_hashes(self):
+        for dir_name in os.listdir(self.blob_path):
+            dir_path = os.path.join(self.blob_path, dir_name)
+            if not os.path.isdir(dir_path):
+                continue
+            for file_name in os.listdir(dir_path):
+                if file_name.endswith('.tmp'):
+                    continue
+                try:
+                    yield file_name, os.path.getmtime(os.path.join(dir_path, file_name))
+                except FileNotFoundError:
+                    continue
+
+
+class MongoBlobStore(BlobStore):
+    """
+    MongoDB存储
+
+    - 小响应体一个文档 {_id: body_hash, body, size, update_time}
+    - 不小于gridfs_threshold的响应体保存在GridFS中(文件名为body_hash)，避免超出16MB的文档上限
+    """
+
+    def __init__(self, collection, gc_grace_time=3600, gridfs_threshold=8 * 1024 * 1024, store_b64=False):
+        super().__init__(gc_grace_time, store_b64)
+        self.collection = collection
+        self.gridfs_threshold = gridfs_threshold
+        self.bucket_name = f'{collection.name}_fs'
+        self.bucket = GridFSBucket(collection.database, bucket_name=self.bucket_name)
+        self.files = collection.database[f'{self.bucket_name}.files']
+
+    def put(self, body_hash, data):
+        if len(data) < self.gridfs_threshold:
+            self.collection.update_one(
+                {'_id': body_hash},
+                {'$setOnInsert': {'body': Binary(data), 'size': len(data)},
+                 '$set': {'update_time': datetime.now()}},
+                upsert=True)
+            return
+        result = self.files.update_one({'filename': body_hash}, {'$set': {'metadata.update_time': datetime.now()}})
+        if not result.matched_count:
+            self.bucket.upload_from_stream(body_hash, data, metadata={'update_time': datetime.now()})
+
+    def touch(self, body_hash):
+        now = datetime.now()
+        if self.collection.update_one({'_id': body_hash}, {'$set': {'update_time': now}}).matched_count:
+            return True
+        return bool(self.files.update_one({'filename': body_hash}, {'$set': {'metadata.update_time': now}}).matched_count)
+
+    def _get_file(self, body_hash):
+        try:
+            return self.bucket.open_download_stream_by_name(body_hash).read()
+        except Exception:
+            return None
+
+    def get(self, body_hash):
+        doc = self.collection.find_one({'_id': body_hash}, {'body': 1})
+        return bytes(doc['body']) if doc else self._get_file(body_hash)
+
+    def get_many(self, body_hashes):
+        blobs = {doc['_id']: bytes(doc['body'])
+                 for doc in self.collection.find({'_id': {'$in': list(body_hashes)}}, {'body': 1})}
+        for body_hash in body_hashes:
+            if body_hash not in blobs:
+                blobs[body_hash] = self._get_file(body_hash)
+        return blobs
+
+    def delete(self, body_hash):
+        self.collection.delete_one({'_id': body_hash})
+        for file_doc in self.files.find({'filename': body_hash}, {'_id': 1}):
+            self.bucket.delete(file_doc['_id'])
+
+    def list_hashes(self):
+        for doc in self.collection.find({}, {'update_time': 1}):
+            yield doc['_id'], doc['update_time'].timestamp() if doc.get('update_time') else 0
+        for file_doc in self.files.find({}, {'filename': 1, 'metadata': 1, 'uploadDate': 1}):
+            update_time = (file_doc.get('metadata') or {}).get('update_time') or file_doc.get('uploadDate')
+            yield file_doc['filename'], update_time.timestamp() if update_time else 0
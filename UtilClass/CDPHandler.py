@@ -1,16 +1,109 @@
 import time
+import heapq
+import itertools
 import threading
 
-from re import search
-from queue import Queue
 from urllib.parse import parse_qs
 from loguru import logger
 from concurrent.futures import ThreadPoolExecutor
 from DrissionPage._base.driver import Driver
 
-from LessPageEngineer.Utils.FetchTimeoutThread import function_with_timeout
-from LessPageEngineer.Utils.Utils import url_pattern_cut, reduce_url
-from LessPageEngineer.BaseClass.CDPBase import RouteDriver, Request, Response
+from LessPageEngineer.Utils.Utils import url_pattern_cut, reduce_url, UrlMatcher
+from LessPageEngineer.BaseClass.CDPBase import RouteDriver, FuncClass, Request, Response
+
+
+class DeadlineJob:
+    """
+    带截止时间的任务，超时未完成时改由fail_func应答(每个任务只有一方应答)
+
+    - 排队期间超时(提交后run_timeout)：看门狗直接调用fail_func，任务不再执行
+    - 开始执行时重新计时(排队时间不计入)，任务可通过extend延长截止时间(如需较长时间的代理请求)
+    - 执行期间超时：只标记超时，任务发送最终命令前通过claim检查，改为调用fail_func
+    """
+    PENDING, RUNNING, FINISHED, EXPIRED = range(4)
+
+    def __init__(self, fn, args, kwargs, run_timeout, fail_func=None, schedule=None):
+        """
+        :param run_timeout: 排队及执行的最长时间(秒)，分别计时
+        :param schedule: 截止时间变化时调用 schedule(job)，由看门狗重新登记
+        """
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self.run_timeout = run_timeout
+        self.deadline = time.monotonic() + run_timeout
+        self._fail_func = fail_func
+        self._schedule = schedule
+        self._state = self.PENDING
+        # 是否已有一方应答(任务自身或fail_func)
+        self._answered = False
+        self._state_lock = threading.Lock()
+
+    def run(self):
+        with self._state_lock:
+            # 排队期间已超时
+            if self._state != self.PENDING:
+                return
+            self._state = self.RUNNING
+            self.deadline = time.monotonic() + self.run_timeout
+        if self._schedule:
+            self._schedule(self)
+        try:
+            self._fn(*self._args, **self._kwargs)
+        except Exception as e:
+            logger.debug(f"路由任务执行有误: {e}")
+        finally:
+            with self._state_lock:
+                if self._state == self.RUNNING:
+                    self._state = self.FINISHED
+                    fallback = False
+                else:
+                    # 执行期间超时且任务未应答
+                    fallback = not self._answered
+                    self._answered = True
+            if fallback:
+                self._call_fail_func()
+
+    def extend(self, seconds):
+        """执行中的任务将截止时间延长至当前时间后seconds秒(已超时时不处理)"""
+        with self._state_lock:
+            deadline = time.monotonic() + seconds
+            if self._state != self.RUNNING or deadline <= self.deadline:
+                return
+            self.deadline = deadline
+        if self._schedule:
+            self._schedule(self)
+
+    def claim(self):
+        """任务发送最终命令前调用，返回任务自身是否可以应答(已超时时改为调用fail_func)"""
+        with self._state_lock:
+            if self._state != self.EXPIRED or self._answered:
+                self._answered = True
+                return True
+            self._answered = True
+        self._call_fail_func()
+        return False
+
+    def expire(self):
+        """截止时间到达时调用，返回任务是否被判定为超时"""
+        with self._state_lock:
+            if self._state == self.FINISHED:
+                return False
+            pending = self._state == self.PENDING
+            self._state = self.EXPIRED
+            if pending:
+                self._answered = True
+        # 执行中的任务由其自身在发送最终命令时处理
+        if pending:
+            self._call_fail_func()
+        return True
+
+    def _call_fail_func(self):
+        if self._fail_func:
+            try:
+                self._fail_func()
+            except Exception as e:
+                logger.debug(f"超时任务的失败函数执行有误: {e}")
 
 
 class GlobalRouteExecutor:
@@ -34,6 +127,12 @@ class GlobalRouteExecutor:
         self._route_count = 0
         self._max_workers = 10  # 初始值
         self._resize_lock = threading.Lock()
+        # 截止时间堆 (deadline, seq, job)，由单个看门狗线程统一检查
+        self._deadlines = []
+        self._deadline_seq = itertools.count()
+        self._deadline_cond = threading.Condition()
+        self._watchdog = None
+        self.expired_count = 0
     
     def register_route(self):
         """注册一个RouteHandler，动态调整线程池大小"""
@@ -71,6 +170,52 @@ class GlobalRouteExecutor:
             return self._executor.submit(fn, *args, **kwargs)
         return None
     
+    def submit_with_deadline(self, fn, *args, run_timeout=5, fail_func=None, job_kwarg=None, **kwargs):
+        """
+        提交带截止时间的任务到全局线程池（排队、执行分别计时）
+
+        :param run_timeout: 任务排队及执行的最长时间(秒)
+        :param fail_func: 超时未完成时调用的函数
+        :param job_kwarg: 传入时以该参数名将DeadlineJob传给fn(发送最终命令前调用job.claim，需要更长时间时调用job.extend)
+        """
+        if not self._executor:
+            return None
+        job = DeadlineJob(fn, args, kwargs, run_timeout, fail_func, schedule=self._schedule)
+        if job_kwarg:
+            kwargs[job_kwarg] = job
+        self._schedule(job)
+        return self._executor.submit(job.run)
+
+    def _schedule(self, job):
+        """登记任务当前的截止时间(截止时间变化后旧的登记在出堆时忽略)"""
+        with self._deadline_cond:
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch_deadlines, daemon=True,
+                                                  name="global_route_watchdog")
+                self._watchdog.start()
+            heapq.heappush(self._deadlines, (job.deadline, next(self._deadline_seq), job))
+            # 新登记的截止时间最早时唤醒看门狗
+            if self._deadlines[0][2] is job:
+                self._deadline_cond.notify()
+
+    def _watch_deadlines(self):
+        """看门狗：按截止时间顺序检查任务"""
+        while True:
+            with self._deadline_cond:
+                while not self._deadlines:
+                    self._deadline_cond.wait()
+                deadline, _, job = self._deadlines[0]
+                wait_time = deadline - time.monotonic()
+                if wait_time > 0:
+                    self._deadline_cond.wait(wait_time)
+                    continue
+                heapq.heappop(self._deadlines)
+            # 任务已开始执行或延长了截止时间
+            if deadline != job.deadline:
+                continue
+            if job.expire():
+                self.expired_count += 1
+
     def shutdown(self):
         """关闭全局线程池"""
         with self._resize_lock:
@@ -94,6 +239,8 @@ class Network(object):
         self.__canceled_list = set()
         self.received_url = []
         self.received_callback_func = None
+        # 请求失败时的回调
+        self.failed_callback_func = None
 
     def open_response_received(self, call_back_func=None):
         self._driver.set_callback('Network.responseReceived', self.response_received)
@@ -110,6 +257,8 @@ class Network(object):
     def loading_failed(self, **kwargs):
         if kwargs.get('canceled'):
             self.__canceled_list.add(kwargs['requestId'])
+            if self.failed_callback_func:
+                self.failed_callback_func(**kwargs)
 
     # 停止websockets
     def stop(self):
@@ -126,6 +275,11 @@ class Network(object):
 
 
 class RouteHandler(RouteDriver):
+    # 单个请求的最长处理时间(秒)
+    TASK_TIMEOUT = 5
+    # Response阶段(需读取响应体，如modify/key_save)的最长处理时间(秒)，与读取响应体的CDP超时一致
+    RESPONSE_TASK_TIMEOUT = 60
+
     def __init__(self, page, time_out=60, driver=None, source_dict=None, show_log=0, use_cache_proxy=False,
                  get_response=False):
         """
@@ -139,9 +293,10 @@ class RouteHandler(RouteDriver):
         self.show_log = show_log
         self.__disable_network = False
         self._timeout = time_out
-        self.__route_item_queue = Queue()
         self.__patterns = []
         self._patterns_func = []
+        # 所有patterns合并后的匹配器(下标与_patterns_func一致)
+        self.__url_matcher = UrlMatcher()
         self.__update_source_dict = True
         self.__disable_img_font = False
         self.__disable_source_list = ['Font', 'Image']
@@ -154,23 +309,15 @@ class RouteHandler(RouteDriver):
         # 是否获取cdp响应
         self.__get_response = get_response
         self.source_dict = {} if source_dict == None else source_dict
+        self.stop_event = threading.Event()
+        self._driver_ids = []
+        # 使用全局线程池(需在开启Fetch拦截前注册)
+        _global_route_executor.register_route()
         self.new_work = Network(self._driver)
         self.__route_id = str(round(time.time() * 1000))[-7:]
         self.__save_cache = False if source_dict == None else True
         if self.__save_cache:
             self.__run_cache()
-        self.stop_event = threading.Event()
-        self._driver_ids = []
-        
-        # 使用全局线程池
-        _global_route_executor.register_route()
-        # 启动单个消费线程，将任务提交到全局线程池
-        self._consumer_thread = threading.Thread(
-            target=self.__consume_queue, 
-            daemon=True,
-            name=f"route_consumer_{self.__route_id}"
-        )
-        self._consumer_thread.start()
         # self._page.browser.driver.set_callback('Target.targetCreated', self.iframe_route_create, immediate=True)
 
 
@@ -206,9 +353,11 @@ class RouteHandler(RouteDriver):
         assert isinstance(urlPattern, str), "类型有误"
         assert requestStage == 'Request' or requestStage == 'Response' or requestStage == 'Both', "未知的requestStage值"
         # patterns - 回调函数
+        pattern = url_pattern_cut(urlPattern)
         self._patterns_func.append(
-            {'pattern': url_pattern_cut(urlPattern), 'func': callback_func,
+            {'pattern': pattern, 'func': callback_func,
              'stage': requestStage})
+        self.__url_matcher.add(pattern)
         # 拦截阶段 patterns重新发送
         if requestStage == 'Response':
             self.__patterns.append({'urlPattern': urlPattern, 'requestStage': 'Response'})
@@ -216,24 +365,26 @@ class RouteHandler(RouteDriver):
         self._driver.set_callback('Fetch.requestPaused', self._requestPaused)
 
     def _requestPaused(self, **kwargs):
+        """CDP回调中直接将暂停的请求提交到全局线程池"""
         if self.stop_event.is_set():
             return
-        self.__route_item_queue.put(kwargs)
+        _global_route_executor.submit_with_deadline(
+            self._handle_task, kwargs,
+            run_timeout=self.TASK_TIMEOUT,
+            fail_func=lambda: self._expire_task(kwargs),
+            job_kwarg='job'
+        )
+
+    def _expire_task(self, kwargs):
+        """处理超时的请求：继续请求(禁用网络时截停)，避免请求一直处于暂停状态"""
+        route = FuncClass(kwargs.get('driver', self._driver), 3, kwargs['requestId'])
+        if self.__disable_network:
+            route.abort()
+        else:
+            route.continue_()
+        if self.show_log >= 1:
+            print(f"处理请求超时 {kwargs.get('request', {}).get('url')}")
 
-    def __consume_queue(self):
-        """单线程消费队列，将任务提交到全局线程池"""
-        while not self.stop_event.is_set():
-            if self.__route_item_queue.empty():
-                time.sleep(0.05)
-                continue
-            kwargs = self.__route_item_queue.get()
-            _global_route_executor.submit(
-                function_with_timeout, 
-                self._handle_task, 
-                run_timeout=5, 
-                fail_func=None, 
-                kwargs=kwargs
-            )
     def create_route_object(self, kwargs):
         # 将request转换为类
         if not kwargs.get('responseStatusCode'):
@@ -242,17 +393,27 @@ class RouteHandler(RouteDriver):
             # 填充更完整的responseHeaders
             v = Response(**kwargs)
         return v
-    def _handle_task(self, kwargs):
+    def _handle_task(self, kwargs, job=None):
         # 将request转换为类
         v = self.create_route_object(kwargs)
+        if job is not None:
+            # 超时后由_expire_task应答，不再发送该请求的最终命令
+            v.answer_guard = job.claim
+            # 回调函数需要更长时间时(如代理请求)延长截止时间
+            v.deadline_extender = job.extend
+            if v.type == 'Response':
+                v.extend_deadline(self.RESPONSE_TASK_TIMEOUT)
         if self.__disable_img_font:
             if v.resource_type in self.__disable_source_list:
                 v.abort()
                 return
         is_handle = False
-        for pattern_func in self._patterns_func:
+        # 每个链接只匹配一次，命中的下标交给回调函数复用
+        v.match_indexes = self.__url_matcher.match_all(v.url)
+        for index in v.match_indexes:
+            pattern_func = self._patterns_func[index]
             # 匹配成功调用对应函数 response模式下 将request阶段的请求继续
-            if search(pattern_func['pattern'], v.url) and v.type == pattern_func['stage']:
+            if v.type == pattern_func['stage']:
                 pattern_func['func'](v, self.__route_id)
                 is_handle = True
                 break
@@ -280,8 +441,13 @@ class RouteHandler(RouteDriver):
                 print(f"本地缓存 {route.url}")
             # 不使用缓存代理的情况下填充响应
             if not self.__use_cache_proxy:
-                route.fullfillRequest(self.source_dict.get(url)['status_code'], self.source_dict.get(url)['headers'],
-                                      body=self.source_dict.get(url)['body'])
+                cache_item = self.source_dict.get(url)
+                # 有保存时编码好的base64响应体时直接使用
+                if cache_item.get('body_b64') is not None:
+                    route.fullfillRequest(cache_item['status_code'], cache_item['headers'],
+                                          body=cache_item['body_b64'], is_base64=True)
+                else:
+                    route.fullfillRequest(cache_item['status_code'], cache_item['headers'], body=cache_item['body'])
             # 使用缓存代理的情况下继续响应
             else:
                 route.continue_()
@@ -310,6 +476,18 @@ class RouteHandler(RouteDriver):
                 if self.show_log >= 1:
                     print(f"请求被截停 {route.url}")
 
+    @property
+    def url_matcher(self):
+        '''
+        :return: 所有patterns合并后的匹配器(UrlMatcher)
+        '''
+        return self.__url_matcher
+
+    def clear_patterns(self):
+        ''' 清除route_start添加的patterns '''
+        self._patterns_func.clear()
+        self.__url_matcher.clear()
+
     def clear_cache(self, url):
         '''
         :param url: 清除指定缓存的链接
@@ -322,10 +500,6 @@ class RouteHandler(RouteDriver):
             url = url.split('?')[0] + ''.join([k for k, v in parse_qs(url.split('?')[-1]).items()])
         self.source_dict[url] = None
 
-    def consumer_alive(self):
-        """检查消费线程是否存活"""
-        return self._consumer_thread.is_alive() if self._consumer_thread else False
-
     def __run_cache(self):
         self.__patterns.append({'urlPattern': "**", 'requestStage': 'Request'})
         # 是否截获Response阶段
@@ -378,11 +552,6 @@ class RouteHandler(RouteDriver):
                 self.stop_event.set()
                 # 注销全局线程池中的计数
                 _global_route_executor.unregister_route()
-                if self.show_log >= 0:
-                    # 等待消费线程结束
-                    while self.consumer_alive():
-                        logger.info(f"{self._page._target_id[-5:]}的消费线程: {self._consumer_thread.ident}:是否存活：{self._consumer_thread.is_alive()}")
-                        time.sleep(.5)
 
     @save_cache.setter
     def save_cache(self, value):
@@ -2,11 +2,16 @@ import os
 import time
 import atexit
 
-from queue import Queue
-from threading import Lock
+from queue import Queue, Empty
+from threading import Lock, Thread
+from urllib.parse import urlparse
 from DrissionPage import ChromiumOptions
 
 from LessPageEngineer.BaseClass.ChromeBase import LPE_WebPage
+from LessPageEngineer.UtilClass.TabScheduler import TabScheduler
+from LessPageEngineer.UtilClass.SessionRegistry import SessionRegistry
+from LessPageEngineer.UtilClass.StandbyTabPool import StandbyTabPool
+from LessPageEngineer.UtilClass.TabPlacement import TabPlacement, split_cpu_sets, set_process_affinity
 
 
 class Chrome:
@@ -93,7 +98,7 @@ class Chrome:
 class ChromeCreator:
 
     def __init__(self, settings, proxy_need, local, tab_mode, cache_proxy, reload_page_flag,
-                 target_create_callback):
+                 target_create_callback, logger=None):
         self.proxy_need = proxy_need
         self.settings = settings
         self.local = local
@@ -105,16 +110,40 @@ class ChromeCreator:
         self.max_page_exist_time = self.settings['MAX_CHROME_LIVE_TIME']
         self.max_chrome_num = self.settings['TABS_NUM']
         self.max_chrome_exist_time = self.settings['MAX_TAB_LIVE_TIME']  # 标签页最大存活?秒
+        # 轮换浏览器时等待在忙标签页释放的最长时间?秒
+        self.rotate_migrate_timeout = self.settings.get('ROTATE_MIGRATE_TIMEOUT', 300)
+        self.logger = logger
 
-        self.add_session_lock = Lock()
-        # 浏览器session_id列表
-        self.chrome_session_id = set()
-        # 浏览器空闲队列
-        self.chrome_free_queue = Queue()
+        # 标签页模式下分配标签页的浏览器数量
+        self.browser_num = max(self.settings.get('BROWSER_NUM', 1), 1) if tab_mode and not local else 1
+        # 浏览器绑定的CPU
+        cpu_sets = self.settings.get('BROWSER_CPU_SETS')
+        self.cpu_sets = split_cpu_sets(self.browser_num) if cpu_sets == 'auto' else cpu_sets
+
+        # session_id与标签页的绑定表(过期后由后台线程解除绑定)
+        self.sessions = SessionRegistry(expire_time=self.settings['MAX_AFTER_REQUEST_SESSION_TIME'],
+                                        on_expire=lambda session_id, chrome_dict:
+                                        self.tab_scheduler.release_session(session_id, chrome_dict))
+        # 空闲标签页调度器
+        self.tab_scheduler = TabScheduler(sessions=self.sessions,
+                                          placement=TabPlacement(self.settings.get('TAB_PLACEMENT', 'fill'),
+                                                                 get_pages=self.get_pages),
+                                          get_all_tabs=lambda: self.chrome_list)
+        self.sessions.start()
         # 浏览器列表
         self.chrome_list = []
+        # 轮换中的浏览器 {id(旧浏览器): 迁移队列}
+        self.draining_pages = {}
+        self.rotate_lock = Lock()
         # TargetCreated 回调函数
         self.target_create_callback = target_create_callback
+        # 备用标签页池(仅标签页模式)
+        self.standby_pool = StandbyTabPool(
+            create_tab=lambda page, new_context: page.new_tab(new_context=new_context),
+            get_pages=self.get_pages,
+            tabs_num=self.settings.get('STANDBY_TABS_NUM', 0) if tab_mode else 0,
+            context_tabs_num=self.settings.get('STANDBY_CONTEXT_TABS_NUM', 0) if tab_mode else 0,
+            logger=logger)
 
     # 获取chrome
     def get_chrome(self):
@@ -129,46 +158,108 @@ class ChromeCreator:
             page.set.auto_handle_alert(all_tabs=True)
             return page, page
 
-    # 获取chromium
-    def get_page(self):
-        for i in self.pages_list:
-            if i['tab_count'] < self.max_chrome_tab:
-                i['tab_count'] += 1
-                return i['page']
+    # 启动chromium
+    def launch_page(self, cpus=None):
         chrome = Chrome(settings=self.settings, proxy_need=self.proxy_need if not self.local else False)
         page = chrome.get_chrome(proxies=self.cache_proxy)
         page.browser.driver.set_callback('Target.targetCreated', self.target_create_callback, immediate=True)
-        self.pages_list.append({'tab_count': 1, 'page': page, 'start_time': round(time.time())})
+        if cpus:
+            try:
+                set_process_affinity(page.process_id, cpus)
+            except Exception as e:
+                print(f"绑定CPU有误:{e}")
+        return page
+
+    # 获取chromium(先启动browser_num个浏览器，之后分配给标签页最少的浏览器)
+    def get_page(self):
+        if len(self.pages_list) < self.browser_num:
+            page_dict = None
+        else:
+            free_pages = [i for i in self.pages_list if i['tab_count'] < self.max_chrome_tab]
+            page_dict = min(free_pages, key=lambda i: i['tab_count']) if free_pages else None
+        if page_dict:
+            page_dict['tab_count'] += 1
+            return page_dict['page']
+        cpus = self.cpu_sets[len(self.pages_list) % len(self.cpu_sets)] if self.cpu_sets else None
+        page = self.launch_page(cpus)
+        self.pages_list.append({'tab_count': 1, 'page': page, 'start_time': round(time.time()), 'cpus': cpus})
         return page
 
-    # 重启chromium
+    # 浏览器列表
+    def get_pages(self):
+        return [page_dict['page'] for page_dict in self.pages_list]
+
+    # 轮换chromium：新浏览器启动完成前旧浏览器照常工作，之后旧浏览器的标签页在空闲时迁移到新浏览器
     def reload_page(self, page_dict):
         print("重启浏览器")
-        chrome = Chrome(settings=self.settings, proxy_need=self.proxy_need if not self.local else False)
-        old_page = page_dict['page']
-        page = chrome.get_chrome()
-        page.browser.driver.set_callback('Target.targetCreated', self.target_create_callback, immediate=True)
-        for chrome_dict in self.chrome_list:
-            if chrome_dict['page'] == old_page:
-                chrome_dict['page'] = page
-                while True:
-                    r_chrome_dict = self.chrome_free_queue.get()
-                    if r_chrome_dict == chrome_dict:
-                        self.reload_chrome(r_chrome_dict, immediately=True)
-                        self.chrome_free_queue.put(r_chrome_dict)
-                        break
-                    self.chrome_free_queue.put(r_chrome_dict)
+        page = self.launch_page(page_dict.get('cpus'))
+        with self.rotate_lock:
+            old_page = page_dict['page']
+            # 迁移队列：旧浏览器中被释放的标签页
+            migrate_queue = Queue()
+            self.draining_pages[id(old_page)] = migrate_queue
+            page_dict['page'] = page
+            page_dict['start_time'] = round(time.time())
+            remaining = [chrome_dict for chrome_dict in self.chrome_list if chrome_dict['page'] is old_page]
+            # 立即迁移空闲的标签页，在忙的标签页释放后由迁移队列接收
+            for chrome_dict in remaining:
+                if self.tab_scheduler.take_idle(chrome_dict) is not None:
+                    migrate_queue.put(chrome_dict)
+        self.standby_pool.discard_page(old_page)
+        migrated = set()
+        deadline = time.time() + self.rotate_migrate_timeout
+        while len(migrated) < len(remaining):
+            try:
+                chrome_dict = migrate_queue.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                break
+            self._migrate_tab(chrome_dict, page)
+            migrated.add(id(chrome_dict))
+        with self.rotate_lock:
+            del self.draining_pages[id(old_page)]
+        # 超时前刚释放的标签页照常迁移
+        while not migrate_queue.empty():
+            chrome_dict = migrate_queue.get_nowait()
+            self._migrate_tab(chrome_dict, page)
+            migrated.add(id(chrome_dict))
+        # 超时仍在忙的标签页强制迁移(旧标签页随旧浏览器关闭)，释放后直接回到空闲队列
+        busy = [chrome_dict for chrome_dict in remaining if id(chrome_dict) not in migrated]
+        if busy and self.logger:
+            self.logger.warning(f"轮换浏览器等待标签页释放超时({self.rotate_migrate_timeout}s)，"
+                                f"强制迁移{len(busy)}个在忙标签页")
+        for chrome_dict in busy:
+            # 迁移队列移除后才释放的标签页已回到空闲队列，先取出再迁移
+            idle = self.tab_scheduler.take_idle(chrome_dict) is not None
+            self._migrate_tab(chrome_dict, page, release=idle)
         old_page.quit()
-        page_dict['start_time'] = round(time.time())
-        page_dict['page'] = page
 
-    # 重启超时chromium
+    # 把标签页迁移到新浏览器(release为False时由占用方释放)
+    def _migrate_tab(self, chrome_dict, page, release=True):
+        try:
+            chrome_dict['page'] = page
+            self.reload_chrome(chrome_dict, immediately=True, retire=False)
+        except Exception as e:
+            print(f"迁移标签页有误:{e}")
+        finally:
+            if release:
+                self.tab_scheduler.release(chrome_dict)
+
+    # 重启超时chromium(后台轮换，不阻塞调用线程)
     def reload_free_page(self):
         if not self.reload_page_flag:
             return
         for page_dict in self.pages_list:
-            if time.time() - page_dict['start_time'] > self.max_page_exist_time:
-                self.reload_page(page_dict)
+            if time.time() - page_dict['start_time'] > self.max_page_exist_time and not page_dict.get('rotating'):
+                page_dict['rotating'] = True
+                Thread(target=self._rotate_page, args=(page_dict,), daemon=True).start()
+
+    def _rotate_page(self, page_dict):
+        try:
+            self.reload_page(page_dict)
+        except Exception as e:
+            print(f"重启浏览器有误:{e}")
+        finally:
+            page_dict['rotating'] = False
 
     # 创建chrome
     def create_chrome(self):
@@ -184,69 +275,92 @@ class ChromeCreator:
             id += 1
             self.chrome_list.append(chrome_item)
             # 添加进入空闲队列
-            self.chrome_free_queue.put(chrome_item)
+            self.tab_scheduler.release(chrome_item)
+        if self.standby_pool.enabled:
+            self.standby_pool.start()
 
     # 重启chrome(会重置session_id)
-    def reload_chrome(self, chrome_dict, immediately=False, new_context=None):
+    def reload_chrome(self, chrome_dict, immediately=False, new_context=None, retire=True):
         # 重启页面
         if time.time() - chrome_dict['chrome'].get_chrome_time >= self.max_chrome_exist_time or immediately:
             # 继承start_time
             r_start_time = chrome_dict['chrome'].start_time
-            chrome_dict['chrome'].quit()
             if not self.tab_mode:
+                chrome_dict['chrome'].quit()
                 chrome_dict['chrome'], chrome_dict['page'] = self.get_chrome()
                 chrome_dict['chrome'].start_time = r_start_time
             else:
-                chrome_dict['chrome'] = chrome_dict['page'].new_tab(new_context=True if new_context else False)
+                old_chrome = chrome_dict['chrome']
+                # 优先使用备用标签页，旧标签页交由后台线程关闭
+                chrome = self.standby_pool.take(chrome_dict['page'], new_context=bool(new_context))
+                if retire and self.standby_pool.enabled:
+                    self.standby_pool.retire(old_chrome)
+                else:
+                    old_chrome.quit()
+                if chrome is None:
+                    chrome = chrome_dict['page'].new_tab(new_context=True if new_context else False)
+                # 存活时间从投入使用时开始计算
+                chrome.get_chrome_time = time.time()
+                chrome_dict['chrome'] = chrome
                 # 重置chrome_dict的session_id 当标签页重启时
-                if chrome_dict['session_id'] and chrome_dict['session_id'] in self.chrome_session_id:
-                    self.chrome_session_id.remove(chrome_dict['session_id'])
+                if chrome_dict['session_id']:
+                    self.tab_scheduler.release_session(chrome_dict['session_id'], chrome_dict)
                 chrome_dict['session_id'] = None
+                # 已重启，无需再次重启
+                chrome_dict.pop('session_released', None)
                 chrome_dict['chrome'].start_time = r_start_time
 
     # 获取空闲chrome
-    def get_free_chrome(self, timeout, session_id=None):
+    def get_free_chrome(self, timeout, session_id=None, url=None):
         start_time = time.time()
-        while True:
-            if timeout and time.time() - start_time > timeout:
-                return None
-            if self.chrome_free_queue.empty():
-                time.sleep(0.01)
-                continue
-            chrome_dict = self.chrome_free_queue.get()
-            # 当请求携带session_id && session_id 没有被标签页保持 && 当前标签页没有保持任何状态时
-            if session_id and session_id not in self.chrome_session_id and not chrome_dict['session_id']:
-                chrome_dict['chrome'].start_time = start_time
-                return chrome_dict
-            # 标签页保持
-            elif chrome_dict['session_id'] == session_id:
-                chrome_dict['chrome'].start_time = start_time
-                return chrome_dict
-            # 标签页保持超时
-            elif time.time() - chrome_dict[
-                'last_session_request_time'] > self.settings[
-                'MAX_AFTER_REQUEST_SESSION_TIME'] and session_id not in self.chrome_session_id:
-                chrome_dict['chrome'].start_time = start_time
-                return chrome_dict
-            self.chrome_free_queue.put(chrome_dict)
-
-    # 添加session_id
+        domain = urlparse(url).hostname if url else None
+        chrome_dict = self.tab_scheduler.acquire(timeout, session_id, domain)
+        if chrome_dict is None:
+            return None
+        chrome_dict['chrome'].start_time = start_time
+        return chrome_dict
+
+    # 绑定session_id(已绑定时更新最后请求时间)
     def handle_session_id(self, chrome_dict, session_id):
-        with self.add_session_lock:
-            chrome_dict['last_session_request_time'] = time.time()
-            if session_id in self.chrome_session_id:
-                return
-            self.chrome_session_id.add(session_id)
-            chrome_dict['session_id'] = session_id
-
-    # 放入空闲chrome
+        bound = self.sessions.get(session_id)
+        if bound is not None and bound is not chrome_dict:
+            self.tab_scheduler.release_session(session_id, bound)
+        self.sessions.bind(session_id, chrome_dict)
+
+    # 放入空闲chrome(轮换中浏览器的标签页交由迁移队列)
     def put_free_chrome_queue(self, chrome_dict):
-        self.chrome_free_queue.put(chrome_dict)
+        with self.rotate_lock:
+            migrate_queue = self.draining_pages.get(id(chrome_dict['page']))
+            if migrate_queue is not None:
+                migrate_queue.put(chrome_dict)
+            else:
+                self.tab_scheduler.release(chrome_dict)
 
     # 获取空闲chrome数量
     def get_free_chrome_queue_size(self):
-        return self.chrome_free_queue.qsize()
+        return self.tab_scheduler.free_size()
+
+    # 获取标签页调度统计
+    def get_tab_metrics(self, reset=False):
+        return self.tab_scheduler.get_metrics(reset=reset)
+
+    # 获取各浏览器的标签页统计
+    def get_browser_metrics(self):
+        idle = {}
+        for chrome_dict in self.tab_scheduler.idle_tabs():
+            idle[id(chrome_dict['page'])] = idle.get(id(chrome_dict['page']), 0) + 1
+        metrics = []
+        for page_dict in self.pages_list:
+            page = page_dict['page']
+            tabs = sum(1 for chrome_dict in self.chrome_list if chrome_dict['page'] is page)
+            metrics.append({'process_id': page.process_id, 'tabs': tabs, 'idle': idle.get(id(page), 0),
+                            'busy': tabs - idle.get(id(page), 0), 'cpus': page_dict.get('cpus')})
+        return metrics
+
+    # 获取备用标签页统计
+    def get_standby_metrics(self):
+        return self.standby_pool.stats()
 
-    # 检查session_id是否已添加
-    def check_exist_session_id(self, session_id):
-        return session_id not in self.chrome_session_id
+    # session_id是否被标签页保持
+    def is_session_bound(self, session_id):
+        return session_id in self.sessions
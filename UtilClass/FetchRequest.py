@@ -4,15 +4,18 @@ import copy
 
 from re import search, compile
 from requests.utils import dict_from_cookiejar
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 
 from LessPageEngineer.fetcher import fetcher_settings
 from LessPageEngineer.fetcher.fetcher import Fetcher
 from LessPageEngineer.UtilClass.WebSocketSend import WebSocketClient
-from LessPageEngineer.Utils.Utils import url_pattern_cut, get_brand_new_proxy, cookie_string_to_dict, decode_base64_in_chunks
+from LessPageEngineer.Utils.Utils import url_pattern_cut, get_brand_new_proxy, cookie_string_to_dict, decode_base64
 
 
 class FetchRequest:
+    # keep_proxy请求的最长时间(秒)：等待代理10秒 + 连接/读取各30秒 + 填充
+    KEEP_PROXY_TIMEOUT = 75
+
     def __init__(self, chrome, source_dict=None, call_back_func=None, logger=None, show_log=0):
         self.wait_url_dict = {}
         self.logger = logger
@@ -36,13 +39,27 @@ class FetchRequest:
         self.url = chrome.settings['url']
         # 填充数据
         self.fill_data_flag = False
-        chrome.route._patterns_func.clear()
+        # 等待条件可能变化时的回调(计数器更新、请求失败)
+        self.on_change = None
+        # 计数器未归零的wait_url数量
+        self._outstanding = 0
+        # 请求失败(取消或数据包有误)
+        self.error_event = Event()
+        self._error_reason = None
+        chrome.route.clear_patterns()
+        # 与route共用的链接匹配器，下标与wait_url_dict一一对应
+        self.url_matcher = chrome.route.url_matcher
         self.__init_wait_urls_dict(chrome.route, chrome.settings)
+        self._reset_outstanding()
+        # 初始填充次数，切换页面时恢复
+        self._fill_amounts = [wait_url.get('fill_amount') for wait_url in self.wait_url_dict]
         # network_received_open
         self.network_received_open = not chrome.settings['key_replace'] and not chrome.settings['key_save']
         # 当key_replace or key_save没有开启时，开启network.received
         if self.network_received_open:
             chrome.route.new_work.open_response_received(call_back_func=self.network_response_received)
+        # 请求被取消时检查是否为等待的链接
+        chrome.route.new_work.failed_callback_func = self.request_canceled
 
 
     # 获取代理
@@ -79,18 +96,55 @@ class FetchRequest:
     def error_get_data(self):
         return self.__error_get_data
 
+    # 通知等待条件可能已变化
+    def notify_change(self):
+        if self.on_change:
+            self.on_change()
+
+    # 标记请求失败并通知
+    def _set_error(self, error_reason=None):
+        self.__error_get_data = True
+        if error_reason:
+            self._error_reason = error_reason
+        self.error_event.set()
+        self.notify_change()
+
+    # 计数器减一，计数器归零时更新未完成数量
+    def _count_down(self, wait_url):
+        with self.lock:
+            wait_url['count'] -= 1
+            if wait_url['count'] == 0:
+                self._outstanding -= 1
+
+    # 按当前计数器重新计算未完成数量
+    def _reset_outstanding(self):
+        with self.lock:
+            self._outstanding = sum(1 for wait_url in self.wait_url_dict if wait_url['count'] > 0)
+
+    # Network.loadingFailed(canceled)回调：通过network_ids找到被取消的链接
+    def request_canceled(self, **kwargs):
+        request = self.network_ids.get(kwargs.get('requestId'))
+        if request:
+            self._check_canceled(*request)
+
+    # 被取消的请求匹配到未完成的wait_url(abort的除外)时请求失败
+    def _check_canceled(self, url, data):
+        for wait_url in self.match_wait_urls(url, data):
+            if wait_url.get('abort') != True and wait_url['count'] > 0:
+                if self.show_log >= 1:
+                    self.logger.error(f"{self.address} 有请求被取消了！{url}")
+                self._set_error(f"有请求被取消了！{url}")
+                return
+
     # 添加资源字典&计数器更新
     def add_success_count(self, url, wait_url=None, body=None, data=None, headers=None, status_code=200,
-                          add_source_dict=True, requestId=None):
+                          add_source_dict=True, requestId=None, match_indexes=None):
         if not wait_url:
-            for r_wait_url in self.wait_url_dict:
-                if search(r_wait_url['pattern'], url) and (not r_wait_url.get('body_pattern') or (
-                        r_wait_url.get('body_pattern') and search(r_wait_url['body_pattern'],
-                                                                  data if data else ''))):
-                    wait_url = r_wait_url
-                    break
+            for r_wait_url in self.match_wait_urls(url, data, match_indexes):
+                wait_url = r_wait_url
+                break
         if wait_url:
-            wait_url['count'] -= 1
+            self._count_down(wait_url)
             if self.show_log >= 2:
                 self.logger.debug(f"{self.address}, 拦截到响应:{url} 耗时:{round(time.time() - self.start_time, 2)}")
             if add_source_dict:
@@ -98,8 +152,21 @@ class FetchRequest:
                                          'status_code': status_code, 'data': data, 'requestId': requestId}
         if wait_url:
             self.add_response(wait_url, url, requestId)
+            self.notify_change()
         return wait_url if wait_url else {}
 
+    # 按链接及请求体匹配wait_url
+    # match_indexes为RouteHandler已匹配的下标，为空时重新匹配一次
+    def match_wait_urls(self, url, data=None, match_indexes=None):
+        if match_indexes is None:
+            match_indexes = self.url_matcher.match_all(url)
+        for index in match_indexes:
+            if index >= len(self.wait_url_dict):
+                continue
+            wait_url = self.wait_url_dict[index]
+            if not wait_url.get('body_pattern') or search(wait_url['body_pattern'], data if data else ''):
+                yield wait_url
+
     def add_response(self, wait_urls, url, requestId):
         if wait_urls.get('get_response') != True:
             return
@@ -128,12 +195,13 @@ class FetchRequest:
             if not route.body and 'favicon.ico' not in route.url:
                 if self.show_log >= 1:
                     self.logger.error(f"{route.url} 响应体为空")
-                self.__error_get_data = True
+                self._set_error()
                 return
             else:
                 if str(route.status_code).startswith('2'):
                     wait_url = self.add_success_count(url=route.url, body=route.body, data=route.data,
-                                                      headers=route.response_headers, status_code=route.status_code)
+                                                      headers=route.response_headers, status_code=route.status_code,
+                                                      match_indexes=route.match_indexes)
                     if wait_url.get('modify') and isinstance(wait_url['modify'], dict):
                         _body = route.body.replace(wait_url['modify']['be_replace'].encode(),wait_url['modify']['to_replace'].encode())
                         res = route.fullfillRequest(
@@ -147,115 +215,116 @@ class FetchRequest:
         else:
             # 添加进network_ids 后续判断该请求是否失败
             self.network_ids[route.network_id] =  (route.url, route.data)
+            # 记录前已被取消
+            if route.network_id in self.route.new_work.canceled_list:
+                self._check_canceled(route.url, route.data)
             if self.show_log >= 3:
                 self.logger.info(f"{self.address}, 拦截到请求:{route.url} 耗时：{round(time.time() - self.start_time, 2)}")
             # 添加intercept_urls 后续返回至客户端
             self.intercept_urls.append(
                 {'url': route.url, 'data': route.data, 'headers': copy.deepcopy(route.headers),
                  'method': route.method})
-            for wait_url in self.wait_url_dict:
-                if search(wait_url['pattern'], url) and (not wait_url.get('body_pattern') or (
-                        wait_url.get('body_pattern') and search(wait_url['body_pattern'],
-                                                                route.data if route.data else ''))):
-                    # 获取状态码
-                    status_code = wait_url.get('status_code')
-                    # 有fill_data字段时填充
-                    if wait_url.get('fill_data'):
-                        if wait_url['fill_amount'] <= 0:
-                            continue
-                        # 填充响应头
-                        if wait_url.get('headers') and isinstance(wait_url.get('headers'), dict):
-                            fulfill_headers = wait_url.get('headers')
-                        else:
-                            fulfill_headers = {'origin': '123', 'content-type': 'application/json; charset=utf-8'}
-                        # dict转str
-                        if isinstance(wait_url.get('fill_data'), dict):
-                            fill_data = json.dumps(wait_url.get('fill_data'), ensure_ascii=False)
-                        else:
-                            fill_data = wait_url.get('fill_data')
+            for wait_url in self.match_wait_urls(url, route.data, route.match_indexes):
+                # 获取状态码
+                status_code = wait_url.get('status_code')
+                # 有fill_data字段时填充
+                if wait_url.get('fill_data'):
+                    if wait_url['fill_amount'] <= 0:
+                        continue
+                    # 填充响应头
+                    if wait_url.get('headers') and isinstance(wait_url.get('headers'), dict):
+                        fulfill_headers = wait_url.get('headers')
+                    else:
+                        fulfill_headers = {'origin': '123', 'content-type': 'application/json; charset=utf-8'}
+                    # dict转str
+                    if isinstance(wait_url.get('fill_data'), dict):
+                        fill_data = json.dumps(wait_url.get('fill_data'), ensure_ascii=False)
+                    else:
+                        fill_data = wait_url.get('fill_data')
+                    res = route.fullfillRequest(
+                        # 状态码默认200
+                        responseCode=status_code if status_code else 200, responseHeaders=fulfill_headers,
+                        body=fill_data,
+                        # filldata是否Base64
+                        is_base64=True if wait_url.get('fill_data_b64') else False
+                    )
+                    if self.show_log >= 2:
+                        self.logger.debug(f"{self.address}, 填充请求:{route.url}")
+                    # 填充成功则 res为 {}
+                    if not res and not self.network_received_open:
+                        self.add_success_count(url=url, wait_url=wait_url, add_source_dict=False)
+                    wait_url['fill_amount'] -= 1
+                    return
+                # 有abort字段为True时 禁止该请求
+                elif wait_url.get('abort') == True:
+                    self.add_success_count(wait_url=wait_url, url=url, add_source_dict=False)
+                    if self.show_log >= 2:
+                        self.logger.debug(f"{self.address}, 禁止链接:{route.url}")
+                    route.abort()
+                    return
+                # 有keep_proxy字段时则使用fetch请求
+                elif wait_url.get('keep_proxy') == True:
+                    route.extend_deadline(self.KEEP_PROXY_TIMEOUT)
+                    try:
+                        start_time = time.time()
+                        # 最大等待时间 20s
+                        while not self.proxies:
+                            time.sleep(.1)
+                            if round(time.time() - start_time) > 10:
+                                break
+                        if self.proxies == None:
+                            raise ValueError('保持代理获取超时')
+                        if route.headers.get('Cookie'):
+                            # 更新 self.cookies
+                            self.cookies.update(
+                                cookie_string_to_dict(route.headers['Cookie'])
+                            )
+                            # 删除请求头中的cookie
+                            del route.headers['Cookie']
+                        resp = self.fetch(
+                            url=route.url,
+                            data=route.data,
+                            headers=route.headers,
+                            proxies=self.proxies,
+                            cookies=self.cookies,
+                            method=route.method,
+                            impersonate=wait_url.get('impersonate') if wait_url.get('impersonate') else 'chrome120',
+                            random_ja3=True if wait_url.get('random_ja3') else False,
+                            akamai_fp_random=False,
+                            verify=False,
+                            allow_redirects=False,
+                            timeout=(30, 30)
+                        )
+                        r_cookies = {}
+                        try:
+                            r_cookies = dict_from_cookiejar(resp.cookies)
+                        except Exception as e:
+                            r_cookies = dict(resp.cookies)
+                        self.cookies.update(r_cookies)
+                        # headers必须转dict
                         res = route.fullfillRequest(
-                            # 状态码默认200
-                            responseCode=status_code if status_code else 200, responseHeaders=fulfill_headers,
-                            body=fill_data,
-                            # filldata是否Base64
-                            is_base64=True if wait_url.get('fill_data_b64') else False
+                            # 若响应为3开头的状态码，则不允许填充状态码
+                            responseCode=resp.status_code if not status_code or str(resp.status_code).startswith(
+                                '3') else status_code,
+                            responseHeaders=dict(resp.headers) if not wait_url.get('headers') else wait_url.get(
+                                'headers'), body=resp.content
                         )
                         if self.show_log >= 2:
-                            self.logger.debug(f"{self.address}, 填充请求:{route.url}")
-                        # 填充成功则 res为 {}
+                            self.logger.debug(
+                                f"{self.address} 代理请求数据包成功:{route.url}, 填充状态:{res} 响应状态码:{resp.status_code} 填充状态码:{status_code}")
                         if not res and not self.network_received_open:
-                            self.add_success_count(url=url, wait_url=wait_url, add_source_dict=False)
-                        wait_url['fill_amount'] -= 1
+                            # 添加进soure_dict中
+                            self.add_success_count(wait_url=wait_url, url=route.url, body=resp.content,
+                                                   headers=dict(resp.headers), status_code=resp.status_code,
+                                                   data=route.data)
                         return
-                    # 有abort字段为True时 禁止该请求
-                    elif wait_url.get('abort') == True:
-                        self.add_success_count(wait_url=wait_url, url=url, add_source_dict=False)
-                        if self.show_log >= 2:
-                            self.logger.debug(f"{self.address}, 禁止链接:{route.url}")
+                    except Exception as e:
+                        if self.show_log >= 1:
+                            self.logger.error(
+                                f"{self.address} {route.url}代理请求数据包有误{e}  {self.__error_get_data}")
+                        self._set_error()
                         route.abort()
                         return
-                    # 有keep_proxy字段时则使用fetch请求
-                    elif wait_url.get('keep_proxy') == True:
-                        try:
-                            start_time = time.time()
-                            # 最大等待时间 20s
-                            while not self.proxies:
-                                time.sleep(.1)
-                                if round(time.time() - start_time) > 10:
-                                    break
-                            if self.proxies == None:
-                                raise ValueError('保持代理获取超时')
-                            if route.headers.get('Cookie'):
-                                # 更新 self.cookies
-                                self.cookies.update(
-                                    cookie_string_to_dict(route.headers['Cookie'])
-                                )
-                                # 删除请求头中的cookie
-                                del route.headers['Cookie']
-                            resp = self.fetch(
-                                url=route.url,
-                                data=route.data,
-                                headers=route.headers,
-                                proxies=self.proxies,
-                                cookies=self.cookies,
-                                method=route.method,
-                                impersonate=wait_url.get('impersonate') if wait_url.get('impersonate') else 'chrome120',
-                                random_ja3=True if wait_url.get('random_ja3') else False,
-                                akamai_fp_random=False,
-                                verify=False,
-                                allow_redirects=False,
-                                timeout=(30, 30)
-                            )
-                            r_cookies = {}
-                            try:
-                                r_cookies = dict_from_cookiejar(resp.cookies)
-                            except Exception as e:
-                                r_cookies = dict(resp.cookies)
-                            self.cookies.update(r_cookies)
-                            # headers必须转dict
-                            res = route.fullfillRequest(
-                                # 若响应为3开头的状态码，则不允许填充状态码
-                                responseCode=resp.status_code if not status_code or str(resp.status_code).startswith(
-                                    '3') else status_code,
-                                responseHeaders=dict(resp.headers) if not wait_url.get('headers') else wait_url.get(
-                                    'headers'), body=resp.content
-                            )
-                            if self.show_log >= 2:
-                                self.logger.debug(
-                                    f"{self.address} 代理请求数据包成功:{route.url}, 填充状态:{res} 响应状态码:{resp.status_code} 填充状态码:{status_code}")
-                            if not res and not self.network_received_open:
-                                # 添加进soure_dict中
-                                self.add_success_count(wait_url=wait_url, url=route.url, body=resp.content,
-                                                       headers=dict(resp.headers), status_code=resp.status_code,
-                                                       data=route.data)
-                            return
-                        except Exception as e:
-                            if self.show_log >= 1:
-                                self.logger.error(
-                                    f"{self.address} {route.url}代理请求数据包有误{e}  {self.__error_get_data}")
-                            self.__error_get_data = True
-                            route.abort()
-                            return
             # 请求继续
             route.continue_()
 
@@ -309,32 +378,32 @@ class FetchRequest:
     def clear_count(self):
         for wait_url in self.wait_url_dict:
             wait_url['count'] = 1 if not wait_url.get('amount') else wait_url.get('amount')
+        self._reset_outstanding()
         self.intercept_urls = []
 
-    # 检查计数器是否为0
+    # 切换页面时重置单个页面的状态(计数器、拦截记录、响应、错误)，拦截规则保持不变
+    def reset_page(self):
+        self.__error_get_data = False
+        self._error_reason = None
+        self.error_event.clear()
+        self.network_ids = {}
+        self.source_dict = {}
+        self.route.new_work.clear_canceled_list()
+        for wait_url, fill_amount in zip(self.wait_url_dict, self._fill_amounts):
+            if fill_amount is not None:
+                wait_url['fill_amount'] = fill_amount
+        self.clear_count()
+
+    # 检查计数器是否为0(由计数器及取消回调维护的状态直接判断)
     def check_wait_urls(self):
-        error_reason = None
-        is_pass = True
-        network_ids_copy = copy.copy(self.network_ids)
-        canceled_list_copy = copy.copy(self.route.new_work.canceled_list)
-        for network_id in network_ids_copy.keys():
-            # 拷贝一份出来 防止因读取过程中集合仍然在添加 runtimeError
-            if network_ids_copy[network_id][0] in canceled_list_copy:
-                for wait_url in self.wait_url_dict:
-                    if search(wait_url['pattern'], network_id[1]) and wait_url.get('abort') == True:
-                        continue
-                    if self.show_log >= 1:
-                        # self.logger.error(f"有请求被取消了！{network_id[1]}")
-                        pass
-                    if wait_url['count'] > 0:
-                        self.__error_get_data = True
-                        return False, f"有请求被取消了！{network_id[1]}"
+        if self.error_event.is_set() and self._error_reason:
+            return False, self._error_reason
+        if self._outstanding <= 0:
+            return True, None
         for wait_items in self.wait_url_dict:
             if wait_items['count'] > 0:
-                is_pass = False
-                error_reason = f"条件{wait_items.get('url')}未满足"
-                break
-        return is_pass, error_reason
+                return False, f"条件{wait_items.get('url')}未满足"
+        return True, None
 
     # 搜索source_dict
     def search_source_dict(self, pattern):
@@ -348,7 +417,7 @@ class FetchRequest:
                     response_dict = self.route._driver.run('Network.getResponseBody',
                                                            requestId=self.source_dict[url]['requestId'])
                     if response_dict.get('base64Encoded'):
-                        self.source_dict[url]['body'] = decode_base64_in_chunks(response_dict['body'])
+                        self.source_dict[url]['body'] = decode_base64(response_dict['body'])
                     else:
                         self.source_dict[url]['body'] = response_dict['body'] if isinstance(response_dict['body'],
                                                                                             bytes) else response_dict[
@@ -1,13 +1,16 @@
 import threading
+from collections.abc import Mapping
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 
 import pymongo
 from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo import ReplaceOne
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
-from LessPageEngineer.Settings import MONGO_HOST, MONGO_DB, MONGO_CONNECT
+from LessPageEngineer.Settings import MONGO_HOST, MONGO_DB, MONGO_CONNECT, MONGO_GRIDFS_THRESHOLD
+from LessPageEngineer.UtilClass.BlobStore import MongoBlobStore, LazySourceDict
 
 
 class MongoConnectionPool:
@@ -77,9 +80,22 @@ _mongo_pool_manager = MongoConnectionPool()
 
 
 class MongoCache:
-    """MongoDB缓存管理类，支持连接池和上下文管理器"""
-
-    def __init__(self, host: str = MONGO_HOST, db: str = MONGO_DB, collection: str = MONGO_CONNECT):
+    """
+    MongoDB缓存管理类，支持连接池和上下文管理器
+
+    - {collection}: 每个key一个文档(key、update_time)
+    - {collection}_resources: 每个url一个文档(key、url、headers、status_code、body_hash、body_b64_hash)
+    - 响应体由MongoBlobStore按内容保存，较大的响应体保存在GridFS中
+    """
+
+    def __init__(self, host: str = MONGO_HOST, db: str = MONGO_DB, collection: str = MONGO_CONNECT,
+                 gc_grace_time: int = 3600, gridfs_threshold: int = MONGO_GRIDFS_THRESHOLD, store_b64: bool = False):
+        self._gc_grace_time = gc_grace_time
+        self._store_b64 = store_b64
+        self._gridfs_threshold = gridfs_threshold
+        self._blob_store: Optional[MongoBlobStore] = None
+        self._resources: Optional[Collection] = None
+        self._indexes_created = False
         self._host = host
         self._db_name = db
         self._collection_name = collection
@@ -94,6 +110,21 @@ class MongoCache:
         """初始化MongoDB连接（使用连接池）"""
         self._client = _mongo_pool_manager.get_client(host=self._host)
         self._collection = self._client[self._db_name][self._collection_name]
+        # 响应体按内容去重保存在 {collection}_blobs 中，key文档只保存清单
+        self._blob_store = MongoBlobStore(self._client[self._db_name][f'{self._collection_name}_blobs'],
+                                          gc_grace_time=self._gc_grace_time,
+                                          gridfs_threshold=self._gridfs_threshold,
+                                          store_b64=self._store_b64)
+        self._resources = self._client[self._db_name][f'{self._collection_name}_resources']
+
+    def _ensure_indexes(self):
+        """第一次读写时创建索引"""
+        if self._indexes_created:
+            return
+        self._collection.create_index('key')
+        self._resources.create_index([('key', pymongo.ASCENDING), ('url', pymongo.ASCENDING)], unique=True)
+        self._resources.create_index('url')
+        self._indexes_created = True
 
     def __enter__(self) -> 'MongoCache':
         """上下文管理器入口"""
@@ -133,24 +164,71 @@ class MongoCache:
         })
 
         def _dump():
-            existing = self._collection.count_documents({'key': key})
-            if existing == 0:
-                self._collection.insert_one(source_dict)
-            elif replace:
-                self._collection.replace_one({'key': key}, source_dict, upsert=True)
+            self._ensure_indexes()
+            existing = self._collection.find_one({'key': key}, {'_id': 1})
+            if existing and not replace:
+                return
+            # 先写入响应体及url文档，最后写入key文档，读取时不会读到不完整的key
+            manifest = {}
+            requests = []
+            urls = []
+            for url, item in source_dict.items():
+                if self._blob_store.is_resource(url, item):
+                    resource = self._blob_store.dump_item(item)
+                    resource = {k: v for k, v in resource.items() if k not in ('_id', 'key', 'url')}
+                    resource.update({'key': key, 'url': url})
+                    requests.append(ReplaceOne({'key': key, 'url': url}, resource, upsert=True))
+                    urls.append(url)
+                elif url != '_id':
+                    manifest[url] = item
+            if requests:
+                self._resources.bulk_write(requests, ordered=False)
+            if existing:
+                # 删除本次未保存的url
+                self._resources.delete_many({'key': key, 'url': {'$nin': urls}})
+            self._collection.replace_one({'key': key}, manifest, upsert=True)
+            if existing:
+                # 覆盖后旧的响应体可能不再被引用
+                self.collect_garbage()
 
         self._execute_with_retry(_dump)
 
+    # 旧版数据：url直接保存在key文档中
+    @staticmethod
+    def _is_legacy(doc):
+        return any(isinstance(field, str) and field.startswith('http') for field in doc)
+
     def load_data(self, key: str) -> Optional[Dict[str, Any]]:
-        """从MongoDB加载数据"""
+        """从MongoDB加载数据(包含所有响应体)"""
         if not key or not isinstance(key, str):
             return None
 
         def _load():
-            return self._collection.find_one({'key': key})
+            doc = self._collection.find_one({'key': key})
+            if not doc or self._is_legacy(doc):
+                return self._blob_store.load_manifest(doc)
+            doc.update({resource.pop('url'): resource for resource in self._find_resources(key)})
+            return self._blob_store.load_manifest(doc)
 
         return self._execute_with_retry(_load)
 
+    def load_source_dict(self, key: str) -> Optional[Mapping]:
+        """从MongoDB加载数据，响应体在读取对应url时才加载"""
+        if not key or not isinstance(key, str):
+            return None
+
+        def _load():
+            doc = self._collection.find_one({'key': key})
+            if not doc or self._is_legacy(doc):
+                return self._blob_store.load_manifest(doc)
+            resources = {resource.pop('url'): resource for resource in self._find_resources(key)}
+            return LazySourceDict(doc, resources, self._blob_store)
+
+        return self._execute_with_retry(_load)
+
+    def _find_resources(self, key):
+        return self._resources.find({'key': key}, {'_id': 0, 'key': 0})
+
     def delete_data(self, key: str) -> bool:
         """删除指定key的数据"""
         if not key or not isinstance(key, str):
@@ -158,9 +236,26 @@ class MongoCache:
 
         def _delete():
             result = self._collection.delete_one({'key': key})
+            self._resources.delete_many({'key': key})
             return result.deleted_count > 0
 
-        return self._execute_with_retry(_delete)
+        result = self._execute_with_retry(_delete)
+        if result:
+            self.collect_garbage()
+        return result
+
+    def collect_garbage(self):
+        """后台回收未被引用的响应体"""
+        self._blob_store.collect_garbage_async(self._iter_manifests)
+
+    # 所有key的清单(旧版key文档 + url文档)
+    def _iter_manifests(self):
+        yield from self._collection.find({})
+        # 清单中引用的响应体及base64响应体都需标记
+        for resource in self._resources.find(
+                {'$or': [{'body_hash': {'$exists': True}}, {'body_b64_hash': {'$exists': True}}]},
+                {'url': 1, 'body_hash': 1, 'body_b64_hash': 1}):
+            yield {resource['url']: resource}
 
     def exists(self, key: str) -> bool:
         """检查key是否存在"""
@@ -168,7 +263,7 @@ class MongoCache:
             return False
 
         def _exists():
-            return self._collection.count_documents({'key': key}) > 0
+            return self._collection.find_one({'key': key}, {'_id': 1}) is not None
 
         return self._execute_with_retry(_exists)
 
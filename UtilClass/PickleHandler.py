@@ -1,24 +1,35 @@
 import pickle
 import os
 from datetime import datetime
+
+from LessPageEngineer.UtilClass.BlobStore import LocalBlobStore, LazySourceDict
+
+
 class PickleHandler:
 
-    def __init__(self, folder_path='.\\pickle\\'):
+    def __init__(self, folder_path='.\\pickle\\', gc_grace_time=3600, mmap_min_size=256 * 1024, store_b64=False):
         self.folder_path = folder_path
         if not os.path.exists(self.folder_path):
             os.mkdir(self.folder_path)
+        # 响应体按内容去重保存，.lpe文件只保存清单(url -> 响应体文件、headers、status_code)
+        self.blob_store = LocalBlobStore(self.folder_path, gc_grace_time=gc_grace_time, mmap_min_size=mmap_min_size,
+                                         store_b64=store_b64)
+
+    # key中的 / 替换为 ~ 作为文件名
+    def file_path(self, key):
+        return os.path.join(self.folder_path, key.replace('/', '~') + '.lpe')
 
     def dump(self, data, file_path):
-        with open(os.path.join(self.folder_path , file_path + '.lpe').replace('/','~'), 'wb') as fp:
+        with open(self.file_path(file_path), 'wb') as fp:
             pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
 
     def read(self, file_path):
-        with open(os.path.join(self.folder_path, file_path + '.lpe').replace('/','~'), 'rb') as fp:
+        with open(self.file_path(file_path), 'rb') as fp:
             loaded_data  = pickle.loads(fp.read())
         return loaded_data
 
     def exist(self, key):
-        return os.path.exists(os.path.join(self.folder_path, key + '.lpe').replace('/','~'))
+        return os.path.exists(self.file_path(key))
 
     def dump_data(self, key, source_dict, replace):
         assert isinstance(source_dict, dict), "source_dict非字典"
@@ -27,14 +38,37 @@ class PickleHandler:
             'update_time': datetime.now()
         })
         # 本地文件夹存在且replace不为True时，则不重新写入
-        if not replace and self.exist(key):
+        exist = self.exist(key)
+        if not replace and exist:
             return
-        self.dump(source_dict, key)
+        self.dump(self.blob_store.dump_manifest(source_dict), key)
+        # 覆盖后旧的响应体可能不再被引用
+        if exist:
+            self.collect_garbage()
 
     def load_data(self, key):
         if not self.exist(key):
             return None
-        return self.read(key)
+        return self.blob_store.load_manifest(self.read(key))
+
+    def load_source_dict(self, key):
+        """加载key供RouteHandler使用，只读取清单，响应体在请求对应url时以内存映射方式读取"""
+        if not self.exist(key):
+            return None
+        return LazySourceDict.from_manifest(self.read(key), self.blob_store)
+
+    # 读取所有key的清单
+    def iter_manifests(self):
+        for key in self.list_keys():
+            try:
+                yield self.read(key)
+            except FileNotFoundError:
+                # 已被删除的key
+                continue
+
+    def collect_garbage(self):
+        """后台回收未被引用的响应体"""
+        self.blob_store.collect_garbage_async(self.iter_manifests)
 
     def list_keys(self):
         """列出所有缓存key"""
@@ -48,9 +82,10 @@ class PickleHandler:
 
     def delete_data(self, key):
         """删除指定key的缓存文件"""
-        file_path = os.path.join(self.folder_path, key + '.lpe').replace('/', '~')
+        file_path = self.file_path(key)
         if os.path.exists(file_path):
             os.remove(file_path)
+            self.collect_garbage()
             return True
         return False
 
@@ -1,7 +1,6 @@
 import threading
 import json
 from datetime import datetime
-from re import search
 from typing import Optional, Dict, List, Any, Tuple
 
 import redis
@@ -12,7 +11,7 @@ from LessPageEngineer.UpstreamSettings import (
     CACHE_PROXY_MAIN_KEY, CACHE_PROXY_HEADERS_KEY,
     CACHE_PROXY_BODY_KEY, GLOBAL_PROXY_KEY
 )
-from LessPageEngineer.Utils.Utils import url_pattern_cut, get_local_ip, encode_base64_in_chunks
+from LessPageEngineer.Utils.Utils import url_pattern_cut, get_local_ip, encode_base64_str, UrlMatcher
 
 
 class RedisConnectionPool:
@@ -131,23 +130,21 @@ class RedisCache:
         if not self._check_enabled():
             return
 
-        pattern_list = []
+        url_matcher = UrlMatcher()
         key_list = [i for i in res.keys() if i.startswith('http')]
 
         for wait_url in wait_urls:
             if isinstance(wait_url, str):
-                pattern_list.append(url_pattern_cut(wait_url))
+                url_matcher.add(url_pattern_cut(wait_url))
             elif isinstance(wait_url, dict):
-                pattern_list.append(url_pattern_cut(wait_url['url']))
+                url_matcher.add(url_pattern_cut(wait_url['url']))
 
         def _delete():
             with self._redis_con.pipeline() as pipe:
                 for key in key_list:
-                    for pass_pattern in pattern_list:
-                        if search(pass_pattern, key):
-                            pipe.hdel(self.REDIS_KEY + self.RESPONSE_BODY_KEY, key)
-                            pipe.hdel(self.REDIS_KEY + self.RESPONSE_HEADERS_KEY, key)
-                            break
+                    if url_matcher.search(key):
+                        pipe.hdel(self.REDIS_KEY + self.RESPONSE_BODY_KEY, key)
+                        pipe.hdel(self.REDIS_KEY + self.RESPONSE_HEADERS_KEY, key)
                 pipe.execute()
 
         self._execute_with_retry(_delete)
@@ -176,14 +173,16 @@ class RedisCache:
 
         for key in key_list:
             r_key = key
-            self.drop_cache_headers(source_dict[key])
-            self.add_headers(source_dict[key], source_dict.get('update_time'))
-            header_dict[r_key] = json.dumps(source_dict[key]['headers'], ensure_ascii=False)
+            # 复制响应头后再修改，source_dict为共用的缓存
+            cache_item = {'headers': dict(source_dict[key]['headers'])}
+            self.drop_cache_headers(cache_item)
+            self.add_headers(cache_item, source_dict.get('update_time'))
+            header_dict[r_key] = json.dumps(cache_item['headers'], ensure_ascii=False)
             body = source_dict[key]['body']
-            if isinstance(body, bytes):
-                body_dict[r_key] = encode_base64_in_chunks(body).decode()
+            if source_dict[key].get('body_b64') is not None:
+                body_dict[r_key] = source_dict[key]['body_b64']
             else:
-                body_dict[r_key] = encode_base64_in_chunks(body.encode()).decode()
+                body_dict[r_key] = encode_base64_str(body)
 
         def _upload():
             with self._redis_con.pipeline() as pipe:
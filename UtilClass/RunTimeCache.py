@@ -1,58 +1,223 @@
+import sys
 import time
-from copy import copy
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from types import MappingProxyType
+
+
 class RunTimeCache:
-    def __init__(self, logger):
-        # 本地缓存资源字典
-        self.all_source_dict = {}
+    """
+    运行时缓存(LRU)
+
+    - 按最近使用顺序保存已加载的资源字典，超出max_bytes时淘汰最久未使用的key
+    - 超过expire_time未使用的key由clear_all_source_dict清理
+    - 同一key并发加载时只加载一次，其余请求等待加载结果
+    - 统计命中/未命中/淘汰次数
+    """
+
+    def __init__(self, logger, max_bytes=None, expire_time=300):
+        """
+        :param logger: 日志
+        :param max_bytes: 缓存响应体总大小上限(字节)，为空时不限制
+        :param expire_time: key最大空闲时间(秒)
+        """
+        # 本地缓存资源字典 {key: {'data': source_dict, 'update_time': float, 'size': int}}
+        self.all_source_dict = OrderedDict()
         self.logger = logger
+        self.max_bytes = max_bytes
+        self.expire_time = expire_time
+        self._lock = threading.Lock()
+        # 当前缓存的响应体总大小
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._coalesced = 0
+        # 正在加载的key {key: Future}
+        self._loading = {}
+
+    # 缓存的资源字典由多个任务共用，以只读视图保存
+    @staticmethod
+    def _read_only(source_dict):
+        if isinstance(source_dict, dict):
+            return MappingProxyType(source_dict)
+        return source_dict
+
+    # 计算资源字典中响应体占用的字节数
+    @staticmethod
+    def _size_of(source_dict):
+        size = 0
+        if not source_dict:
+            return size
+        # 按需加载的资源字典自带大小
+        if hasattr(source_dict, 'nbytes'):
+            return source_dict.nbytes
+        for url, item in source_dict.items():
+            if not isinstance(url, str) or not url.startswith('http') or not isinstance(item, dict):
+                continue
+            body = item.get('body')
+            if body is None:
+                continue
+            size += body.nbytes if hasattr(body, 'nbytes') else sys.getsizeof(body)
+        return size
+
+    def __contains__(self, key):
+        """key是否已缓存(不计入命中统计)"""
+        with self._lock:
+            return key in self.all_source_dict
+
+    def __len__(self):
+        return len(self.all_source_dict)
 
     def clear_all_source_dict(self):
-        drop_key = []
-        for key in self.all_source_dict.keys():
-            if time.time() - self.all_source_dict[key]['update_time'] >= 300:
-                drop_key.append(key)
-        # 实际删除过期的缓存
-        if drop_key:
-            self._drop_source_dict(drop_key)
-
-    def _drop_source_dict(self, keys):
-        all_source_dict = copy(self.all_source_dict)
-        if isinstance(keys, list):
-            for key in keys:
-                del all_source_dict[key]
-                self.logger.debug(f"已清除key:{key}, {all_source_dict.get('key')}")
-        else:
-            del all_source_dict[keys]
-            self.logger.debug(f"已清除key:{keys}, {all_source_dict.get('key')}")
-        self.all_source_dict = all_source_dict
+        """清理超过expire_time未使用的key"""
+        now = time.time()
+        with self._lock:
+            drop_key = [key for key, value in self.all_source_dict.items()
+                        if now - value['update_time'] >= self.expire_time]
+            for key in drop_key:
+                self._pop(key)
+                self._expirations += 1
+        for key in drop_key:
+            self.logger.debug(f"已清除key:{key}")
+
+    # 释放资源字典占用的资源(如按需加载的响应体的内存映射)
+    @staticmethod
+    def _release(value):
+        close = getattr(value['data'], 'close', None)
+        if close is not None:
+            close()
+
+    # 删除key(需持有锁)
+    def _pop(self, key):
+        value = self.all_source_dict.pop(key, None)
+        if value:
+            self._bytes -= value['size']
+            self._release(value)
+        return value
+
+    # 淘汰最久未使用的key直至满足max_bytes(需持有锁)
+    def _evict(self):
+        evicted = []
+        while self.max_bytes and self._bytes > self.max_bytes and self.all_source_dict:
+            key, value = self.all_source_dict.popitem(last=False)
+            self._bytes -= value['size']
+            self._release(value)
+            self._evictions += 1
+            evicted.append(key)
+        return evicted
+
+    # 写入key并淘汰超出部分
+    def _store(self, key, source_dict):
+        # 未加载到数据的key不缓存
+        if not source_dict:
+            return
+        size = self._size_of(source_dict)
+        if self.max_bytes and size > self.max_bytes:
+            self.logger.debug(f"key:{key} 大小{size}超出缓存上限{self.max_bytes}，不进行缓存")
+            with self._lock:
+                self._pop(key)
+            return
+        with self._lock:
+            self._pop(key)
+            self.all_source_dict[key] = {'data': self._read_only(source_dict),
+                                         'update_time': round(time.time(), 1), 'size': size}
+            self._bytes += size
+            evicted = self._evict()
+        for evicted_key in evicted:
+            self.logger.debug(f"缓存超出上限，已淘汰key:{evicted_key}")
 
     def search_source_dict(self, key):
         if not key or not isinstance(key, str):
             return None
-        source_dict = self.all_source_dict.get(key, {}).get('data')
-        if source_dict:
-            self.all_source_dict[key]['update_time'] = round(time.time(), 1)
-        return source_dict
+        with self._lock:
+            value = self.all_source_dict.get(key)
+            if not value:
+                self._misses += 1
+                return None
+            self._hits += 1
+            value['update_time'] = round(time.time(), 1)
+            self.all_source_dict.move_to_end(key)
+            return value['data']
 
     def add_source_dict(self, key, source_dict):
-        self.all_source_dict[key] = {'data': source_dict, 'update_time': round(time.time(), 1)}
+        self._store(key, source_dict)
+
+    def get_or_load(self, key, loader):
+        """
+        获取key对应的资源字典，未缓存时调用loader加载并写入缓存
+
+        :param key: 缓存key
+        :param loader: 加载函数 loader(key) -> source_dict
+        :return: 资源字典(只读)，未加载到时返回None
+        """
+        source_dict = self.search_source_dict(key)
+        if source_dict:
+            return source_dict
+        with self._lock:
+            value = self.all_source_dict.get(key)
+            if value:
+                return value['data']
+            future = self._loading.get(key)
+            is_loader = future is None
+            if is_loader:
+                future = self._loading[key] = Future()
+            else:
+                self._coalesced += 1
+        # 等待其他请求的加载结果
+        if not is_loader:
+            return future.result()
+        try:
+            source_dict = self._read_only(loader(key))
+            self._store(key, source_dict)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(source_dict)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return source_dict
 
     def drop_source_dict(self, key):
         if not key or not isinstance(key, str):
             return None
-        if self.all_source_dict.get(key):
-            self._drop_source_dict(key)
+        with self._lock:
+            value = self._pop(key)
+        if value:
+            self.logger.debug(f"已清除key:{key}")
 
     def list_keys(self):
         """列出所有缓存key"""
-        return list(self.all_source_dict.keys())
+        with self._lock:
+            return list(self.all_source_dict.keys())
 
     def update_source_dict(self, key, source_dict):
         """更新指定key的缓存内容"""
         if not key or not isinstance(key, str):
             return False
-        if key in self.all_source_dict:
-            self.all_source_dict[key]['data'] = source_dict
-            self.all_source_dict[key]['update_time'] = round(time.time(), 1)
-            return True
-        return False
+        if key not in self:
+            return False
+        self._store(key, source_dict)
+        return True
+
+    def stats(self):
+        """缓存统计"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'keys': len(self.all_source_dict),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total, 3) if total else 0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'coalesced': self._coalesced,
+                'loading': len(self._loading),
+            }
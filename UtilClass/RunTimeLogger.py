@@ -40,6 +40,15 @@ class RunTimeLogger:
     def show_chrome_free(self):
         free_chrome_num = self.chrome_manger.get_free_chrome_queue_size()
         self.logger.debug(f"标签页空闲数量为:{free_chrome_num} 在忙列表为:{self.chrome_num - free_chrome_num}")
+        metrics = self.chrome_manger.get_tab_metrics(reset=True)
+        self.logger.debug(
+            f"最近{self.time_interval}秒内 排队数量:{metrics['waiting']} 最大排队数量:{metrics['max_waiting']} "
+            f"平均等待耗时:{metrics['wait_time_avg']}秒 最大等待耗时:{metrics['wait_time_max']}秒 "
+            f"累计获取超时:{metrics['timeout']}")
+        for browser in self.chrome_manger.get_browser_metrics():
+            self.logger.debug(
+                f"浏览器进程:{browser['process_id']} 标签页数量:{browser['tabs']} 在忙:{browser['busy']} "
+                f"空闲:{browser['idle']} 绑定CPU:{browser['cpus']}")
 
     def run(self):
         t1 = Thread(target=self.main)
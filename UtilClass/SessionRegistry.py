@@ -0,0 +1,132 @@
+import time
+import heapq
+import threading
+
+
+class SessionRegistry:
+    """
+    session_id与标签页的绑定表
+
+    - session_id -> 标签页(chrome_dict)及最后请求时间，O(1)查询
+    - 后台线程按过期时间依次清除超过expire_time未请求的session，并回调on_expire
+    - 解除绑定(过期/释放)时重置标签页的session_id，并标记session_released(下次使用前重启标签页)
+    """
+
+    def __init__(self, expire_time, on_expire=None):
+        """
+        :param expire_time: session保持的最大空闲时间(秒)
+        :param on_expire: session过期时的回调 on_expire(session_id, chrome_dict)
+        """
+        self.expire_time = expire_time
+        self.on_expire = on_expire
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        # {session_id: {'chrome_dict': chrome_dict, 'last_request_time': float}}
+        self._sessions = {}
+        # 过期时间堆 [(expire_at, session_id)]，最后请求时间更新后在出堆时重新入堆
+        self._heap = []
+        self._thread = None
+        self._expired_count = 0
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """获取session_id绑定的标签页"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session['chrome_dict'] if session else None
+
+    def bind(self, session_id, chrome_dict):
+        """绑定session_id与标签页(已绑定时更新最后请求时间)"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session and session['chrome_dict'] is chrome_dict:
+                session['last_request_time'] = now
+            else:
+                self._sessions[session_id] = {'chrome_dict': chrome_dict, 'last_request_time': now}
+                heapq.heappush(self._heap, (now + self.expire_time, session_id))
+                self._condition.notify()
+            chrome_dict['session_id'] = session_id
+            chrome_dict['last_session_request_time'] = now
+            chrome_dict.pop('session_released', None)
+
+    def touch(self, session_id):
+        """更新session的最后请求时间"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session['last_request_time'] = now
+                session['chrome_dict']['last_session_request_time'] = now
+
+    def unbind(self, session_id, chrome_dict=None):
+        """
+        解除绑定
+
+        :param chrome_dict: 指定时仅在session_id绑定的是该标签页时解除
+        :return: 是否解除
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session or (chrome_dict is not None and session['chrome_dict'] is not chrome_dict):
+                return False
+            del self._sessions[session_id]
+            self._reset_tab(session_id, session['chrome_dict'])
+            return True
+
+    # 重置已解除绑定的标签页(需持有锁)，标签页已绑定其他session时不处理
+    @staticmethod
+    def _reset_tab(session_id, chrome_dict):
+        if chrome_dict.get('session_id') == session_id:
+            chrome_dict['session_id'] = None
+            chrome_dict['session_released'] = True
+
+    def start(self):
+        """启动过期清理线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # 取出已过期的session(需持有锁)，返回 (过期列表, 距下一个过期的时间)
+    def _pop_expired(self, now):
+        expired = []
+        while self._heap:
+            expire_at, session_id = self._heap[0]
+            if expire_at > now:
+                return expired, expire_at - now
+            heapq.heappop(self._heap)
+            session = self._sessions.get(session_id)
+            if not session:
+                continue
+            real_expire_at = session['last_request_time'] + self.expire_time
+            if real_expire_at > now:
+                heapq.heappush(self._heap, (real_expire_at, session_id))
+                continue
+            del self._sessions[session_id]
+            self._reset_tab(session_id, session['chrome_dict'])
+            self._expired_count += 1
+            expired.append((session_id, session['chrome_dict']))
+        return expired, None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                expired, timeout = self._pop_expired(time.time())
+                if not expired:
+                    self._condition.wait(timeout)
+                    continue
+            for session_id, chrome_dict in expired:
+                if self.on_expire:
+                    self.on_expire(session_id, chrome_dict)
+
+    def stats(self):
+        """session统计"""
+        with self._lock:
+            return {'sessions': len(self._sessions), 'expired_sessions': self._expired_count}
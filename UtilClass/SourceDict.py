@@ -0,0 +1,88 @@
+from collections.abc import MutableMapping
+
+
+class SourceDict(MutableMapping):
+    """
+    资源字典的写时覆盖视图
+
+    - base为运行时缓存中共享的资源字典，只读，多个任务共用同一份响应体
+    - 当前任务新截获或清除的资源记录在overlay中，不会污染base
+    """
+
+    __slots__ = ('_base', '_overlay', '_deleted')
+
+    def __init__(self, base=None):
+        """
+        :param base: 共享的资源字典(只读)
+        """
+        self._base = base if base is not None else {}
+        # 当前任务写入的资源
+        self._overlay = {}
+        # 当前任务删除的base中的key
+        self._deleted = set()
+
+    @property
+    def base(self):
+        return self._base
+
+    @property
+    def overlay(self):
+        return self._overlay
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    def get(self, key, default=None):
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            return default
+        return self._base.get(key, default)
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        found = False
+        if key in self._overlay:
+            del self._overlay[key]
+            found = True
+        if key in self._base and key not in self._deleted:
+            self._deleted.add(key)
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return True
+        return key not in self._deleted and key in self._base
+
+    def __iter__(self):
+        yield from self._overlay
+        for key in self._base:
+            if key not in self._overlay and key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        return len(self._overlay) + sum(
+            1 for key in self._base if key not in self._overlay and key not in self._deleted)
+
+    def __repr__(self):
+        return f'SourceDict(base={len(self._base)}, overlay={len(self._overlay)}, deleted={len(self._deleted)})'
+
+    def fork(self):
+        """基于当前视图创建新的视图(共用base，复制overlay)"""
+        source_dict = SourceDict(self._base)
+        source_dict._overlay = dict(self._overlay)
+        source_dict._deleted = set(self._deleted)
+        return source_dict
+
+    def to_dict(self):
+        """导出为普通字典(浅拷贝，响应体不复制)"""
+        return dict(self.items())
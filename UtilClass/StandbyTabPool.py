@@ -0,0 +1,140 @@
+import threading
+
+from collections import deque
+
+
+class StandbyTabPool:
+    """
+    备用标签页池
+
+    - 后台线程为每个浏览器预先创建备用标签页(普通标签页与新上下文标签页分别维护)
+    - 重启标签页时直接取出备用标签页替换，无需在请求线程中创建
+    - 退役的标签页交由后台线程关闭
+    """
+
+    def __init__(self, create_tab, get_pages, tabs_num=0, context_tabs_num=0, logger=None):
+        """
+        :param create_tab: 创建标签页的函数 create_tab(page, new_context) -> tab
+        :param get_pages: 获取需要维护备用标签页的浏览器列表的函数
+        :param tabs_num: 每个浏览器的普通备用标签页数量
+        :param context_tabs_num: 每个浏览器的新上下文备用标签页数量
+        :param logger: 日志
+        """
+        self._create_tab = create_tab
+        self._get_pages = get_pages
+        self._target = {False: tabs_num, True: context_tabs_num}
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        # 备用标签页 {(id(page), new_context): deque([tab])}
+        self._standby = {}
+        # 待关闭的标签页
+        self._retired = deque()
+        self._thread = None
+        self._created = 0
+        self._hits = 0
+        self._misses = 0
+        self._closed = 0
+
+    @property
+    def enabled(self):
+        return any(self._target.values())
+
+    def start(self):
+        """启动后台补充/回收线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._event.set()
+
+    def take(self, page, new_context=False):
+        """
+        取出一个备用标签页
+
+        :param page: 标签页所属的浏览器
+        :param new_context: 是否为新上下文标签页
+        :return: 标签页，没有备用标签页时返回None
+        """
+        with self._lock:
+            tabs = self._standby.get((id(page), bool(new_context)))
+            tab = tabs.popleft() if tabs else None
+            if tab is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        # 通知后台线程补充
+        self._event.set()
+        return tab
+
+    def retire(self, tab):
+        """将标签页交由后台线程关闭"""
+        with self._lock:
+            self._retired.append(tab)
+        self._event.set()
+
+    def discard_page(self, page):
+        """丢弃浏览器的备用标签页(浏览器退出时标签页随之关闭)"""
+        with self._lock:
+            for new_context in (False, True):
+                self._standby.pop((id(page), new_context), None)
+
+    # 关闭退役的标签页
+    def _close_retired(self):
+        while True:
+            with self._lock:
+                if not self._retired:
+                    return
+                tab = self._retired.popleft()
+            try:
+                tab.quit()
+                with self._lock:
+                    self._closed += 1
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"关闭标签页有误: {e}")
+
+    # 补充一个缺少的备用标签页，返回是否有补充
+    def _fill_one(self):
+        for page in self._get_pages():
+            for new_context, target in self._target.items():
+                key = (id(page), new_context)
+                with self._lock:
+                    if len(self._standby.get(key, ())) >= target:
+                        continue
+                try:
+                    tab = self._create_tab(page, new_context)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.warning(f"创建备用标签页有误: {e}")
+                    return False
+                # 创建期间浏览器已被替换(标签页随旧浏览器退出而关闭)
+                if not any(p is page for p in self._get_pages()):
+                    return True
+                with self._lock:
+                    self._standby.setdefault(key, deque()).append(tab)
+                    self._created += 1
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            # 优先关闭退役标签页，每补充一个标签页后重新检查
+            self._close_retired()
+            while self.enabled and self._fill_one():
+                self._close_retired()
+
+    def stats(self):
+        """备用标签页统计"""
+        with self._lock:
+            return {
+                'ready': sum(len(tabs) for (_, new_context), tabs in self._standby.items() if not new_context),
+                'ready_context': sum(len(tabs) for (_, new_context), tabs in self._standby.items() if new_context),
+                'created': self._created,
+                'hits': self._hits,
+                'misses': self._misses,
+                'retiring': len(self._retired),
+                'closed': self._closed,
+            }
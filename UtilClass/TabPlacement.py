@@ -0,0 +1,103 @@
+import os
+import zlib
+
+from collections import Counter
+
+import psutil
+
+# 可选的标签页分配策略
+PLACEMENT_POLICIES = ('fill', 'least_loaded', 'round_robin', 'domain')
+
+
+class TabPlacement:
+    """
+    标签页分配策略(多个浏览器进程之间)
+
+    - fill: 按空闲队列顺序分配(默认，与单浏览器时一致)
+    - least_loaded: 分配在忙标签页最少的浏览器中的标签页
+    - round_robin: 按浏览器轮流分配
+    - domain: 同一域名固定分配到同一浏览器，该浏览器无空闲标签页时按least_loaded分配
+    """
+
+    def __init__(self, policy='fill', get_pages=None):
+        """
+        :param policy: 分配策略，见PLACEMENT_POLICIES
+        :param get_pages: 获取浏览器列表的函数(用于round_robin/domain的浏览器顺序)
+        """
+        assert policy in PLACEMENT_POLICIES, f'TAB_PLACEMENT必须为{PLACEMENT_POLICIES}之一'
+        self.policy = policy
+        self._get_pages = get_pages
+        self._next_index = 0
+
+    @staticmethod
+    def _page_key(chrome_dict):
+        return id(chrome_dict['page'])
+
+    # 各浏览器的在忙标签页数量
+    @staticmethod
+    def busy_counts(all_tabs, idle_tabs):
+        busy = Counter(TabPlacement._page_key(chrome_dict) for chrome_dict in all_tabs)
+        busy.subtract(TabPlacement._page_key(chrome_dict) for chrome_dict in idle_tabs)
+        return busy
+
+    def _least_loaded(self, candidates, busy):
+        return min(candidates, key=lambda chrome_dict: busy.get(self._page_key(chrome_dict), 0))
+
+    def choose(self, candidates, busy, domain=None):
+        """
+        从空闲标签页中选择一个
+
+        :param candidates: 空闲标签页列表(按空闲顺序)
+        :param busy: 各浏览器的在忙标签页数量 {id(page): int}
+        :param domain: 请求的域名
+        :return: chrome_dict
+        """
+        if self.policy == 'fill' or len(candidates) == 1:
+            return candidates[0]
+        if self.policy == 'least_loaded':
+            return self._least_loaded(candidates, busy)
+        page_keys = [id(page) for page in self._get_pages()] if self._get_pages else []
+        if not page_keys:
+            return candidates[0]
+        if self.policy == 'round_robin':
+            for offset in range(len(page_keys)):
+                page_key = page_keys[(self._next_index + offset) % len(page_keys)]
+                for chrome_dict in candidates:
+                    if self._page_key(chrome_dict) == page_key:
+                        self._next_index = (self._next_index + offset + 1) % len(page_keys)
+                        return chrome_dict
+            return candidates[0]
+        # domain
+        if domain:
+            page_key = page_keys[zlib.crc32(domain.encode()) % len(page_keys)]
+            for chrome_dict in candidates:
+                if self._page_key(chrome_dict) == page_key:
+                    return chrome_dict
+        return self._least_loaded(candidates, busy)
+
+
+def split_cpu_sets(browser_num):
+    """将当前进程可用的CPU平均分为browser_num份"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return [None] * browser_num
+    cpus = sorted(os.sched_getaffinity(0))
+    size = max(len(cpus) // browser_num, 1)
+    return [cpus[(i * size) % len(cpus):(i * size) % len(cpus) + size] for i in range(browser_num)]
+
+
+def set_process_affinity(process_id, cpus):
+    """
+    将浏览器主进程及其现有子进程绑定到指定CPU(仅Linux)
+    之后由zygote创建的渲染进程会继承该设置
+
+    :return: 是否设置成功
+    """
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return False
+    process = psutil.Process(int(process_id))
+    for proc in [process] + process.children(recursive=True):
+        try:
+            os.sched_setaffinity(proc.pid, cpus)
+        except (OSError, psutil.Error):
+            pass
+    return True
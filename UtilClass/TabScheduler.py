@@ -0,0 +1,251 @@
+import time
+import threading
+
+from collections import deque
+
+
+class _Waiter:
+    """等待空闲标签页的请求"""
+    __slots__ = ('session_id', 'target', 'condition', 'chrome_dict', 'domain', 'queue')
+
+    def __init__(self, session_id, target, condition, domain=None):
+        self.session_id = session_id
+        # 请求的域名(标签页分配策略使用)
+        self.domain = domain
+        # 指定等待的标签页
+        self.target = target
+        self.condition = condition
+        self.chrome_dict = None
+        # 所在的等待队列
+        self.queue = None
+
+
+class TabScheduler:
+    """
+    空闲标签页调度器
+
+    - 空闲标签页按绑定的session_id建立索引，未绑定的标签页放入公共池
+    - session_id与标签页的绑定由SessionRegistry维护，session过期时其标签页回到公共池
+    - 等待已绑定标签页的请求在该session的队列中排队，标签页释放时直接移交
+    - 其余等待者按到达顺序(FIFO)排队，匹配的标签页释放时直接移交并唤醒对应等待者
+    - 统计排队深度与等待耗时，用于评估TABS_NUM
+    """
+
+    def __init__(self, sessions, placement=None, get_all_tabs=None):
+        """
+        :param sessions: session_id绑定表(SessionRegistry)
+        :param placement: 标签页分配策略(TabPlacement)，为空时按空闲顺序分配
+        :param get_all_tabs: 获取全部标签页的函数(用于计算各浏览器的在忙标签页数量)
+        """
+        self._placement = placement
+        self._get_all_tabs = get_all_tabs
+        self._lock = threading.Lock()
+        self._sessions = sessions
+        # 未绑定session的空闲标签页
+        self._unbound = deque()
+        # 已绑定session的空闲标签页 {session_id: chrome_dict}
+        self._bound = {}
+        # 等待队列
+        self._waiters = deque()
+        # 等待已绑定标签页的队列 {session_id: deque([waiter])}
+        self._session_waiters = {}
+        # 累计统计
+        self._acquire_count = 0
+        self._timeout_count = 0
+        # 窗口统计(get_metrics(reset=True)时清零)
+        self._window_count = 0
+        self._window_wait_time = 0
+        self._window_max_wait_time = 0
+        self._window_max_waiting = 0
+
+    # 标签页绑定的session是否有效
+    def _is_bound(self, chrome_dict):
+        session_id = chrome_dict['session_id']
+        return bool(session_id) and self._sessions.get(session_id) is chrome_dict
+
+    # 标签页是否满足等待者
+    def _matches(self, waiter, chrome_dict):
+        if waiter.target is not None:
+            return waiter.target is chrome_dict
+        if self._is_bound(chrome_dict):
+            # 标签页保持
+            return chrome_dict['session_id'] == waiter.session_id
+        # session_id已被其他标签页保持时只能等待该标签页
+        return not (waiter.session_id and waiter.session_id in self._sessions)
+
+    # 从空闲标签页中取出满足等待者的标签页
+    def _take(self, waiter):
+        if waiter.target is not None:
+            target = waiter.target
+            if target['session_id'] and self._bound.get(target['session_id']) is target:
+                return self._bound.pop(target['session_id'])
+            for chrome_dict in self._unbound:
+                if chrome_dict is target:
+                    self._unbound.remove(chrome_dict)
+                    return chrome_dict
+            return None
+        session_id = waiter.session_id
+        if session_id and session_id in self._sessions:
+            return self._bound.pop(session_id, None)
+        if self._unbound:
+            if self._placement is None or len(self._unbound) == 1:
+                return self._unbound.popleft()
+            chrome_dict = self._placement.choose(self._unbound, self._busy_counts(), waiter.domain)
+            self._unbound.remove(chrome_dict)
+            return chrome_dict
+        return None
+
+    # 各浏览器的在忙标签页数量
+    def _busy_counts(self):
+        if self._get_all_tabs is None:
+            return {}
+        return self._placement.busy_counts(self._get_all_tabs(), list(self._unbound) + list(self._bound.values()))
+
+    def _put(self, chrome_dict):
+        if self._is_bound(chrome_dict) and chrome_dict['session_id'] not in self._bound:
+            self._bound[chrome_dict['session_id']] = chrome_dict
+        else:
+            self._unbound.append(chrome_dict)
+
+    # 等待者所在的队列：session_id已绑定标签页时在该session的队列中排队
+    def _queue_of(self, waiter):
+        if waiter.target is None and waiter.session_id and waiter.session_id in self._sessions:
+            return self._session_waiters.setdefault(waiter.session_id, deque())
+        return self._waiters
+
+    def _remove_waiter(self, waiter):
+        waiter.queue.remove(waiter)
+        if waiter.queue is not self._waiters and not waiter.queue:
+            self._session_waiters.pop(waiter.session_id, None)
+
+    def _wake(self, waiter, chrome_dict):
+        self._remove_waiter(waiter)
+        waiter.chrome_dict = chrome_dict
+        if self._is_bound(chrome_dict):
+            self._sessions.touch(chrome_dict['session_id'])
+        waiter.condition.notify()
+
+    def _waiting_count(self):
+        return len(self._waiters) + sum(len(queue) for queue in self._session_waiters.values())
+
+    # 为等待者分配空闲标签页(各session队列的队首，之后按FIFO顺序)
+    def _serve_waiters(self):
+        for queue in list(self._session_waiters.values()):
+            chrome_dict = self._take(queue[0])
+            if chrome_dict is not None:
+                self._wake(queue[0], chrome_dict)
+        for waiter in list(self._waiters):
+            chrome_dict = self._take(waiter)
+            if chrome_dict is not None:
+                self._wake(waiter, chrome_dict)
+
+    def _wait(self, waiter, deadline):
+        waiter.queue = self._queue_of(waiter)
+        waiter.queue.append(waiter)
+        self._window_max_waiting = max(self._window_max_waiting, self._waiting_count())
+        self._serve_waiters()
+        while waiter.chrome_dict is None:
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                self._remove_waiter(waiter)
+                return None
+            waiter.condition.wait(deadline - now if deadline is not None else None)
+        return waiter.chrome_dict
+
+    def acquire(self, timeout=None, session_id=None, domain=None):
+        """
+        获取空闲标签页
+
+        :param timeout: 最大等待时间(秒)，为空时一直等待
+        :param session_id: 请求携带的session_id
+        :param domain: 请求的域名
+        :return: chrome_dict，超时返回None
+        """
+        start_time = time.time()
+        deadline = start_time + timeout if timeout else None
+        with self._lock:
+            waiter = _Waiter(session_id, None, threading.Condition(self._lock), domain)
+            chrome_dict = self._wait(waiter, deadline)
+            wait_time = time.time() - start_time
+            if chrome_dict is None:
+                self._timeout_count += 1
+            else:
+                self._acquire_count += 1
+            self._window_count += 1
+            self._window_wait_time += wait_time
+            self._window_max_wait_time = max(self._window_max_wait_time, wait_time)
+        return chrome_dict
+
+    def take_idle(self, chrome_dict):
+        """取出指定的空闲标签页(不等待)，标签页在忙时返回None"""
+        with self._lock:
+            return self._take(_Waiter(None, chrome_dict, None))
+
+    def release(self, chrome_dict):
+        """释放标签页，存在匹配的等待者时直接移交"""
+        with self._lock:
+            if self._is_bound(chrome_dict):
+                queue = self._session_waiters.get(chrome_dict['session_id'])
+                if queue:
+                    self._wake(queue[0], chrome_dict)
+                    return
+            for waiter in self._waiters:
+                if self._matches(waiter, chrome_dict):
+                    self._wake(waiter, chrome_dict)
+                    return
+            self._put(chrome_dict)
+
+    def release_session(self, session_id, chrome_dict=None):
+        """
+        解除session_id的绑定(session过期或标签页重启时)
+        空闲的标签页回到公共池，该session的等待者回到公共等待队列的队首
+
+        :param chrome_dict: 指定时仅在session_id绑定的是该标签页时解除
+        """
+        with self._lock:
+            self._sessions.unbind(session_id, chrome_dict)
+            if session_id in self._sessions:
+                return
+            bound = self._bound.pop(session_id, None)
+            if bound is not None:
+                self._unbound.append(bound)
+            queue = self._session_waiters.pop(session_id, None)
+            for waiter in reversed(queue or ()):
+                waiter.queue = self._waiters
+                self._waiters.appendleft(waiter)
+            self._serve_waiters()
+
+    def idle_tabs(self):
+        """空闲标签页列表"""
+        with self._lock:
+            return list(self._unbound) + list(self._bound.values())
+
+    def free_size(self):
+        """空闲标签页数量"""
+        with self._lock:
+            return len(self._unbound) + len(self._bound)
+
+    def get_metrics(self, reset=False):
+        """
+        获取调度统计
+
+        :param reset: 是否清零窗口统计(wait_time_avg/wait_time_max/max_waiting)
+        """
+        with self._lock:
+            metrics = {
+                'free': len(self._unbound) + len(self._bound),
+                'free_session': len(self._bound),
+                'waiting': self._waiting_count(),
+                'max_waiting': self._window_max_waiting,
+                'acquired': self._acquire_count,
+                'timeout': self._timeout_count,
+                'wait_time_avg': round(self._window_wait_time / self._window_count, 3) if self._window_count else 0,
+                'wait_time_max': round(self._window_max_wait_time, 3),
+            }
+            if reset:
+                self._window_count = 0
+                self._window_wait_time = 0
+                self._window_max_wait_time = 0
+                self._window_max_waiting = self._waiting_count()
+        metrics.update(self._sessions.stats())
+        return metrics
@@ -6,15 +6,15 @@ import functools
 import os
 # from PIL import Image
 # from io import BytesIO
-from copy import deepcopy
 from queue import Queue
+from base64 import b64encode
 
 from LessPageEngineer.UtilClass.CDPHandler import  RouteHandler, Runtime
 from LessPageEngineer.UtilClass.FetchRequest import FetchRequest
-from LessPageEngineer.UtilClass.task_components import CookieManager
+from LessPageEngineer.UtilClass.SourceDict import SourceDict
+from LessPageEngineer.UtilClass.task_components import CookieManager, ReadinessEngine, ElementEvaluator
 # from LessPageEngineer.JavaScriptFunc.Slide import SLIDE_FUNC as slide_js
 # from LessPageEngineer.JavaScriptFunc.SlideByClassName import SLIDE_FUNC as slide_js_class
-from LessPageEngineer.Utils.Utils import b64encode
 
 
 # 超时装饰器
@@ -33,13 +33,18 @@ def check_time_out_decorator(func):
                     result = {'status': 'fail', 'message': '超时了', 'error_reason': chrome.error_reason,
                               'step_spend_time': chrome.step_spend_time}
                 return result
+            # 检查前读取版本号，检查期间发生的事件不会被遗漏
+            version = self.readiness.version
             result = func(self, *args, **kwargs)
             if result != None:
                 return result
+            # 等待页面事件唤醒(最长不超过兜底间隔及剩余超时时间)
+            self.readiness.wait(version, self.handle_data['timeout'] - (time.time() - chrome.start_time))
     return wrapper
 
 class TaskHandle:
-    def __init__(self, handle_data, run_time_cache, data_manger, redis_cache, cache_proxy, fetch_show_log, logger, det):
+    def __init__(self, handle_data, run_time_cache, data_manger, redis_cache, cache_proxy, fetch_show_log, logger, det,
+                 readiness_interval=0.5):
         self._handle_data = handle_data
         self.init_handle_data()  # 初始化chrome_class
         self.is_keep_session = False
@@ -62,6 +67,10 @@ class TaskHandle:
         
         # 组件初始化
         self.cookie_manager = CookieManager()
+        # 等待条件的事件唤醒
+        self.readiness = ReadinessEngine(fallback_interval=readiness_interval)
+        # ensure_eles批量检查
+        self.ele_evaluator = ElementEvaluator(self.handle_data.get('ensure_eles'))
 
     # 设定mitmproxy全局代理
     def set_mitmproxy_global_proxy(self):
@@ -146,7 +155,7 @@ class TaskHandle:
 
     # 设置cookies（委托给CookieManager）
     def set_cookies(self):
-        self.cookie_manager.set_cookies(self.handle_data.get('set_cookies'))
+        self.cookie_manager.set_cookies(self.handle_data.get('set_cookies'), self.handle_data.get('url'))
 
     # 重置浏览器所有的TCP(注意是所有！！！！)
     def reset_tcp_connect(self):
@@ -172,24 +181,25 @@ class TaskHandle:
         if self.handle_data.get('disable_network'):
             route.disable_network = True
 
+    # 从持久化缓存加载key，并同步至代理缓存
+    def _load_source_dict(self, key):
+        source_dict = self.data_manger.load_source_dict(key)
+        if source_dict and self.cache_proxy and self.redis_cache:
+            # 使用代理缓存时，需要删除放行链接匹配的缓存
+            self.redis_cache.upload_cache_to_redis(source_dict)
+            wait_urls = self.handle_data.get('wait_urls', [])
+            self.redis_cache.delete_cache_from_redis(source_dict, wait_urls)
+        return source_dict
+
     def _load_route(self, chrome):
         source_dict = None
         # 有线上缓存(初始化)
         if self.handle_data.get('key'):
-            r_source_dict = self.run_time_cache.search_source_dict(self.handle_data['key'])
-            if r_source_dict:
-                source_dict = r_source_dict
-            else:
-                source_dict = self.data_manger.load_data(self.handle_data['key'])
-                self.run_time_cache.add_source_dict(self.handle_data['key'], source_dict)
-                if source_dict and self.cache_proxy and self.redis_cache:
-                    # 使用代理缓存时，需要删除放行链接匹配的缓存
-                    self.redis_cache.upload_cache_to_redis(deepcopy(source_dict))
-                    wait_urls = self.handle_data.get('wait_urls', [])
-                    self.redis_cache.delete_cache_from_redis(source_dict, wait_urls)
+            # 同一key并发请求时只加载一次
+            source_dict = self.run_time_cache.get_or_load(self.handle_data['key'], self._load_source_dict)
         if source_dict:
-            # 使用deepcopy 防止污染source_dict
-            route = RouteHandler(chrome, source_dict=deepcopy(source_dict),
+            # 共用缓存中的资源，新截获的资源写入当前任务的覆盖层，防止污染source_dict
+            route = RouteHandler(chrome, source_dict=SourceDict(source_dict),
                           show_log=0,
                           use_cache_proxy=True if self.cache_proxy else False,
                           get_response=self.handle_data['key_save'] or self.handle_data['key_replace'],
@@ -206,7 +216,7 @@ class TaskHandle:
     # 加载route类
     def load_route(self):
         if (self.handle_data['key_save'] or self.handle_data.get('wait_urls') or self.handle_data[
-            'key_replace'] or self.handle_data.get('key')) and (not self.chrome.route or (self.chrome.route and self.handle_data.get('key') and not self.run_time_cache.search_source_dict(self.handle_data['key']))):
+            'key_replace'] or self.handle_data.get('key')) and (not self.chrome.route or (self.chrome.route and self.handle_data.get('key') and self.handle_data['key'] not in self.run_time_cache)):
             self.chrome.route = self._load_route(self.chrome)
         elif self.chrome.route:
             self._init_route_settings(self.chrome.route)
@@ -224,6 +234,7 @@ class TaskHandle:
             self.chrome.fetch_request = FetchRequest(self.chrome,
                                                      show_log=self.show_log_level,
                                                      logger=self.logger)
+            self.chrome.fetch_request.on_change = self.readiness.notify
 
     # 加载run_time类
     def load_run_time(self):
@@ -234,18 +245,28 @@ class TaskHandle:
         else:
             self.chrome.set.load_mode.none()
 
+    # 复制route的资源字典(SourceDict仅复制覆盖层)
+    @staticmethod
+    def _fork_source_dict(source_dict):
+        if isinstance(source_dict, SourceDict):
+            return source_dict.fork()
+        return SourceDict(dict(source_dict))
+
     # 切换iframe以及route(不稳定，测试)
     def change_iframe_route(self):
         iframe_ele = self.handle_data.get('iframe_ele')
         while True:
+            version = self.readiness.version
             try:
                 if self.chrome.get_frames(iframe_ele):
                     iframe = self.chrome.get_frames(iframe_ele)[0]
                     break
             except Exception as e:
                 pass
+            # iframe插入页面时由DOM变化通知唤醒
+            self.readiness.wait(version, self.readiness.fallback_interval)
         self.chrome.iframe_route = RouteHandler(iframe, driver=iframe._driver,
-                                         source_dict=deepcopy(self.chrome.route.source_dict),
+                                         source_dict=self._fork_source_dict(self.chrome.route.source_dict),
                                          show_log=0,
                                          use_cache_proxy=True if self.cache_proxy else False,
                                          get_response=self.handle_data['key_save'] or self.handle_data['key_replace'],
@@ -253,9 +274,11 @@ class TaskHandle:
         self.chrome.iframe_fetch_request = FetchRequest(self.chrome,
                                                         show_log=self.show_log_level,
                                                         logger=self.logger)
+        self.chrome.iframe_fetch_request.on_change = self.readiness.notify
         self.chrome.iframe = iframe
         self.chrome.iframe_ele = iframe.ele
         self.chrome.iframe_s_eles = iframe.s_eles
+        self.readiness.notify()
         self.logger.debug(f"{self.chrome._target_id[-5:]} 已切换iframe Route")
 
     # 切换请求页面加载模式
@@ -282,6 +305,13 @@ class TaskHandle:
         # 无头模式
         elif 'Headless' in self.chrome.user_agent:
             self.chrome.set.user_agent(self.chrome.user_agent.replace('Headless',''))
+    # 导出route的资源字典(转为普通字典后保存)
+    def _export_source_dict(self):
+        source_dict = self.chrome.route.source_dict
+        if isinstance(source_dict, SourceDict):
+            return source_dict.to_dict()
+        return source_dict
+
     # 获取/生成Key
     def get_key(self):
         key = None
@@ -294,11 +324,11 @@ class TaskHandle:
                 # 更新wait_urls中的响应
                 if self.chrome.fetch_request:
                     source_dict.update(self.chrome.fetch_request.source_dict)
-                self.data_manger.dump_data(key, self.chrome.route.source_dict, self.handle_data['key_replace'])
+                self.data_manger.dump_data(key, self._export_source_dict(), self.handle_data['key_replace'])
         else:
             key = self.handle_data.get('key')
             if self.handle_data.get('key_replace'):
-                self.data_manger.dump_data(key, self.chrome.route.source_dict, self.handle_data['key_replace'])
+                self.data_manger.dump_data(key, self._export_source_dict(), self.handle_data['key_replace'])
         if self.handle_data['key_replace']:
             self.run_time_cache.drop_source_dict(key)
         return key
@@ -335,6 +365,7 @@ class TaskHandle:
             self.chrome.fetch_request = FetchRequest(self.chrome,
                                                      show_log=self.show_log_level,
                                                      source_dict=source_dict, logger=self.logger)
+            self.chrome.fetch_request.on_change = self.readiness.notify
         self.logger.debug(f"{self.chrome._target_id[-5:]} 刷新页面")
         t1 = threading.Thread(target=self.threading_get_url)
         t1.start()
@@ -501,20 +532,31 @@ class TaskHandle:
             else:
                 wait_count = len(wait_eles) - 1
             wait_ele_dict = {}
-            for wait_ele in wait_eles:
+            # c:/x:规则在页面内一次检查，其余规则(或检查失败时)为None
+            evaluated = self.ele_evaluator.evaluate(self.chrome)
+            for wait_ele, checked in zip(wait_eles, evaluated):
                 try:
-                    # 使用两种匹配模式 (仅仅使用s_eles模式可能出现bug，即eles能查找到，但s_eles查找不到的情况)
-                    ele = self.chrome.s_eles(wait_ele['pattern']) or self.chrome.eles(wait_ele['pattern'], timeout=3)
-                    ele = ele[0]
-                    # self.logger.debug(f"获取元素:{wait_ele['pattern']}:{len(ele.text)}")
+                    if checked is not None:
+                        is_found, txt_len = checked
+                        if not is_found:
+                            ele_error_reason = f"条件{wait_ele}不满足"
+                            continue
+                    else:
+                        # 使用两种匹配模式 (仅仅使用s_eles模式可能出现bug，即eles能查找到，但s_eles查找不到的情况)
+                        # 有DOM变化通知时不在eles中等待，由check_time_out_decorator等待下一次变化
+                        ele = self.chrome.s_eles(wait_ele['pattern']) or self.chrome.eles(
+                            wait_ele['pattern'], timeout=0 if self.readiness.dom_events else 3)
+                        ele = ele[0]
+                        txt_len = len(ele.text) if wait_ele.get('ensure_txt_len') else 0
+                    # self.logger.debug(f"获取元素:{wait_ele['pattern']}:{txt_len}")
                     if not wait_ele.get('ensure_txt_len'):
-                        wait_count += 1 if ele else 0
-                        wait_ele_dict[wait_ele['pattern']] = {'load': True} if ele else {'load': False}
+                        wait_count += 1
+                        wait_ele_dict[wait_ele['pattern']] = {'load': True}
                     else:
                         ensure_txt_len = wait_ele.get('ensure_txt_len')
-                        wait_count += 1 if len(ele.text) >= ensure_txt_len else 0
-                        wait_ele_dict[wait_ele['pattern']] = {'load': True, 'txt_len': len(ele.text)} if len(
-                            ele.text) >= ensure_txt_len else {'load': False}
+                        wait_count += 1 if txt_len >= ensure_txt_len else 0
+                        wait_ele_dict[wait_ele['pattern']] = {'load': True, 'txt_len': txt_len} if \
+                            txt_len >= ensure_txt_len else {'load': False}
                     if wait_count >= len(wait_eles):
                         self.chrome.wait_ele_dict = wait_ele_dict
                         is_pass = True
@@ -581,6 +623,8 @@ class TaskHandle:
         self.init_chrome_class(chrome, chrome_session_id)
         # 绑定CookieManager到chrome实例
         self.cookie_manager.bind_chrome(chrome)
+        # 注入DOM变化通知
+        self.readiness.bind_chrome(chrome)
         # self.get_blank_page()
         self._record_step('init_chrome')
         
@@ -643,10 +687,70 @@ class TaskHandle:
         self.step_spend_time['_total'] = round(time.time() - self._start_time, 3)
         return result
 
+    # 停止线程脚本及iframe监听
+    def _finish_run(self):
+        if self.script_thread_stop_event:
+            self.script_thread_stop_event.set()
+        self.focus_iframe_event.set()
+
     # 主函数
     def run(self, chrome):
         result = self._run(chrome)
+        self._finish_run()
+        return result
+
+    # 重置单个页面的状态(route/fetch_request/run_time等保持不变)
+    def _reset_page(self):
+        # 线程模式的script仅用于第一个页面
         if self.script_thread_stop_event:
             self.script_thread_stop_event.set()
-        self.focus_iframe_event.set()
-        return result
\ No newline at end of file
+        # 每个页面单独计算超时及步骤耗时(已返回的结果仍引用之前的字典)
+        self.chrome.start_time = time.time()
+        self._start_time = self._last_step_time = self.chrome.start_time
+        self.step_spend_time = self.chrome.step_spend_time = {}
+        self.chrome.wait_ele_dict = None
+        self.chrome.js_result = None
+        self.chrome.error_reason = None
+        if self.chrome.fetch_request:
+            self.chrome.fetch_request.reset_page()
+
+    # 在已初始化的标签页中加载下一个页面：请求url和/或执行翻页script
+    def _run_page(self, chrome, page):
+        self._reset_page()
+        if page.get('url'):
+            self.handle_data['url'] = page['url']
+            chrome.get(url=page['url'])
+        self._record_step('get_url')
+
+        if page.get('script'):
+            self.handle_data['script'] = page['script']
+            result = self._run_script()
+            if result != True:
+                return result
+        self._record_step('run_script')
+
+        if chrome.fetch_request and chrome.fetch_request.fill_data_flag:
+            result = self.wait_fill_data()
+            if isinstance(result, dict):
+                return result
+        self._record_step('wait_fill_data')
+
+        result = self.rendering_html()
+        self._record_step('rendering_html')
+        self.step_spend_time['_total'] = round(time.time() - self._start_time, 3)
+        return result
+
+    # 流水线：第一个页面与run一致，之后按顺序加载pages，每个页面返回一个结果
+    def run_pages(self, chrome, pages):
+        try:
+            result = self._run(chrome)
+            yield result
+            for page in pages:
+                # 翻页script依赖上一个页面，上一个页面失败时跳过
+                if not page.get('url') and result.get('status') != 'success':
+                    result = {'status': 'fail', 'message': '上一个页面加载失败，跳过翻页', 'step_spend_time': {}}
+                else:
+                    result = self._run_page(chrome, page)
+                yield result
+        finally:
+            self._finish_run()
\ No newline at end of file
@@ -0,0 +1,369 @@
+import sys
+import json
+import time
+import signal
+import threading
+import multiprocessing
+
+from queue import Queue, Empty
+from urllib.parse import quote
+
+import requests
+from waitress import serve
+from flask import Flask, Response, request, jsonify, render_template
+
+
+def run_worker(settings, port, host_port, cache_proxy):
+    """工作进程入口：独立的LessPageEngineeringCreator(各自的Control及浏览器)"""
+    from LessPageEngineer.LessPageEngineeringCreator import LessPageEngineeringCreator
+
+    # 收到SIGTERM时正常退出，使atexit中注册的浏览器关闭函数得以执行
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    settings = dict(settings, WORKER_PROCESS_NUM=0)
+    creator = LessPageEngineeringCreator(settings)
+    creator.serve(port, host_port, cache_proxy, monitor=False)
+
+
+class WorkerSupervisor:
+    """
+    多进程工作模式
+
+    - 启动WORKER_PROCESS_NUM个工作进程，每个进程拥有独立的Control及浏览器(不共用GIL)
+    - 前端调度器通过本机HTTP转发 /uploadUrl：携带session_id的请求固定到同一工作进程，其余请求分配给在忙请求最少的进程
+    - /uploadUrls 批量请求按任务分配工作进程，各进程的子批量并行转发，结果按完成顺序合并返回
+    - /uploadPipeline 流水线请求按/uploadUrl的规则整体转发到一个工作进程，结果原样流式返回
+    - 缓存管理路由由一个工作进程处理(主缓存为共享存储)，修改/删除后通知其余进程清除运行时缓存
+    - 工作进程意外退出时自动重启
+    """
+
+    def __init__(self, creator, worker_num, base_port):
+        """
+        :param creator: LessPageEngineeringCreator对象(前端)
+        :param worker_num: 工作进程数量
+        :param base_port: 第一个工作进程的端口，其余依次递增
+        """
+        self.creator = creator
+        self.settings = creator.settings
+        self.workers = [{'index': i, 'port': base_port + i, 'process': None, 'in_flight': 0, 'requests': 0,
+                         'restarts': 0} for i in range(worker_num)]
+        self._lock = threading.Lock()
+        # session_id固定的工作进程 {session_id: [worker_index, last_request_time]}
+        self._sessions = {}
+        self.session_expire_time = self.settings.get('MAX_AFTER_REQUEST_SESSION_TIME', 9000)
+        self.batch_line_timeout = self.settings.get('BATCH_LINE_TIMEOUT', 600)
+        self._local = threading.local()
+        # 工作进程在前端线程(waitress/监控线程)运行期间启动，fork多线程进程可能导致子进程死锁，统一使用spawn
+        self._context = multiprocessing.get_context('spawn')
+        self.app = Flask(__name__, template_folder=creator.app.template_folder)
+        self._setup_routes()
+
+    def _setup_routes(self):
+        """设置前端路由"""
+
+        @self.app.route('/hello', methods=['GET'])
+        def handle_hello():
+            return 'Hi'
+
+        @self.app.route('/uploadUrl', methods=['POST'])
+        def handle_upload():
+            return self._handle_upload_request()
+
+        @self.app.route('/uploadUrls', methods=['POST'])
+        def handle_upload_batch():
+            return self._handle_upload_batch_request()
+
+        @self.app.route('/uploadPipeline', methods=['POST'])
+        def handle_upload_pipeline():
+            return self._handle_upload_pipeline_request()
+
+        @self.app.route('/stats', methods=['GET'])
+        def handle_stats():
+            return self._handle_stats()
+
+        @self.app.route('/cache', methods=['GET'])
+        def cache_manager_ui():
+            return render_template('cache_manager.html')
+
+        @self.app.route('/cache/keys', methods=['GET'])
+        def list_cache_keys():
+            return self._to_response(self._forward(self._choose_worker(), 'GET', '/cache/keys'))
+
+        @self.app.route('/cache/<path:key>', methods=['GET'])
+        def get_cache(key):
+            return self._to_response(self._forward(self._choose_worker(), 'GET', f'/cache/{quote(key)}'))
+
+        @self.app.route('/cache/<path:key>', methods=['POST', 'DELETE'])
+        def change_cache(key):
+            return self._handle_cache_change(key)
+
+    # ========== 工作进程管理 ==========
+    def _worker_settings(self):
+        # 只传递配置项(大写)，模块等对象无法序列化
+        return {k: v for k, v in self.settings.items() if k.isupper()}
+
+    def _start_worker(self, worker):
+        process = self._context.Process(
+            target=run_worker, daemon=True, name=f"lpe_worker_{worker['index']}",
+            args=(self._worker_settings(), worker['port'], self.creator.host_port, self.creator.cache_proxy))
+        process.start()
+        worker['process'] = process
+        print(f"{'-' * 10} 工作进程{worker['index']}: {process.pid} 端口: {worker['port']} {'-' * 10}")
+
+    def _wait_workers_ready(self, timeout=60):
+        """等待工作进程可以响应/hello，返回未就绪的工作进程下标"""
+        deadline = time.time() + timeout
+        not_ready = []
+        for worker in self.workers:
+            while True:
+                try:
+                    if self._session().get(f"http://127.0.0.1:{worker['port']}/hello", timeout=1).ok:
+                        break
+                except requests.RequestException:
+                    pass
+                if time.time() >= deadline:
+                    not_ready.append(worker['index'])
+                    break
+                time.sleep(0.2)
+        for index in not_ready:
+            worker = self.workers[index]
+            print(f"工作进程{index}(端口: {worker['port']})在{timeout}秒内未就绪，分配到该进程的请求将失败直至其就绪")
+        return not_ready
+
+    # 重启意外退出的工作进程
+    def _check_workers(self):
+        for worker in self.workers:
+            if worker['process'] is not None and not worker['process'].is_alive():
+                print(f"工作进程{worker['index']}已退出(exitcode:{worker['process'].exitcode})，正在重启")
+                with self._lock:
+                    worker['restarts'] += 1
+                    # 该进程保持的session已失效
+                    for session_id in [k for k, v in self._sessions.items() if v[0] == worker['index']]:
+                        del self._sessions[session_id]
+                self._start_worker(worker)
+
+    def _monitor_workers(self):
+        while True:
+            time.sleep(10)
+            self._check_workers()
+
+    def _stop_workers(self):
+        for worker in self.workers:
+            if worker['process'] is not None and worker['process'].is_alive():
+                worker['process'].terminate()
+        for worker in self.workers:
+            if worker['process'] is not None:
+                worker['process'].join(10)
+
+    # ========== 请求分配 ==========
+    def _session(self):
+        # requests.Session按线程复用连接
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _choose_worker(self, session_id=None):
+        """选择工作进程：session_id已固定时使用固定的进程，否则选择在忙请求最少的进程"""
+        now = time.time()
+        with self._lock:
+            for expired_id in [k for k, v in self._sessions.items() if now - v[1] > self.session_expire_time]:
+                del self._sessions[expired_id]
+            if session_id and session_id in self._sessions:
+                self._sessions[session_id][1] = now
+                worker = self.workers[self._sessions[session_id][0]]
+            else:
+                worker = min(self.workers, key=lambda w: (w['in_flight'], w['requests']))
+                if session_id:
+                    self._sessions[session_id] = [worker['index'], now]
+            worker['in_flight'] += 1
+            worker['requests'] += 1
+        return worker
+
+    def _forward(self, worker, method, path, data=None, release=True):
+        """
+        转发请求到工作进程
+
+        :param release: 是否在完成后减少该进程的在忙请求数量(由_choose_worker选择的进程)
+        :return: (响应体bytes, 状态码, Content-Type)
+        """
+        try:
+            resp = self._session().request(method, f"http://127.0.0.1:{worker['port']}{path}", data=data,
+                                           headers={'Content-Type': 'application/json'} if data is not None else None)
+            return resp.content, resp.status_code, resp.headers.get('Content-Type', 'application/json')
+        except requests.RequestException as e:
+            body = jsonify({'status': 'fail', 'message': f"工作进程{worker['index']}不可用: {e}"}).get_data()
+            return body, 503, 'application/json'
+        finally:
+            if release:
+                with self._lock:
+                    worker['in_flight'] -= 1
+
+    @staticmethod
+    def _to_response(result):
+        body, status_code, content_type = result
+        return Response(body, status=status_code, content_type=content_type)
+
+    def _handle_upload_request(self):
+        self.creator.last_request_time = time.time()
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id') if isinstance(data, dict) else None
+        worker = self._choose_worker(session_id if isinstance(session_id, str) else None)
+        # 转发原始请求体，不重新序列化
+        body, status_code, content_type = self._forward(worker, 'POST', '/uploadUrl', data=request.get_data())
+        self.creator.error_continuous = 0 if status_code == 200 else self.creator.error_continuous + 1
+        return Response(body, status=status_code, content_type=content_type)
+
+    def _handle_upload_batch_request(self):
+        """批量请求：每个任务按/uploadUrl的规则选择工作进程，同一进程的任务合并为一个子批量转发"""
+        self.creator.last_request_time = time.time()
+        try:
+            tasks, concurrency = self.creator._parse_batch_data(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        groups = {}
+        for index, task in enumerate(tasks):
+            session_id = task.get('session_id') if isinstance(task, dict) else None
+            worker = self._choose_worker(session_id if isinstance(session_id, str) else None)
+            groups.setdefault(worker['index'], []).append(index)
+        lines = Queue()
+        for worker_index, indexes in groups.items():
+            thread = threading.Thread(target=self._forward_batch, daemon=True,
+                                      args=(self.workers[worker_index], tasks, indexes, concurrency, lines))
+            thread.start()
+
+        def generate():
+            remaining = set(range(len(tasks)))
+            while remaining:
+                try:
+                    index, line = lines.get(timeout=self.batch_line_timeout)
+                except Empty:
+                    # 超时未返回结果的任务直接返回失败，避免客户端一直等待
+                    for index in sorted(remaining):
+                        result = {'status': 'fail', 'message': f'等待结果超过{self.batch_line_timeout}秒'}
+                        yield json.dumps(self.creator._batch_line(index, result, 504), ensure_ascii=False) + '\n'
+                    return
+                if index in remaining:
+                    remaining.discard(index)
+                    yield line
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    def _forward_batch(self, worker, tasks, indexes, concurrency, lines):
+        """
+        转发子批量到工作进程(concurrency为每个工作进程的限制)
+
+        :param indexes: 子批量中的任务在原批量中的下标
+        :param lines: 结果队列，放入(原批量中的下标, 结果行)
+        """
+        pending = set(range(len(indexes)))
+        error_message = None
+        try:
+            data = json.dumps({'tasks': [tasks[index] for index in indexes], 'concurrency': concurrency})
+            with self._session().post(f"http://127.0.0.1:{worker['port']}/uploadUrls", data=data, stream=True,
+                                      headers={'Content-Type': 'application/json'}) as resp:
+                if resp.status_code != 200:
+                    raise requests.RequestException(f'状态码{resp.status_code} {resp.text}')
+                for raw_line in resp.iter_lines():
+                    if not raw_line:
+                        continue
+                    line = json.loads(raw_line)
+                    sub_index = line['index']
+                    # 忽略不属于该子批量或重复返回的下标
+                    if not isinstance(sub_index, int) or sub_index not in pending:
+                        continue
+                    pending.discard(sub_index)
+                    line['index'] = indexes[sub_index]
+                    with self._lock:
+                        worker['in_flight'] -= 1
+                    lines.put((line['index'], json.dumps(line, ensure_ascii=False) + '\n'))
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            error_message = f"工作进程{worker['index']}不可用: {e}"
+        finally:
+            # 未返回结果的任务
+            with self._lock:
+                worker['in_flight'] -= len(pending)
+            for sub_index in sorted(pending):
+                result = {'status': 'fail', 'message': error_message or f"工作进程{worker['index']}未返回结果"}
+                lines.put((indexes[sub_index], json.dumps(self.creator._batch_line(indexes[sub_index], result, 503),
+                                                          ensure_ascii=False) + '\n'))
+
+    def _handle_upload_pipeline_request(self):
+        """流水线请求：整体转发到一个工作进程(同一标签页)，逐行返回"""
+        self.creator.last_request_time = time.time()
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id') if isinstance(data, dict) else None
+        worker = self._choose_worker(session_id if isinstance(session_id, str) else None)
+        try:
+            resp = self._session().post(f"http://127.0.0.1:{worker['port']}/uploadPipeline", data=request.get_data(),
+                                        headers={'Content-Type': 'application/json'}, stream=True)
+        except requests.RequestException as e:
+            with self._lock:
+                worker['in_flight'] -= 1
+            return jsonify({'status': 'fail', 'message': f"工作进程{worker['index']}不可用: {e}"}), 503
+
+        def generate():
+            for line in resp.iter_lines():
+                if line:
+                    yield line + b'\n'
+
+        # 响应结束或客户端断开时释放
+        def release():
+            resp.close()
+            with self._lock:
+                worker['in_flight'] -= 1
+
+        response = Response(generate(), status=resp.status_code,
+                            content_type=resp.headers.get('Content-Type', 'application/x-ndjson'))
+        response.call_on_close(release)
+        return response
+
+    def _handle_cache_change(self, key):
+        """修改/删除缓存：由一个工作进程写入主缓存，之后通知其余工作进程清除该key的运行时缓存"""
+        worker = self._choose_worker()
+        result = self._forward(worker, request.method, f'/cache/{quote(key)}',
+                               data=request.get_data() if request.method == 'POST' else None)
+        if result[1] == 200:
+            for other in self.workers:
+                if other is not worker:
+                    self._forward(other, 'DELETE', f'/runtimeCache/{quote(key)}', release=False)
+        return self._to_response(result)
+
+    def _handle_stats(self):
+        """汇总各工作进程的运行状态"""
+        workers = []
+        for worker in self.workers:
+            body, status_code, _ = self._forward(worker, 'GET', '/stats', release=False)
+            try:
+                stats = json.loads(body).get('data') if status_code == 200 else None
+            except ValueError:
+                stats = None
+            process = worker['process']
+            workers.append({
+                'index': worker['index'],
+                'port': worker['port'],
+                'process_id': process.pid if process else None,
+                'alive': bool(process and process.is_alive()),
+                'in_flight': worker['in_flight'],
+                'requests': worker['requests'],
+                'restarts': worker['restarts'],
+                'stats': stats,
+            })
+        with self._lock:
+            sessions = len(self._sessions)
+        return jsonify({'status': 'success', 'data': {'workers': workers, 'sessions': sessions}}), 200
+
+    def run(self):
+        """启动工作进程及前端调度器"""
+        for worker in self.workers:
+            self._start_worker(worker)
+        self._wait_workers_ready()
+
+        monitor_thread = threading.Thread(target=self._monitor_workers, daemon=True)
+        monitor_thread.start()
+        # 收到SIGTERM时同样关闭工作进程
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            serve(self.app, host='0.0.0.0', port=self.creator.port,
+                  threads=self.settings.get('SERVER_MAX_REQUEST_NUM', 30))
+        finally:
+            self._stop_workers()
@@ -2,5 +2,7 @@
 # 任务处理器的组件模块
 
 from .cookie_manager import CookieManager
+from .readiness import ReadinessEngine
+from .ele_evaluator import ElementEvaluator
 
-__all__ = ['CookieManager']
+__all__ = ['CookieManager', 'ReadinessEngine', 'ElementEvaluator']
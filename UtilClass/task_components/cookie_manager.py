@@ -3,9 +3,25 @@ CookieManager - Cookie和Storage管理组件
 
 负责浏览器Cookie、SessionStorage、LocalStorage的增删改操作
 """
-from typing import Optional, Dict, Any
+import json
+from typing import Optional, Dict, Any, List
 from loguru import logger
 
+# Network.setCookies支持的cookie字段(expiry/expires单独处理)
+COOKIE_PARAM_KEYS = ('name', 'value', 'url', 'domain', 'path', 'secure', 'httpOnly', 'sameSite',
+                     'expires', 'expiry', 'priority', 'sameParty', 'sourceScheme', 'sourcePort', 'partitionKey')
+
+# 一次Runtime.evaluate写入全部Storage项，值为null时删除该项
+STORAGE_SCRIPT = """(function(items){
+    for (const [name, data] of items) {
+        const storage = window[name];
+        for (const key in data) {
+            if (data[key] === null) storage.removeItem(key); else storage.setItem(key, data[key]);
+        }
+    }
+    return true;
+})(%s)"""
+
 
 class CookieManager:
     """
@@ -53,18 +69,120 @@ class CookieManager:
             except Exception as e:
                 logger.warning(f"清除cookies失败: {e}")
     
-    def set_cookies(self, cookies: Optional[Any] = None) -> None:
+    def set_cookies(self, cookies: Optional[Any] = None, url: Optional[str] = None) -> None:
         """
-        设置浏览器Cookies
+        设置浏览器Cookies，全部cookie通过一次Network.setCookies设置，失败时回退到DrissionPage逐个设置
         
         Args:
             cookies: 要设置的cookies，格式由DrissionPage决定
+            url: 未指定domain的cookie所属的url，为空时使用当前页面url
         """
-        if cookies and self._chrome:
+        if not cookies or not self._chrome:
+            return
+        try:
+            self._chrome.run_cdp('Network.setCookies', cookies=self._format_cookies(cookies, url))
+            return
+        except Exception as e:
+            logger.debug(f"批量设置cookies失败，逐个设置: {e}")
+        try:
+            self._chrome.set.cookies(cookies)
+        except Exception as e:
+            logger.warning(f"设置cookies失败: {e}")
+    
+    def _format_cookies(self, cookies: Any, url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        将cookies转换为Network.setCookies的CookieParam列表
+        
+        Args:
+            cookies: cookies信息，可为CookieJar, list, tuple, str, dict
+            url: 未指定domain的cookie所属的url
+            
+        Returns:
+            CookieParam列表
+        """
+        from DrissionPage._functions.web import cookies_to_tuple
+        
+        url = url or self._chrome.url
+        result = []
+        for cookie in cookies_to_tuple(cookies):
+            if 'HttpOnly' in cookie:
+                cookie['httpOnly'] = True
+            cookie = {k: v for k, v in cookie.items() if k in COOKIE_PARAM_KEYS}
+            expires = cookie.pop('expiry', None) or cookie.pop('expires', None)
+            if expires:
+                # 日期字符串等无法直接转换的格式交给DrissionPage处理
+                cookie['expires'] = float(expires)
+            value = cookie.get('value')
+            cookie['value'] = '' if value is None else str(value)
+            if cookie['name'].startswith('__Host-'):
+                cookie['path'] = '/'
+                cookie['secure'] = True
+                cookie.pop('domain', None)
+            elif cookie['name'].startswith('__Secure-'):
+                cookie['secure'] = True
+            if not cookie.get('domain') and not cookie.get('url'):
+                if not url or not url.startswith('http'):
+                    raise ValueError(f"cookie未设置domain且没有可用的url: {cookie['name']}")
+                cookie.pop('domain', None)
+                cookie['url'] = url
+            result.append(cookie)
+        return result
+    
+    def set_storages(self, session_storage: Optional[Dict[str, Any]] = None,
+                     local_storage: Optional[Dict[str, Any]] = None) -> None:
+        """
+        通过一次Runtime.evaluate设置SessionStorage和LocalStorage，失败时回退到逐项设置
+        
+        Args:
+            session_storage: SessionStorage键值对字典 {key: value}，值为False时删除该项
+            local_storage: LocalStorage键值对字典 {key: value}，值为False时删除该项
+        """
+        if not self._chrome or not (session_storage or local_storage):
+            return
+        items = [(name, self._format_storage(data)) for name, data in
+                 (('sessionStorage', session_storage), ('localStorage', local_storage)) if data]
+        try:
+            result = self._chrome.run_cdp('Runtime.evaluate', returnByValue=True,
+                                          expression=STORAGE_SCRIPT % json.dumps(items, ensure_ascii=False))
+            if 'exceptionDetails' in result:
+                raise RuntimeError(result['exceptionDetails'].get('text'))
+            return
+        except Exception as e:
+            logger.debug(f"批量设置storage失败，逐项设置: {e}")
+        if session_storage:
+            self._set_storage_items('session_storage', session_storage)
+        if local_storage:
+            self._set_storage_items('local_storage', local_storage)
+    
+    @staticmethod
+    def _format_storage(storage_data: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """
+        将Storage值转换为字符串，False转换为None(删除该项)
+        """
+        result = {}
+        for key, value in storage_data.items():
+            if value is False:
+                result[key] = None
+            elif isinstance(value, str):
+                result[key] = value
+            else:
+                result[key] = json.dumps(value, ensure_ascii=False)
+        return result
+    
+    def _set_storage_items(self, name: str, storage_data: Dict[str, Any]) -> None:
+        """
+        通过DrissionPage逐项设置Storage
+        
+        Args:
+            name: session_storage 或 local_storage
+            storage_data: 键值对字典 {key: value}
+        """
+        setter = getattr(self._chrome.set, name)
+        for key, value in storage_data.items():
             try:
-                self._chrome.set.cookies(cookies)
+                setter(item=key, value=value)
             except Exception as e:
-                logger.warning(f"设置cookies失败: {e}")
+                logger.warning(f"设置{name}[{key}]失败: {e}")
     
     def set_session_storage(self, storage_data: Optional[Dict[str, str]] = None) -> None:
         """
@@ -73,14 +191,7 @@ class CookieManager:
         Args:
             storage_data: 键值对字典 {key: value}
         """
-        if not storage_data or not self._chrome:
-            return
-            
-        for key, value in storage_data.items():
-            try:
-                self._chrome.set.session_storage(item=key, value=value)
-            except Exception as e:
-                logger.warning(f"设置session_storage[{key}]失败: {e}")
+        self.set_storages(session_storage=storage_data)
     
     def set_local_storage(self, storage_data: Optional[Dict[str, str]] = None) -> None:
         """
@@ -89,14 +200,7 @@ class CookieManager:
         Args:
             storage_data: 键值对字典 {key: value}
         """
-        if not storage_data or not self._chrome:
-            return
-            
-        for key, value in storage_data.items():
-            try:
-                self._chrome.set.local_storage(item=key, value=value)
-            except Exception as e:
-                logger.warning(f"设置local_storage[{key}]失败: {e}")
+        self.set_storages(local_storage=storage_data)
     
     def get_cookies(self) -> Optional[Any]:
         """
@@ -154,8 +258,8 @@ class CookieManager:
         """
         # 清除cookies
         self.clear_cookies(handle_data.get('clear_cookies', False))
-        # 设置cookies
-        self.set_cookies(handle_data.get('set_cookies'))
+        # 设置cookies，页面尚未打开时未指定domain的cookie归属任务url
+        self.set_cookies(handle_data.get('set_cookies'), handle_data.get('url'))
     
     def setup_storage(self, handle_data: Dict[str, Any]) -> None:
         """
@@ -166,8 +270,7 @@ class CookieManager:
                 - set_session_storage: 要设置的session_storage
                 - set_local_storage: 要设置的local_storage
         """
-        self.set_session_storage(handle_data.get('set_session_storage'))
-        self.set_local_storage(handle_data.get('set_local_storage'))
+        self.set_storages(handle_data.get('set_session_storage'), handle_data.get('set_local_storage'))
     
     def collect_result(self, handle_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -0,0 +1,96 @@
+"""
+ElementEvaluator - ensure_eles批量检查组件
+
+将ensure_eles中的css(c:)及xpath(x:)规则编译为一个页面内函数，
+一次Runtime.evaluate返回每个规则的 [是否存在, 文本长度]，无需传输并解析整页HTML
+"""
+import json
+from typing import Optional, List, Any
+from loguru import logger
+
+# 支持的规则前缀(与DrissionPage一致) -> 查找方式
+PATTERN_PREFIXES = (
+    ('css:', 'c'), ('css=', 'c'), ('c:', 'c'), ('c=', 'c'),
+    ('xpath:', 'x'), ('xpath=', 'x'), ('x:', 'x'), ('x=', 'x'),
+)
+
+# 按规则查找第一个匹配的节点，需要时计算文本长度，规则有误时返回null(该规则回退到DrissionPage查找)
+EVALUATE_SCRIPT = """(function(items){
+    return items.map(function(item){
+        const [kind, selector, needText] = item;
+        let node;
+        try {
+            node = kind === 'x'
+                ? document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue
+                : document.querySelector(selector);
+        } catch (e) {
+            return null;
+        }
+        if (!node) return [false, 0];
+        if (!needText) return [true, 0];
+        const text = node.nodeType === 1 && typeof node.innerText === 'string' ? node.innerText : node.textContent;
+        return [true, (text || '').length];
+    });
+})(%s)"""
+
+
+class ElementEvaluator:
+    """
+    ensure_eles批量检查器
+
+    职责：
+    - 将c:/x:规则编译为一次Runtime.evaluate
+    - 返回每个规则的检查结果，其他规则或执行失败时返回None，由调用方使用原有方式查找
+    """
+
+    def __init__(self, wait_eles: Optional[List[Any]] = None):
+        """
+        初始化ElementEvaluator
+
+        Args:
+            wait_eles: ensure_eles列表 [{'pattern': str, 'ensure_txt_len': int}]
+        """
+        self.wait_eles = wait_eles if isinstance(wait_eles, list) else []
+        # 与wait_eles一一对应，不支持的规则为None
+        self._items = [self._compile(wait_ele) for wait_ele in self.wait_eles]
+        compiled = [item for item in self._items if item]
+        self.script = EVALUATE_SCRIPT % json.dumps(compiled, ensure_ascii=False) if compiled else None
+
+    @staticmethod
+    def _compile(wait_ele: Any) -> Optional[list]:
+        """
+        将单个规则转换为 [查找方式, 选择器, 是否需要文本长度]
+        """
+        if not isinstance(wait_ele, dict) or not isinstance(wait_ele.get('pattern'), str):
+            return None
+        for prefix, kind in PATTERN_PREFIXES:
+            if wait_ele['pattern'].startswith(prefix):
+                selector = wait_ele['pattern'][len(prefix):]
+                return [kind, selector, bool(wait_ele.get('ensure_txt_len'))] if selector else None
+        return None
+
+    def evaluate(self, chrome) -> List[Optional[list]]:
+        """
+        在页面中一次检查所有规则
+
+        Args:
+            chrome: Chrome浏览器实例
+
+        Returns:
+            与wait_eles一一对应的 [是否存在, 文本长度]，无法检查的规则为None
+        """
+        results = [None] * len(self._items)
+        if not self.script:
+            return results
+        try:
+            result = chrome.run_cdp('Runtime.evaluate', expression=self.script, returnByValue=True)
+            if 'exceptionDetails' in result:
+                raise RuntimeError(result['exceptionDetails'].get('text'))
+            values = iter(result['result']['value'])
+        except Exception as e:
+            logger.debug(f"批量检查ensure_eles失败，逐个查找: {e}")
+            return results
+        for index, item in enumerate(self._items):
+            if item:
+                results[index] = next(values, None)
+        return results
@@ -0,0 +1,130 @@
+"""
+ReadinessEngine - 页面就绪等待组件
+
+等待条件(ensure_eles、wait_urls、fill_data计数等)不再忙循环检查，而是在事件发生后重新检查：
+- FetchRequest的拦截/响应/失败回调
+- 注入页面的MutationObserver通过Runtime.addBinding回调DOM变化
+没有事件时每隔fallback_interval兜底检查一次
+
+绑定函数及MutationObserver只存在于独立的脚本环境(isolated world)中，页面自身的脚本无法检测到
+"""
+import functools
+import threading
+from loguru import logger
+
+# DOM变化回调的绑定名称
+BINDING_NAME = '__lpeReadiness'
+# 注入脚本及绑定函数所在的独立脚本环境名称
+WORLD_NAME = '__lpe_readiness_world'
+
+# 监听DOM变化，节流后调用绑定函数(新文档加载时自动注入，同一文档只注入一次)
+OBSERVER_SCRIPT = """(function(name, delay){
+    if (window.__lpeReadinessObserver) return;
+    let pending = false;
+    const fire = function(){
+        if (pending) return;
+        pending = true;
+        setTimeout(function(){
+            pending = false;
+            try { window[name](''); } catch (e) {}
+        }, delay);
+    };
+    window.__lpeReadinessObserver = new MutationObserver(fire);
+    window.__lpeReadinessObserver.observe(document, {childList: true, subtree: true, characterData: true});
+    document.addEventListener('DOMContentLoaded', fire);
+    window.addEventListener('load', fire);
+    fire();
+})('%s', %d)"""
+
+
+class ReadinessEngine:
+    """
+    页面就绪等待器
+
+    职责：
+    - 维护变化版本号，事件发生时递增并唤醒等待线程
+    - 为标签页注入DOM变化通知(每个标签页只注册一次)
+    - 提供带截止时间的单次等待，替代忙循环
+    """
+
+    def __init__(self, fallback_interval: float = 0.5, throttle: int = 50):
+        """
+        初始化ReadinessEngine
+
+        Args:
+            fallback_interval: 没有事件时兜底重新检查的间隔(秒)
+            throttle: DOM变化通知的节流时间(毫秒)
+        """
+        self.fallback_interval = fallback_interval
+        self.throttle = throttle
+        self._condition = threading.Condition()
+        self._version = 0
+        # 当前标签页是否可接收DOM变化通知
+        self.dom_events = False
+
+    @property
+    def version(self) -> int:
+        """变化版本号，检查条件前读取，等待时传入"""
+        return self._version
+
+    def notify(self) -> None:
+        """有可能影响等待条件的事件发生，唤醒等待线程"""
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """
+        等待版本号变化
+
+        Args:
+            version: 检查条件前读取的版本号，期间已有变化时立即返回
+            timeout: 剩余超时时间(秒)，实际等待不超过fallback_interval
+
+        Returns:
+            是否有新的事件
+        """
+        timeout = max(min(timeout, self.fallback_interval), 0)
+        with self._condition:
+            if self._version == version:
+                self._condition.wait(timeout)
+            return self._version != version
+
+    def bind_chrome(self, chrome) -> 'ReadinessEngine':
+        """
+        绑定Chrome实例，注入DOM变化通知
+
+        Args:
+            chrome: Chrome浏览器实例(标签页复用时仅首次注册绑定及脚本)
+
+        Returns:
+            self，支持链式调用
+        """
+        # 标签页的绑定回调始终转发到当前任务的等待器
+        chrome.readiness = self
+        self.dom_events = False
+        script = OBSERVER_SCRIPT % (BINDING_NAME, self.throttle)
+        try:
+            if not getattr(chrome, 'readiness_bound', False):
+                chrome.run_cdp('Runtime.addBinding', name=BINDING_NAME, executionContextName=WORLD_NAME)
+                chrome.run_cdp('Page.addScriptToEvaluateOnNewDocument', source=script, worldName=WORLD_NAME)
+                chrome.driver.set_callback('Runtime.bindingCalled',
+                                           functools.partial(self._binding_called, chrome))
+                chrome.readiness_bound = True
+                # 注册前已加载的当前文档注入一次，之后的新文档自动注入
+                frame_id = chrome.run_cdp('Page.getFrameTree')['frameTree']['frame']['id']
+                context_id = chrome.run_cdp('Page.createIsolatedWorld', frameId=frame_id,
+                                            worldName=WORLD_NAME)['executionContextId']
+                chrome.run_cdp('Runtime.evaluate', expression=script, contextId=context_id)
+            self.dom_events = True
+        except Exception as e:
+            logger.warning(f"注入DOM变化通知失败，使用间隔检查: {e}")
+        return self
+
+    @staticmethod
+    def _binding_called(chrome, **kwargs):
+        if kwargs.get('name') != BINDING_NAME:
+            return
+        readiness = getattr(chrome, 'readiness', None)
+        if readiness is not None:
+            readiness.notify()
@@ -2,9 +2,10 @@ import requests
 import socket
 import time
 
-from re import compile, findall
+from re import compile, findall, search, error as RegexError, Pattern
+from threading import Lock
 from random import choice
-from base64 import b64encode, b64decode
+from binascii import b2a_base64, a2b_base64
 from urllib.parse import parse_qs
 
 from LessPageEngineer.Settings import IP_PROXYS
@@ -53,22 +54,21 @@ def cookie_string_to_dict(cookie_string):
     return cookies
 
 
-# 流式编码Base64
-def encode_base64_in_chunks(binary_data, chunk_size=1023 * 1023):
-    # 将二进制数据分块
-    chunks = [binary_data[i:i + chunk_size] for i in range(0, len(binary_data), chunk_size)]
-    # 对每个块进行base64编码
-    encoded_data = b''.join([b64encode(chunk).replace(b'\n', b'') for chunk in chunks])
-    return encoded_data
+# 单次编码Base64(binascii一次生成结果，支持bytes/memoryview)
+def encode_base64(binary_data):
+    return b2a_base64(binary_data, newline=False)
 
 
-# 流式解码Base64
-def decode_base64_in_chunks(encoded_data, chunk_size=1024 * 1024):
-    # 将编码后的数据分块
-    chunks = [encoded_data[i:i + chunk_size] for i in range(0, len(encoded_data), chunk_size)]
-    # 对每个块进行base64解码，并合并结果
-    decoded_data = b''.join(b64decode(chunk) for chunk in chunks)
-    return decoded_data
+# 编码Base64并返回str(str按utf-8编码)，用于CDP消息
+def encode_base64_str(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return b2a_base64(data, newline=False).decode('ascii')
+
+
+# 单次解码Base64(支持str/bytes)
+def decode_base64(encoded_data):
+    return a2b_base64(encoded_data)
 
 
 # wait_urls中链接规则转 re.pattern
@@ -81,6 +81,76 @@ def url_pattern_cut(urlPattern):
     return compile(urlPattern)
 
 
+class UrlMatcher:
+    """
+    多规则链接匹配器
+
+    将所有wait_urls规则(经url_pattern_cut转换)合并为一个正则，每条规则对应一个可选的零宽断言分组，
+    一次匹配即可返回所有命中的规则下标
+    """
+
+    def __init__(self, url_patterns=()):
+        self._patterns = []
+        self._combined = None
+        self._group_index = []
+        self._lock = Lock()
+        for url_pattern in url_patterns:
+            self.add(url_pattern)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def add(self, url_pattern):
+        """添加规则(wait_urls写法或已编译的正则)，返回规则下标"""
+        pattern = url_pattern if isinstance(url_pattern, Pattern) else url_pattern_cut(url_pattern)
+        with self._lock:
+            self._patterns.append(pattern)
+            self._combined = None
+            return len(self._patterns) - 1
+
+    def clear(self):
+        with self._lock:
+            self._patterns = []
+            self._combined = None
+
+    def _compile(self):
+        with self._lock:
+            if self._combined is not None:
+                return self._combined, self._patterns, self._group_index
+            parts = []
+            for index, pattern in enumerate(self._patterns):
+                # url_pattern_cut生成的规则均以 ^ 或 .* 开头，在开头处匹配与search等价
+                source = pattern.pattern[1:] if pattern.pattern.startswith('^') else pattern.pattern
+                parts.append(f'(?:(?=(?P<_lpe_{index}>{source})))?')
+            try:
+                combined = compile('^' + ''.join(parts))
+                self._group_index = [combined.groupindex[f'_lpe_{index}'] for index in range(len(self._patterns))]
+            except RegexError:
+                # 规则无法合并时退化为逐条匹配
+                combined = False
+            self._combined = combined
+            return self._combined, self._patterns, self._group_index
+
+    def match_all(self, url):
+        """返回所有命中规则的下标(按添加顺序)"""
+        if not self._patterns or not url:
+            return []
+        combined, patterns, group_index = self._compile()
+        if combined is False:
+            return [index for index, pattern in enumerate(patterns) if search(pattern, url)]
+        regs = combined.match(url).regs
+        return [index for index, group in enumerate(group_index) if regs[group][0] != -1]
+
+    def match_first(self, url):
+        """返回第一个命中规则的下标，未命中返回None"""
+        match_indexes = self.match_all(url)
+        return match_indexes[0] if match_indexes else None
+
+    def search(self, url):
+        """是否命中任意规则"""
+        return bool(self.match_all(url))
+
+
 # 缩减url
 def reduce_url(url, data=None):
     if '?' in url:
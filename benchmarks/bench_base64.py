@@ -0,0 +1,65 @@
+"""
+Base64编解码基准测试
+
+对比旧版分块实现(列表分块 + b64encode + replace + join)与新版binascii单次编解码，
+响应体大小覆盖1KB ~ 100MB
+
+运行方式(在项目上一层目录):
+    python -m LessPageEngineer.benchmarks.bench_base64
+"""
+import os
+import time
+import argparse
+
+from base64 import b64encode, b64decode
+
+import numpy as np
+
+from LessPageEngineer.Utils.Utils import encode_base64, decode_base64
+
+SIZES = [('1KB', 1024), ('64KB', 64 * 1024), ('1MB', 1024 ** 2), ('10MB', 10 * 1024 ** 2), ('100MB', 100 * 1024 ** 2)]
+
+
+# 旧版实现
+def legacy_encode(binary_data, chunk_size=1023 * 1023):
+    chunks = [binary_data[i:i + chunk_size] for i in range(0, len(binary_data), chunk_size)]
+    return b''.join([b64encode(chunk).replace(b'\n', b'') for chunk in chunks])
+
+
+def legacy_decode(encoded_data, chunk_size=1024 * 1024):
+    chunks = [encoded_data[i:i + chunk_size] for i in range(0, len(encoded_data), chunk_size)]
+    return b''.join(b64decode(chunk) for chunk in chunks)
+
+
+def measure(func, data, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Base64编解码基准测试")
+    parser.add_argument('-r', '--rounds', type=int, default=5, help='每个大小的测试轮数')
+    parser.add_argument('--max-size', type=int, default=100, help='最大测试大小(MB)')
+    args = parser.parse_args()
+
+    print(f"{'大小':<6} {'编码(旧)':>12} {'编码(新)':>12} {'加速':>6}   {'解码(旧)':>12} {'解码(新)':>12} {'加速':>6}")
+    for name, size in SIZES:
+        if size > args.max_size * 1024 ** 2:
+            break
+        data = os.urandom(size)
+        encoded = encode_base64(data)
+        assert legacy_encode(data) == encoded
+        assert legacy_decode(encoded) == decode_base64(encoded) == data
+        rounds = args.rounds if size >= 1024 ** 2 else args.rounds * 200
+        enc_old, enc_new = measure(legacy_encode, data, rounds), measure(encode_base64, data, rounds)
+        dec_old, dec_new = measure(legacy_decode, encoded, rounds), measure(decode_base64, encoded, rounds)
+        print(f"{name:<6} {enc_old * 1000:10.3f}ms {enc_new * 1000:10.3f}ms {enc_old / enc_new:5.2f}x   "
+              f"{dec_old * 1000:10.3f}ms {dec_new * 1000:10.3f}ms {dec_old / dec_new:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+缓存填充吞吐量基准测试
+
+对一个5MB的JS文件反复调用fullfillRequest，对比旧版(每次填充时base64编码响应体)
+与新版(使用保存缓存时已编码好的body_b64)的填充吞吐量
+Driver只将CDP消息序列化为json(与发送到浏览器前的处理一致)，不连接浏览器
+
+运行方式(在项目上一层目录):
+    python -m LessPageEngineer.benchmarks.bench_fulfill_b64
+"""
+import json
+import time
+import random
+import string
+import argparse
+
+from LessPageEngineer.BaseClass.CDPBase import FuncClass
+from LessPageEngineer.Utils.Utils import encode_base64
+
+
+class SerializeDriver:
+    """只序列化CDP消息的Driver"""
+
+    def run(self, _method, **kwargs):
+        kwargs.pop('_timeout', None)
+        json.dumps({'id': 1, 'method': _method, 'params': kwargs})
+        return {}
+
+
+def build_js_bundle(size_mb):
+    chars = string.ascii_letters + string.digits + '(){};=.,\n '
+    line = ''.join(random.choice(chars) for _ in range(1024))
+    return line * (size_mb * 1024)
+
+
+def measure(name, fulfill, rounds, size_mb):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fulfill()
+    spend = time.perf_counter() - start
+    print(f"{name:<16} 次数:{rounds:<5} 平均:{spend * 1000 / rounds:8.2f}ms  "
+          f"吞吐量:{rounds / spend:8.1f}次/s  {rounds * size_mb / spend:8.1f}MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存填充吞吐量基准测试")
+    parser.add_argument('-s', '--size', type=int, default=5, help='JS文件大小(MB)')
+    parser.add_argument('-r', '--rounds', type=int, default=50, help='填充次数')
+    args = parser.parse_args()
+
+    body = build_js_bundle(args.size)
+    # 保存缓存时编码一次
+    body_b64 = encode_base64(body.encode()).decode()
+    headers = {'content-type': 'application/javascript'}
+    route = FuncClass(SerializeDriver(), 3, 'bench')
+
+    measure('每次编码(旧)', lambda: route.fullfillRequest(200, headers, body=body), args.rounds, args.size)
+    measure('body_b64(新)', lambda: route.fullfillRequest(200, headers, body=body_b64, is_base64=True),
+            args.rounds, args.size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+本地缓存加载基准测试
+
+构造多个约50MB的缓存key，对比旧版(整个source_dict pickle保存，pickle.loads读取)
+与新版(清单 + 内存映射响应体)加载key的耗时以及加载全部key后的进程内存(RSS)增量
+
+运行方式(在项目上一层目录):
+    python -m LessPageEngineer.benchmarks.bench_local_cache
+"""
+import os
+import gc
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+
+import psutil
+
+from LessPageEngineer.UtilClass.PickleHandler import PickleHandler
+
+
+def build_source_dict(index, total_mb, resources):
+    body_size = total_mb * 1024 * 1024 // resources
+    source_dict = {}
+    for i in range(resources):
+        source_dict[f'https://static.example.com/{index}/{i}.js'] = {
+            'body': os.urandom(body_size),
+            'headers': {'content-type': 'application/javascript'},
+            'status_code': 200,
+        }
+    return source_dict
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+def run(name, load, keys):
+    gc.collect()
+    start_rss = rss_mb()
+    loaded = []
+    start = time.perf_counter()
+    for key in keys:
+        source_dict = load(key)
+        # 模拟RouteHandler读取一个资源
+        next(v for k, v in source_dict.items() if k.startswith('http'))['body'][:1]
+        loaded.append(source_dict)
+    spend = (time.perf_counter() - start) * 1000 / len(keys)
+    print(f"{name:<14} key数量:{len(keys)}  平均加载耗时:{spend:9.2f}ms  RSS增量:{rss_mb() - start_rss:9.2f}MB")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地缓存加载基准测试")
+    parser.add_argument('-k', '--keys', type=int, default=5, help='缓存key数量')
+    parser.add_argument('-s', '--size', type=int, default=50, help='单个key大小(MB)')
+    parser.add_argument('-n', '--resources', type=int, default=50, help='单个key的资源数量')
+    args = parser.parse_args()
+
+    folder_path = tempfile.mkdtemp(prefix='lpe_bench_')
+    try:
+        handler = PickleHandler(os.path.join(folder_path, 'new'))
+        legacy_path = os.path.join(folder_path, 'legacy')
+        os.mkdir(legacy_path)
+        keys = [f'bench_{i}' for i in range(args.keys)]
+        for index, key in enumerate(keys):
+            source_dict = build_source_dict(index, args.size, args.resources)
+            with open(os.path.join(legacy_path, key + '.lpe'), 'wb') as fp:
+                pickle.dump(source_dict, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            handler.dump_data(key, source_dict, True)
+            del source_dict
+
+        def legacy_load(key):
+            with open(os.path.join(legacy_path, key + '.lpe'), 'rb') as fp:
+                return pickle.loads(fp.read())
+
+        loaded = run('pickle(旧)', legacy_load, keys)
+        del loaded
+        run('清单+mmap(新)', handler.load_source_dict, keys)
+    finally:
+        shutil.rmtree(folder_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
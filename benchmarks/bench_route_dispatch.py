@@ -0,0 +1,111 @@
+"""
+请求拦截分发延迟基准测试
+
+模拟一个含有大量子资源的页面：Fetch.requestPaused 事件分批到达，
+对比旧版(队列 + 0.05s轮询消费线程)与新版(CDP回调中直接提交到全局线程池)
+从事件到达到开始处理之间的延迟
+
+运行方式(在项目上一层目录):
+    python -m LessPageEngineer.benchmarks.bench_route_dispatch
+"""
+import time
+import random
+import threading
+import argparse
+
+from queue import Queue
+
+import numpy as np
+
+from LessPageEngineer.UtilClass.CDPHandler import GlobalRouteExecutor
+
+
+class LegacyPollingDispatcher:
+    """旧版分发：回调放入队列，消费线程每0.05s检查一次队列"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.queue = Queue()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._consume, daemon=True)
+        self.thread.start()
+
+    def request_paused(self, handler, kwargs):
+        self.queue.put((handler, kwargs))
+
+    def _consume(self):
+        while not self.stop_event.is_set():
+            if self.queue.empty():
+                time.sleep(0.05)
+                continue
+            handler, kwargs = self.queue.get()
+            self.executor.submit_with_deadline(handler, kwargs, run_timeout=5)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class DirectDispatcher:
+    """新版分发：回调中直接提交到全局线程池"""
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def request_paused(self, handler, kwargs):
+        self.executor.submit_with_deadline(handler, kwargs, run_timeout=5)
+
+    def stop(self):
+        pass
+
+
+def run_page(dispatcher, resources, handle_time):
+    """模拟页面加载：子资源分批暂停，返回每个请求的分发延迟(ms)"""
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def handler(kwargs):
+        with lock:
+            latencies.append((time.perf_counter() - kwargs['paused_at']) * 1000)
+            if len(latencies) == resources:
+                done.set()
+        # 模拟continueRequest/fulfillRequest耗时
+        time.sleep(handle_time)
+
+    sent = 0
+    while sent < resources:
+        # 浏览器按批次发现子资源(html -> css/js -> 图片/接口)
+        batch = min(random.randint(5, 40), resources - sent)
+        for _ in range(batch):
+            dispatcher.request_paused(handler, {'paused_at': time.perf_counter()})
+        sent += batch
+        time.sleep(random.uniform(0.005, 0.03))
+    done.wait(60)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="请求拦截分发延迟基准测试")
+    parser.add_argument('-n', '--resources', type=int, default=300, help='页面子资源数量')
+    parser.add_argument('-r', '--rounds', type=int, default=5, help='测试轮数')
+    parser.add_argument('--handle-time', type=float, default=0.002, help='单个请求处理耗时(秒)')
+    args = parser.parse_args()
+
+    executor = GlobalRouteExecutor()
+    for _ in range(5):
+        executor.register_route()
+
+    for name, dispatcher_class in (('轮询消费(旧)', LegacyPollingDispatcher), ('直接提交(新)', DirectDispatcher)):
+        latencies = []
+        for _ in range(args.rounds):
+            dispatcher = dispatcher_class(executor)
+            latencies.extend(run_page(dispatcher, args.resources, args.handle_time))
+            dispatcher.stop()
+        print(f"{name:<10} 请求数:{len(latencies):<6} "
+              f"平均:{np.mean(latencies):8.2f}ms  P50:{np.percentile(latencies, 50):8.2f}ms  "
+              f"P95:{np.percentile(latencies, 95):8.2f}ms  最大:{np.max(latencies):8.2f}ms")
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+缓存key加载内存/耗时基准测试
+
+构造一个约20MB的缓存key(大量JS/CSS响应体)，模拟每个请求创建RouteHandler时
+对比旧版(deepcopy整个source_dict)与新版(SourceDict共用缓存，仅写入覆盖层)
+的耗时与内存峰值
+
+运行方式(在项目上一层目录):
+    python -m LessPageEngineer.benchmarks.bench_source_dict
+"""
+import os
+import time
+import argparse
+import tracemalloc
+
+from copy import deepcopy
+from types import MappingProxyType
+
+import numpy as np
+
+from LessPageEngineer.UtilClass.SourceDict import SourceDict
+
+
+def build_source_dict(total_mb, resources):
+    """构造缓存资源字典，格式与dump_data保存的一致"""
+    body_size = total_mb * 1024 * 1024 // resources
+    source_dict = {'key': 'bench', 'update_time': None}
+    for i in range(resources):
+        body = os.urandom(body_size) if i % 2 else os.urandom(body_size // 2).hex()
+        source_dict[f'https://static.example.com/assets/{i}.js'] = {
+            'body': body,
+            'headers': {'content-type': 'application/javascript', 'cache-control': 'max-age=3600'},
+            'status_code': 200,
+        }
+    return source_dict
+
+
+def simulate_task(make_source_dict, cache):
+    """创建任务的资源字典，并模拟页面运行中新截获的少量资源"""
+    source_dict = make_source_dict(cache)
+    for i in range(5):
+        source_dict[f'https://api.example.com/data/{i}'] = {'body': b'{}', 'headers': {}, 'status_code': 200}
+    return source_dict
+
+
+def measure(make_source_dict, cache, rounds):
+    times = []
+    peaks = []
+    for _ in range(rounds):
+        tracemalloc.start()
+        start = time.perf_counter()
+        source_dict = simulate_task(make_source_dict, cache)
+        times.append((time.perf_counter() - start) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+        tracemalloc.stop()
+        del source_dict
+    return times, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存key加载内存/耗时基准测试")
+    parser.add_argument('-s', '--size', type=int, default=20, help='缓存key大小(MB)')
+    parser.add_argument('-n', '--resources', type=int, default=200, help='缓存资源数量')
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='测试轮数')
+    args = parser.parse_args()
+
+    cache = MappingProxyType(build_source_dict(args.size, args.resources))
+    for name, make_source_dict in (('deepcopy(旧)', lambda c: deepcopy(dict(c))), ('SourceDict(新)', SourceDict)):
+        times, peaks = measure(make_source_dict, cache, args.rounds)
+        print(f"{name:<14} 缓存:{args.size}MB  平均耗时:{np.mean(times):9.3f}ms  "
+              f"P95:{np.percentile(times, 95):9.3f}ms  内存峰值:{np.mean(peaks):8.2f}MB")
+
+
+if __name__ == '__main__':
+    main()
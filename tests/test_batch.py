@@ -0,0 +1,62 @@
+"""
+批量请求测试
+测试 /uploadUrls 按完成顺序流式返回每个任务的结果
+"""
+import json
+import pytest
+import requests
+
+# 测试服务地址（需要先启动服务）
+BASE_URL = 'http://127.0.0.1:27888'
+
+
+def read_lines(resp):
+    """读取NDJSON响应"""
+    return [json.loads(line) for line in resp.iter_lines() if line]
+
+
+class TestUploadBatch:
+    """批量请求测试"""
+
+    def test_batch_results(self):
+        """测试每个任务返回一行结果，index对应任务下标"""
+        tasks = [{'url': 'https://www.baidu.com', 'timeout': 30} for _ in range(3)]
+
+        with requests.post(f'{BASE_URL}/uploadUrls', json={'tasks': tasks, 'concurrency': 2}, stream=True) as resp:
+            assert resp.status_code == 200
+            assert resp.headers['Content-Type'].startswith('application/x-ndjson')
+            lines = read_lines(resp)
+
+        assert sorted(line['index'] for line in lines) == [0, 1, 2]
+        for line in lines:
+            assert line['status_code'] == 200
+            assert line['result']['status'] == 'success'
+
+    def test_batch_completion_order(self):
+        """测试先完成的任务先返回"""
+        tasks = [
+            {'url': 'https://www.baidu.com', 'timeout': 3, 'ensure_eles': [{'pattern': '#not_exist_element'}]},
+            {'url': 'https://www.baidu.com', 'timeout': 30},
+        ]
+
+        with requests.post(f'{BASE_URL}/uploadUrls', json={'tasks': tasks}, stream=True) as resp:
+            lines = read_lines(resp)
+
+        assert [line['index'] for line in lines] == [1, 0]
+        assert lines[1]['result']['status'] == 'fail'
+
+    def test_batch_task_list(self):
+        """测试直接提交任务列表，非dict任务单独返回错误"""
+        with requests.post(f'{BASE_URL}/uploadUrls', json=[{'url': 'https://www.baidu.com', 'timeout': 30}, 'bad'],
+                           stream=True) as resp:
+            lines = {line['index']: line for line in read_lines(resp)}
+
+        assert lines[0]['result']['status'] == 'success'
+        assert lines[1]['status_code'] == 400
+
+    def test_batch_invalid(self):
+        """测试空任务列表返回400"""
+        resp = requests.post(f'{BASE_URL}/uploadUrls', json={'tasks': []})
+
+        assert resp.status_code == 400
+        assert resp.json()['status'] == 'error'
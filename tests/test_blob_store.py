@@ -0,0 +1,107 @@
+"""
+响应体存储测试
+测试按内容寻址保存的响应体(含base64响应体)回收及内存映射释放(无需启动服务)
+"""
+import pytest
+
+from LessPageEngineer.UtilClass.BlobStore import LocalBlobStore, LazySourceDict
+from LessPageEngineer.UtilClass.MongoCache import MongoCache
+
+
+class ProjectionCollection:
+    """按投影返回字段的集合(只支持_iter_manifests用到的查询)"""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find(self, filter=None, projection=None):
+        for doc in self.docs:
+            if projection:
+                doc = {k: v for k, v in doc.items() if k in projection or k == '_id'}
+            yield doc
+
+
+class TestBlobGarbageCollect:
+    """响应体标记-清除回收测试"""
+
+    @pytest.fixture
+    def blob_store(self, tmp_path):
+        return LocalBlobStore(str(tmp_path), gc_grace_time=0)
+
+    def test_shared_blob_survives(self, blob_store):
+        """测试删除一个key后，仍被其他key引用的响应体保留，孤立的响应体被删除"""
+        shared = 'https://cdn.example.com/jquery.js'
+        manifest_a = blob_store.dump_manifest({
+            shared: {'body': 'jquery', 'headers': {}, 'status_code': 200},
+            'https://a.example.com/app.js': {'body': 'only a', 'headers': {}, 'status_code': 200},
+        })
+        manifest_b = blob_store.dump_manifest({
+            shared: {'body': 'jquery', 'headers': {}, 'status_code': 200},
+        })
+        shared_hash = manifest_a[shared]['body_hash']
+        orphan_hash = manifest_a['https://a.example.com/app.js']['body_hash']
+        assert manifest_b[shared]['body_hash'] == shared_hash
+
+        # 删除key a，只剩key b的清单
+        removed = blob_store.collect_garbage([manifest_b])
+
+        assert removed == 1
+        assert blob_store.get(shared_hash) == b'jquery'
+        assert blob_store.get(orphan_hash) is None
+
+    def test_b64_sidecar_survives(self, tmp_path):
+        """测试store_b64时，仍被引用的base64响应体保留，key删除后一并回收"""
+        blob_store = LocalBlobStore(str(tmp_path), gc_grace_time=0, store_b64=True)
+        manifest = blob_store.dump_manifest({
+            'https://a.example.com/app.js': {'body': 'only a', 'headers': {}, 'status_code': 200},
+        })
+        item = manifest['https://a.example.com/app.js']
+
+        assert blob_store.collect_garbage([manifest]) == 0
+        assert blob_store.load_body_b64(item) == 'b25seSBh'
+
+        assert blob_store.collect_garbage([]) == 2
+        assert blob_store.get(item['body_b64_hash']) is None
+
+    def test_mongo_manifests_keep_b64_sidecar(self, tmp_path):
+        """测试MongoDB模式下url文档的清单包含base64响应体，回收时不被删除"""
+        blob_store = LocalBlobStore(str(tmp_path), gc_grace_time=0, store_b64=True)
+        url = 'https://a.example.com/app.js'
+        item = blob_store.dump_item({'body': 'only a', 'headers': {}, 'status_code': 200})
+        cache = MongoCache.__new__(MongoCache)
+        cache._collection = ProjectionCollection()
+        cache._resources = ProjectionCollection([dict(item, _id=1, key='key_a', url=url)])
+
+        assert blob_store.collect_garbage(cache._iter_manifests()) == 0
+        assert blob_store.load_body_b64(item) == 'b25seSBh'
+
+    def test_grace_time_keeps_new_blob(self, tmp_path):
+        """测试回收保护期内新写入的响应体不会被删除"""
+        blob_store = LocalBlobStore(str(tmp_path), gc_grace_time=3600)
+        manifest = blob_store.dump_manifest({
+            'https://a.example.com/app.js': {'body': 'only a', 'headers': {}, 'status_code': 200},
+        })
+        body_hash = manifest['https://a.example.com/app.js']['body_hash']
+
+        assert blob_store.collect_garbage([]) == 0
+        assert blob_store.get(body_hash) == b'only a'
+
+
+class TestBlobMmap:
+    """响应体内存映射测试"""
+
+    def test_mmap_released_after_close(self, tmp_path):
+        """测试资源字典释放后，响应体的内存映射被关闭"""
+        blob_store = LocalBlobStore(str(tmp_path), mmap_min_size=1024)
+        manifest = blob_store.dump_manifest({
+            'https://cdn.example.com/big.js': {'body': b'x' * 4096, 'headers': {}, 'status_code': 200},
+        })
+        source_dict = LazySourceDict.from_manifest(manifest, blob_store)
+
+        assert isinstance(source_dict['https://cdn.example.com/big.js']['body'], memoryview)
+        assert len(blob_store._maps) == 1
+
+        source_dict.close()
+        assert len(blob_store._maps) == 0
+        # 释放后仍可重新加载
+        assert bytes(source_dict['https://cdn.example.com/big.js']['body']) == b'x' * 4096
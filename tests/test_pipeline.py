@@ -0,0 +1,61 @@
+"""
+流水线请求测试
+测试 /uploadPipeline 在一个标签页中按顺序加载多个页面
+"""
+import json
+import pytest
+import requests
+
+# 测试服务地址（需要先启动服务）
+BASE_URL = 'http://127.0.0.1:27888'
+
+
+def read_lines(resp):
+    """读取NDJSON响应"""
+    return [json.loads(line) for line in resp.iter_lines() if line]
+
+
+class TestUploadPipeline:
+    """流水线请求测试"""
+
+    def test_pipeline_urls(self):
+        """测试按顺序返回每个页面的结果"""
+        post_data = {
+            'url': 'https://www.baidu.com',
+            'timeout': 30,
+            'ensure_eles': [{'pattern': '#su'}],
+            'pages': ['https://www.baidu.com/s?wd=python', {'url': 'https://www.baidu.com'}],
+        }
+
+        with requests.post(f'{BASE_URL}/uploadPipeline', json=post_data, stream=True) as resp:
+            assert resp.status_code == 200
+            assert resp.headers['Content-Type'].startswith('application/x-ndjson')
+            lines = read_lines(resp)
+
+        assert [line['index'] for line in lines] == [0, 1, 2]
+        for line in lines:
+            assert line['result']['status'] == 'success'
+            assert line['result'].get('step_spend_time') is not None
+
+    def test_pipeline_script_page(self):
+        """测试在当前页面执行翻页脚本"""
+        post_data = {
+            'url': 'https://www.baidu.com',
+            'timeout': 30,
+            'run_time': True,
+            'pages': [{'script': [{'run_js': 'document.title = "pipeline"; document.title'}]}],
+        }
+
+        with requests.post(f'{BASE_URL}/uploadPipeline', json=post_data, stream=True) as resp:
+            lines = read_lines(resp)
+
+        assert len(lines) == 2
+        assert lines[1]['result']['status'] == 'success'
+        assert 'pipeline' in json.dumps(lines[1]['result']['js_result'], ensure_ascii=False)
+
+    def test_pipeline_invalid_pages(self):
+        """测试pages格式有误时返回400"""
+        resp = requests.post(f'{BASE_URL}/uploadPipeline', json={'url': 'https://www.baidu.com', 'pages': [1]})
+
+        assert resp.status_code == 400
+        assert resp.json()['status'] == 'error'
@@ -0,0 +1,103 @@
+"""
+请求拦截超时测试
+测试超时的请求只有一方应答，被抢先应答的填充不计入等待链接(无需启动服务)
+"""
+import threading
+
+from loguru import logger
+
+from LessPageEngineer.BaseClass.CDPBase import Request
+from LessPageEngineer.UtilClass.CDPHandler import DeadlineJob
+from LessPageEngineer.UtilClass.FetchRequest import FetchRequest
+from LessPageEngineer.Utils.Utils import UrlMatcher, url_pattern_cut
+
+URL = 'https://api.example.com/data'
+
+
+class RecordDriver:
+    """记录发送的CDP命令"""
+
+    def __init__(self):
+        self.methods = []
+
+    def run(self, _method, **kwargs):
+        self.methods.append(_method)
+        return {}
+
+
+class FakeRoute:
+    """只提供fetch_request用到的属性"""
+
+    class _Network:
+        canceled_list = set()
+
+    new_work = _Network()
+
+
+def expired_job(fail_func):
+    """执行中已超时的任务"""
+    job = DeadlineJob(lambda: None, (), {}, run_timeout=5, fail_func=fail_func)
+    job._state = DeadlineJob.RUNNING
+    job.expire()
+    return job
+
+
+def build_fetch_request(wait_url):
+    fetch_request = FetchRequest.__new__(FetchRequest)
+    fetch_request.logger = logger
+    fetch_request.show_log = 0
+    fetch_request.address = ''
+    fetch_request.start_time = 0
+    fetch_request.lock = threading.Lock()
+    fetch_request.on_change = None
+    fetch_request.network_ids = {}
+    fetch_request.intercept_urls = []
+    fetch_request.source_dict = {}
+    fetch_request.route = FakeRoute()
+    fetch_request.network_received_open = False
+    fetch_request.wait_url_dict = [wait_url]
+    fetch_request.url_matcher = UrlMatcher([url_pattern_cut(URL)])
+    fetch_request._reset_outstanding()
+    return fetch_request
+
+
+class TestExpiredAnswer:
+    """执行中超时的请求测试"""
+
+    def test_fulfill_after_expire(self):
+        """测试超时后填充不再发送，并返回失败"""
+        answers = []
+        driver = RecordDriver()
+        route = Request(driver=driver, requestId='1', request={'url': URL, 'method': 'GET', 'headers': {}})
+        route.answer_guard = expired_job(lambda: answers.append('continue')).claim
+
+        res = route.fullfillRequest(200, {'content-type': 'application/json'}, body='{}')
+
+        assert res
+        assert driver.methods == []
+        assert answers == ['continue']
+
+    def test_expired_fill_data_not_counted(self):
+        """测试被超时处理抢先应答的fill_data不计入等待链接"""
+        wait_url = {'url': URL, 'count': 1, 'fill_data': {'a': 1}, 'fill_amount': 99}
+        fetch_request = build_fetch_request(wait_url)
+        route = Request(driver=RecordDriver(), requestId='1', request={'url': URL, 'method': 'GET', 'headers': {}})
+        route.answer_guard = expired_job(lambda: None).claim
+
+        fetch_request.fetch_request(route, 'route')
+
+        assert wait_url['count'] == 1
+        assert fetch_request._outstanding == 1
+
+    def test_fill_data_counted(self):
+        """测试正常填充的fill_data计入等待链接"""
+        wait_url = {'url': URL, 'count': 1, 'fill_data': {'a': 1}, 'fill_amount': 99}
+        fetch_request = build_fetch_request(wait_url)
+        driver = RecordDriver()
+        route = Request(driver=driver, requestId='1', request={'url': URL, 'method': 'GET', 'headers': {}})
+
+        fetch_request.fetch_request(route, 'route')
+
+        assert driver.methods == ['Fetch.fulfillRequest']
+        assert wait_url['count'] == 0
+        assert fetch_request._outstanding == 0
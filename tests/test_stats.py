@@ -0,0 +1,60 @@
+"""
+运行状态测试
+测试 /stats 接口返回的标签页调度统计
+"""
+import pytest
+import requests
+
+# 测试服务地址（需要先启动服务）
+BASE_URL = 'http://127.0.0.1:27888'
+
+
+class TestTabStats:
+    """标签页调度统计测试"""
+
+    def test_tab_metrics(self):
+        """测试请求后返回标签页排队与等待耗时统计"""
+        post_data = {
+            'url': 'https://www.baidu.com',
+            'timeout': 30,
+        }
+        requests.post(f'{BASE_URL}/uploadUrl', json=post_data)
+
+        resp = requests.get(f'{BASE_URL}/stats')
+        result = resp.json()
+
+        assert result['status'] == 'success'
+        tabs = result['data']['tabs']
+        for field in ('free', 'waiting', 'max_waiting', 'acquired', 'timeout', 'wait_time_avg', 'wait_time_max',
+                      'sessions', 'expired_sessions'):
+            assert field in tabs
+        assert tabs['acquired'] >= 1
+        assert tabs['waiting'] >= 0
+
+    def test_run_time_cache_metrics(self):
+        """测试返回运行时缓存的命中/淘汰统计"""
+        resp = requests.get(f'{BASE_URL}/stats')
+        result = resp.json()
+
+        assert result['status'] == 'success'
+        cache = result['data']['run_time_cache']
+        for field in ('keys', 'bytes', 'max_bytes', 'hits', 'misses', 'hit_rate', 'evictions', 'expirations',
+                      'coalesced', 'loading'):
+            assert field in cache
+        if cache['max_bytes']:
+            assert cache['bytes'] <= cache['max_bytes']
+
+    def test_standby_tab_metrics(self):
+        """测试返回备用标签页统计"""
+        resp = requests.get(f'{BASE_URL}/stats')
+        result = resp.json()
+
+        assert result['status'] == 'success'
+        standby = result['data']['standby_tabs']
+        for field in ('ready', 'ready_context', 'created', 'hits', 'misses', 'retiring', 'closed'):
+            assert field in standby
+        assert standby['created'] >= standby['ready'] + standby['ready_context']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])